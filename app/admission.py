@@ -0,0 +1,81 @@
+import math
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import ReportRun
+from .rules import RulePlan, load_plan
+
+
+SAMPLE_BYTES = 64 * 1024
+
+
+def estimate_rows(size: int, head: bytes) -> int:
+    """Estimate the data rows of a CSV of `size` bytes from its first bytes."""
+    lines = head.split(b'\n')
+    if len(head) >= size:
+        return sum(1 for line in lines[1:] if line.strip())
+    # Drop the header and the last, probably truncated, line.
+    sample = lines[1:-1]
+    if not sample:
+        return 1
+    row_bytes = sum(len(line) + 1 for line in sample) / len(sample)
+    return max(int((size - len(lines[0]) - 1) / row_bytes), 1)
+
+
+def estimate_upload_rows(file_obj) -> int:
+    file_obj.seek(0)
+    head = file_obj.read(SAMPLE_BYTES)
+    file_obj.seek(0)
+    return estimate_rows(file_obj.size, head)
+
+
+def rule_count(plan: RulePlan) -> int:
+    return max(len(plan.steps) + len(plan.filters) + len(plan.aggregates), 1)
+
+
+def rules_path_count(rules_path: str) -> int:
+    try:
+        return rule_count(load_plan(rules_path))
+    except (OSError, ValueError):
+        # A missing or broken rules file fails in the task; count it as one rule here.
+        return 1
+
+
+def route(input_bytes: int, cost: int) -> Dict:
+    """
+    Pick the queue and priority for a report task. Large inputs and costly
+    rule sets go to their own queue, so they cannot hold up small reports;
+    within the small queue, cheaper reports get a higher priority (0 first).
+    """
+    if input_bytes >= settings.REPORT_LARGE_INPUT_BYTES or cost >= settings.REPORT_LARGE_COST:
+        return {"queue": settings.REPORT_LARGE_QUEUE, "priority": 9}
+    return {"queue": settings.REPORT_SMALL_QUEUE, "priority": min(int(9 * cost / settings.REPORT_LARGE_COST), 8)}
+
+
+def backlog_cost() -> int:
+    return ReportRun.objects.active().aggregate(total=Sum('estimated_cost'))["total"] or 0
+
+
+def admission_delay(user, cost: int) -> Optional[int]:
+    """
+    Return None if a report of estimated `cost` may be queued for `user`, or
+    the seconds to wait before retrying: when the user already has
+    REPORT_MAX_ACTIVE_PER_USER reports in flight, or when the queued work
+    would exceed REPORT_MAX_BACKLOG_COST.
+    """
+    if user is not None and user.is_authenticated:
+        costs = list(ReportRun.objects.active().filter(user=user).values_list('estimated_cost', flat=True))
+        if len(costs) >= settings.REPORT_MAX_ACTIVE_PER_USER:
+            # Until the cheapest of the user's reports should have finished.
+            return _seconds(min(costs))
+
+    backlog = backlog_cost()
+    if backlog and backlog + cost > settings.REPORT_MAX_BACKLOG_COST:
+        return _seconds(backlog + cost - settings.REPORT_MAX_BACKLOG_COST)
+    return None
+
+
+def _seconds(cost: int) -> int:
+    return min(max(math.ceil(cost / settings.REPORT_COST_PER_SECOND), 1), 3600)
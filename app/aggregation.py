@@ -0,0 +1,116 @@
+import math
+from numbers import Number
+from typing import Dict, Iterable, List, Tuple
+
+
+AGGREGATE_FUNCTIONS = ('sum', 'count', 'min', 'max', 'mean')
+
+
+def group_value(value):
+    # NaN never equals itself, so missing group values are normalised to None.
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _initial(function: str):
+    if function in ('sum', 'mean'):
+        return [0, 0]
+    if function == 'count':
+        return 0
+    return None
+
+
+class GroupAggregator:
+    """
+    Partial group-by aggregates. Each group holds one small state per
+    aggregate (a running sum and count, a count, or the current min/max), so
+    memory grows with the number of groups and not with the number of rows.
+    Partials built over different chunks, processes or shards are combined
+    with `merge`, and `to_state`/`from_state` turn them into plain JSON data.
+    """
+
+    def __init__(self, group_by: List[str], functions: List[str]):
+        self.group_by = list(group_by)
+        self.functions = list(functions)
+        self.groups: Dict[Tuple, List] = {}
+        self.errors = [0] * len(self.functions)
+
+    def _states(self, key: Tuple) -> List:
+        states = self.groups.get(key)
+        if states is None:
+            states = self.groups[key] = [_initial(function) for function in self.functions]
+        return states
+
+    def add(self, key: Tuple, values: Iterable):
+        states = self._states(key)
+        for i, (function, value) in enumerate(zip(self.functions, values)):
+            if _is_missing(value):
+                continue
+            try:
+                if function in ('sum', 'mean'):
+                    if not isinstance(value, Number):
+                        raise TypeError(value)
+                    states[i][0] += value
+                    states[i][1] += 1
+                elif function == 'count':
+                    states[i] += 1
+                elif function == 'min':
+                    states[i] = value if states[i] is None or value < states[i] else states[i]
+                elif function == 'max':
+                    states[i] = value if states[i] is None or value > states[i] else states[i]
+            except TypeError:
+                self.errors[i] += 1
+
+    def merge(self, other: 'GroupAggregator'):
+        for i, count in enumerate(other.errors):
+            self.errors[i] += count
+
+        for key, other_states in other.groups.items():
+            states = self._states(key)
+            for i, (function, value) in enumerate(zip(self.functions, other_states)):
+                if function in ('sum', 'mean'):
+                    states[i][0] += value[0]
+                    states[i][1] += value[1]
+                elif function == 'count':
+                    states[i] += value
+                elif value is None:
+                    continue
+                elif states[i] is None:
+                    states[i] = value
+                elif function == 'min':
+                    states[i] = min(states[i], value)
+                else:
+                    states[i] = max(states[i], value)
+
+    def results(self) -> Iterable[Tuple[Tuple, List]]:
+        for key, states in self.groups.items():
+            values = []
+            for function, state in zip(self.functions, states):
+                if function == 'sum':
+                    values.append(state[0] if state[1] else None)
+                elif function == 'mean':
+                    values.append(state[0] / state[1] if state[1] else None)
+                else:
+                    values.append(state)
+            yield key, values
+
+    def to_state(self) -> Dict:
+        return {
+            "group_by": self.group_by,
+            "functions": self.functions,
+            "errors": self.errors,
+            "groups": [[list(key), states] for key, states in self.groups.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'GroupAggregator':
+        aggregator = cls(state["group_by"], state["functions"])
+        aggregator.errors = list(state["errors"])
+        for key, states in state["groups"]:
+            aggregator.groups[tuple(key)] = states
+        return aggregator
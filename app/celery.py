@@ -8,4 +8,4 @@ app = Celery('natwest')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks() 
 
-app.conf.beat_scheduler = 'django_celery_beat.schedulers:DatabaseScheduler'
+app.conf.beat_scheduler = 'app.scheduling:CoalescingScheduler'
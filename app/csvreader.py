@@ -0,0 +1,168 @@
+"""
+Parallel reader for large CSV inputs: the file is memory-mapped, split into
+byte ranges that end on a row boundary, a pool of threads finds the row ends
+in each range, and the chunks of CHUNK_ROWS rows those give are parsed by the
+same threads (numpy and the pandas C parser release the GIL) and yielded in
+file order, exactly as the serial reader chunks the file. Inputs of at least
+REPORT_PARALLEL_READ_MIN_BYTES are read this way, with REPORT_READ_WORKERS
+threads.
+"""
+import io
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+
+CHUNK_ROWS = 10000
+RANGE_BYTES = 8 * 1024 * 1024
+COUNT_BLOCK_BYTES = 64 * 1024 * 1024
+# Bytes a line that pandas skips as blank may start with.
+BLANK_BYTES = np.frombuffer(b' \t\r\n', dtype=np.uint8)
+
+
+def _count_quotes(mm: mmap.mmap, start: int, end: int) -> int:
+    count = 0
+    for block_start in range(start, end, COUNT_BLOCK_BYTES):
+        count += mm[block_start:min(block_start + COUNT_BLOCK_BYTES, end)].count(b'"')
+    return count
+
+
+def row_end(mm: mmap.mmap, position: int, end: int, in_quotes: bool = False) -> int:
+    """
+    Return the offset just after the first newline at or after `position`
+    that is outside a quoted field, given whether `position` is inside one,
+    or `end` if there is none. Doubled quotes inside a field cancel out, so
+    the parity of the quotes passed tells whether a newline ends a row.
+    """
+    while position < end:
+        newline = mm.find(b'\n', position, end)
+        if newline == -1:
+            return end
+        in_quotes ^= _count_quotes(mm, position, newline) % 2 == 1
+        position = newline + 1
+        if not in_quotes:
+            return position
+    return end
+
+
+def split_ranges(mm: mmap.mmap, start: int, end: int, range_bytes: int = RANGE_BYTES) -> Iterator[Tuple[int, int]]:
+    """Lazily split [start, end) into ranges of about `range_bytes` that each hold whole rows."""
+    in_quotes = False
+    while start < end:
+        target = min(start + range_bytes, end)
+        in_quotes ^= _count_quotes(mm, start, target) % 2 == 1
+        cut = row_end(mm, target, end, in_quotes)
+        # A range always ends outside a quoted field, so the next one starts outside.
+        in_quotes = False
+        yield start, cut
+        start = cut
+
+
+def _row_ends(mm: mmap.mmap, start: int, end: int) -> np.ndarray:
+    """
+    The offsets just after each data row in [start, end), a range that starts
+    and ends outside quoted fields. Newlines inside quoted fields are told
+    apart by the parity of the quotes before them, and blank lines, which
+    pandas skips, are left out.
+    """
+    data = mm[start:end]
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == ord('\n'))
+    quotes = np.flatnonzero(buffer == ord('"'))
+    if len(quotes):
+        newlines = newlines[np.searchsorted(quotes, newlines) % 2 == 0]
+    ends = newlines + 1
+    if len(data) and (not len(ends) or ends[-1] < len(data)):
+        # The last row of the file may have no newline.
+        ends = np.append(ends, len(data))
+    starts = np.concatenate(([0], ends[:-1]))
+    candidates = np.flatnonzero(np.isin(buffer[starts], BLANK_BYTES))
+    blank = [i for i in candidates if not data[starts[i]:ends[i]].strip(b' \t\r\n')]
+    if blank:
+        ends = np.delete(ends, blank)
+    return ends + start
+
+
+def _chunk_ranges(executor: ThreadPoolExecutor, mm: mmap.mmap, ranges, workers: int,
+                  skip_rows: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yield the byte ranges of successive CHUNK_ROWS data rows, after the first
+    `skip_rows`, from the row ends of `ranges`, found by up to `workers` + 1
+    threads at a time. The chunks fall where the serial reader's do.
+    """
+    scans = deque()
+
+    def scan():
+        byte_range = next(ranges, None)
+        if byte_range is not None:
+            scans.append((byte_range, executor.submit(_row_ends, mm, *byte_range)))
+
+    for _ in range(workers + 1):
+        scan()
+    chunk_start, rows, end = None, 0, None
+    while scans:
+        (range_start, end), future = scans.popleft()
+        ends = future.result()
+        scan()
+        if chunk_start is None:
+            chunk_start = range_start
+        if skip_rows and len(ends):
+            skipped = min(skip_rows, len(ends))
+            chunk_start, ends, skip_rows = int(ends[skipped - 1]), ends[skipped:], skip_rows - skipped
+        for cut in ends[CHUNK_ROWS - rows - 1::CHUNK_ROWS].tolist():
+            yield chunk_start, cut
+            chunk_start = cut
+        rows = (rows + len(ends)) % CHUNK_ROWS
+    if rows:
+        yield chunk_start, end
+
+
+def _parse_chunk(mm: mmap.mmap, start: int, end: int, columns: List[str]) -> pd.DataFrame:
+    return pd.read_csv(io.BytesIO(mm[start:end]), header=None, names=columns)
+
+
+def read_csv_parallel(path: str, start: int = 0, workers: Optional[int] = None,
+                      range_bytes: Optional[int] = None, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Yield the data rows of the CSV at `path` in order, optionally from byte
+    offset `start` (the start of a row) and after the first `skip_rows` data
+    rows, in the same chunks of CHUNK_ROWS rows as the serial reader. Each
+    chunk is parsed, and its dtypes inferred, from its own rows only, so the
+    values are those the serial reader gives. At most `workers` (default
+    REPORT_READ_WORKERS) + 1 ranges of `range_bytes` and as many chunks are
+    scanned, parsed or held in memory at any time.
+    """
+    workers = workers or settings.REPORT_READ_WORKERS
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_end = row_end(mm, 0, size)
+        columns = list(pd.read_csv(io.BytesIO(mm[:header_end]), nrows=0).columns)
+        ranges = split_ranges(mm, max(start, header_end), size, range_bytes or RANGE_BYTES)
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='csv-reader')
+        chunks = _chunk_ranges(executor, mm, ranges, workers, skip_rows)
+        pending = deque()
+        try:
+            for _ in range(workers + 1):
+                _submit(executor, pending, mm, chunks, columns)
+            while pending:
+                frame = pending.popleft().result()
+                _submit(executor, pending, mm, chunks, columns)
+                yield frame
+        finally:
+            chunks.close()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _submit(executor: ThreadPoolExecutor, pending: deque, mm: mmap.mmap, chunks, columns: List[str]):
+    byte_range: Optional[Tuple[int, int]] = next(chunks, None)
+    if byte_range is not None:
+        pending.append(executor.submit(_parse_chunk, mm, *byte_range, columns))
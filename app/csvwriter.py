@@ -0,0 +1,114 @@
+"""
+Columnar CSV writer for report output: rule results are stored into
+preallocated per-column buffers, each column is formatted in one pass, and
+rows go through a single buffered file handle kept open for the whole run.
+The bytes written are the same as `pd.DataFrame(rows).to_csv(mode='a')`
+per chunk: each column is formatted as the dtype pandas would infer for it.
+"""
+import csv
+import io
+import math
+import os
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+
+INITIAL_CAPACITY = 10000
+BUFFER_BYTES = 1024 * 1024
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _float(value) -> str:
+    return '' if value != value else repr(float(value))
+
+
+def format_column(values: list) -> Optional[List[str]]:
+    """
+    Format one column of a chunk like pandas: all ints as int64, ints and
+    floats (or None) as float64, all bools as bool, anything else as object
+    with None and NaN left empty. Returns None for values whose pandas
+    formatting is not reproduced here.
+    """
+    kinds = set(map(type, values))
+    if kinds <= {int}:
+        if values and (min(values) < INT64_MIN or max(values) > INT64_MAX):
+            return None
+        return list(map(str, values))
+    if kinds <= {int, float, type(None)}:
+        if int in kinds and any(type(v) is int and not INT64_MIN <= v <= INT64_MAX for v in values):
+            return None
+        return ['' if v is None else _float(v) for v in values]
+    if kinds <= {bool}:
+        return list(map(str, values))
+    if not kinds <= {str, int, float, bool, type(None)}:
+        return None
+    return ['' if v is None or (type(v) is float and math.isnan(v)) else str(v) for v in values]
+
+
+class ColumnarCSVWriter:
+    """
+    Appends chunks of rows to `path`. Callers `reserve` a row, store its
+    values into `columns[i][row]`, and `flush` once per chunk; the file is
+    opened on the first flush and the header written then unless appending.
+    With an `index` (an app.indexing.ReportIndex), each chunk is also added
+    to it with its byte offset in the file.
+    """
+
+    def __init__(self, path: str, header: List[str], write_header: bool = True, index=None):
+        self.path = path
+        self.header = header
+        self.write_header = write_header
+        self.index = index
+        self.offset = 0
+        self.columns = [[None] * INITIAL_CAPACITY for _ in header]
+        self.capacity = INITIAL_CAPACITY
+        self.size = 0
+        self._file = None
+
+    def reserve(self) -> int:
+        if self.size == self.capacity:
+            for column in self.columns:
+                column.extend([None] * self.capacity)
+            self.capacity *= 2
+        self.size += 1
+        return self.size - 1
+
+    def _open(self):
+        self.offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self._file = open(self.path, 'a', newline='', buffering=BUFFER_BYTES)
+        if self.write_header:
+            self._emit(lambda f: csv.writer(f, lineterminator=os.linesep).writerow(self.header), indexed=False)
+
+    def _emit(self, write: Callable, indexed: bool = True):
+        """Write through `write(file)`; with an index, format into a string first to learn the offsets."""
+        if self.index is None:
+            write(self._file)
+            return
+        buffer = io.StringIO()
+        write(buffer)
+        text = buffer.getvalue()
+        self._file.write(text)
+        if indexed:
+            self.index.add(text, self.offset, self._file.encoding)
+        self.offset += len(text.encode(self._file.encoding))
+
+    def flush(self) -> int:
+        """Write the reserved rows and return how many there were."""
+        if self._file is None:
+            self._open()
+        rows = self.size
+        values = [column[:rows] for column in self.columns]
+        formatted = [format_column(column) for column in values]
+        if any(column is None for column in formatted):
+            frame = pd.DataFrame([dict(zip(self.header, row)) for row in zip(*values)], columns=self.header)
+            self._emit(lambda f: frame.to_csv(f, index=False, header=False, lineterminator=os.linesep))
+        else:
+            self._emit(lambda f: csv.writer(f, lineterminator=os.linesep).writerows(zip(*formatted)))
+        self.size = 0
+        return rows
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
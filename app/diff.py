@@ -0,0 +1,210 @@
+"""
+Streaming diff of two report outputs keyed on chosen columns. Both reports
+are hash-partitioned on the key into temporary files; one partition of the
+old report at a time is held in memory and the matching partition of the new
+report is streamed against it. Memory stays around REPORT_DIFF_PARTITION_BYTES
+of CSV whatever the size of the reports: a partition that is still too large,
+from a skewed key, is split again with another hash.
+"""
+import csv
+import json
+import math
+import os
+import shutil
+import tempfile
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional
+
+from django.conf import settings
+
+from .storage import write_atomic
+
+
+MAX_PARTITIONS = 256
+MAX_DEPTH = 4
+PROGRESS_ROWS = 100000
+SUMMARY_SUFFIX = '.summary.json'
+
+ADDED, REMOVED, CHANGED = 'added', 'removed', 'changed'
+
+
+class DiffError(ValueError):
+    pass
+
+
+def read_header(path: str) -> List[str]:
+    with open(path, newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def summary_path(output_path: str) -> str:
+    return output_path + SUMMARY_SUFFIX
+
+
+def read_summary(output_path: str) -> Optional[Dict]:
+    try:
+        with open(summary_path(output_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _partition_count(size: int) -> int:
+    return min(max(math.ceil(size / settings.REPORT_DIFF_PARTITION_BYTES), 1), MAX_PARTITIONS)
+
+
+def _read(path: str) -> Iterator[List[str]]:
+    with open(path, newline='') as f:
+        yield from csv.reader(f)
+
+
+class ReportDiff:
+    """
+    Compares `old_path` with `new_path`, two report outputs, on the values of
+    `key_columns`. Rows are compared on the other columns the two reports
+    share, as the text written in the CSV. `progress` is called with the
+    number of rows read so far, every PROGRESS_ROWS rows.
+    """
+
+    def __init__(self, old_path: str, new_path: str, key_columns: List[str],
+                 progress: Optional[Callable[[int], None]] = None):
+        self.old_path, self.new_path = old_path, new_path
+        self.key_columns = list(key_columns)
+        self.old_header, self.new_header = read_header(old_path), read_header(new_path)
+        if not self.key_columns:
+            raise DiffError("At least one key column is required.")
+        for side, header in (("old", self.old_header), ("new", self.new_header)):
+            missing = [column for column in self.key_columns if column not in header]
+            if missing:
+                raise DiffError(f"Key columns missing from the {side} report: {', '.join(missing)}.")
+        self.value_columns = [
+            column for column in self.new_header if column in self.old_header and column not in self.key_columns
+        ]
+        self.progress = progress
+        self.rows_read = 0
+        self.summary = {
+            "key_columns": self.key_columns,
+            "columns_added": [c for c in self.new_header if c not in self.old_header],
+            "columns_removed": [c for c in self.old_header if c not in self.new_header],
+            "rows_old": 0,
+            "rows_new": 0,
+            ADDED: 0,
+            REMOVED: 0,
+            CHANGED: 0,
+            "unchanged": 0,
+            "column_changes": {column: 0 for column in self.value_columns},
+            "duplicate_keys": {"old": 0, "new": 0},
+        }
+
+    @property
+    def header(self) -> List[str]:
+        return ['change'] + self.key_columns + self.value_columns + [f'{column}_old' for column in self.value_columns]
+
+    def _rows(self, path: str, header: List[str], side: str) -> Iterator[List[str]]:
+        """The key and compared values of each row of a report."""
+        positions = [header.index(column) for column in self.key_columns + self.value_columns]
+        rows = _read(path)
+        next(rows, None)
+        for record in rows:
+            if not record:
+                continue
+            self.summary[f"rows_{side}"] += 1
+            self.rows_read += 1
+            if self.progress is not None and self.rows_read % PROGRESS_ROWS == 0:
+                self.progress(self.rows_read)
+            yield [record[i] if i < len(record) else '' for i in positions]
+
+    def _split(self, rows: Iterator[List[str]], directory: str, prefix: str, count: int, salt: int) -> List[str]:
+        paths = [os.path.join(directory, f'{prefix}{i}.csv') for i in range(count)]
+        files = [open(path, 'w', newline='') for path in paths]
+        try:
+            writers = [csv.writer(f) for f in files]
+            keys = len(self.key_columns)
+            for row in rows:
+                key = '\x1f'.join(row[:keys]).encode()
+                writers[zlib.crc32(key, salt) % count].writerow(row)
+        finally:
+            for f in files:
+                f.close()
+        return paths
+
+    def run(self, output_path: str) -> Dict:
+        """Write the added, removed and changed rows to `output_path` and return the counts."""
+        directory = tempfile.mkdtemp(prefix='.diff-', dir=os.path.dirname(output_path) or None)
+        try:
+            count = _partition_count(os.path.getsize(self.old_path))
+            old_parts = self._split(self._rows(self.old_path, self.old_header, "old"), directory, 'old', count, 0)
+            new_parts = self._split(self._rows(self.new_path, self.new_header, "new"), directory, 'new', count, 0)
+            with open(output_path, 'w', newline='') as f:
+                writer = csv.writer(f, lineterminator=os.linesep)
+                writer.writerow(self.header)
+                for old_part, new_part in zip(old_parts, new_parts):
+                    self._merge(old_part, new_part, writer, 1)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return self.summary
+
+    def _merge(self, old_path: str, new_path: str, writer, depth: int):
+        size = os.path.getsize(old_path)
+        if size > 2 * settings.REPORT_DIFF_PARTITION_BYTES and depth < MAX_DEPTH:
+            directory = os.path.dirname(old_path)
+            count = _partition_count(size)
+            prefix = os.path.basename(old_path)[:-len('.csv')]
+            old_parts = self._split(_read(old_path), directory, f'{prefix}-old', count, depth)
+            new_parts = self._split(_read(new_path), directory, f'{prefix}-new', count, depth)
+            os.remove(old_path)
+            os.remove(new_path)
+            for old_part, new_part in zip(old_parts, new_parts):
+                self._merge(old_part, new_part, writer, depth + 1)
+            return
+
+        keys = len(self.key_columns)
+        blank = [''] * len(self.value_columns)
+        old, old_duplicates = {}, {}
+        for row in _read(old_path):
+            key = tuple(row[:keys])
+            if key in old or key in old_duplicates:
+                self.summary["duplicate_keys"]["old"] += 1
+                old_duplicates.setdefault(key, []).append(row[keys:])
+            else:
+                old[key] = row[keys:]
+
+        seen = set()
+        changes = self.summary["column_changes"]
+        for row in _read(new_path):
+            key = tuple(row[:keys])
+            values = row[keys:]
+            if key in seen:
+                self.summary["duplicate_keys"]["new"] += 1
+            seen.add(key)
+            # Rows sharing a key are paired in the order they appear.
+            before = old.pop(key, None)
+            if before is None and old_duplicates.get(key):
+                before = old_duplicates[key].pop(0)
+            if before is None:
+                self.summary[ADDED] += 1
+                writer.writerow([ADDED, *key, *values, *blank])
+            elif before == values:
+                self.summary["unchanged"] += 1
+            else:
+                self.summary[CHANGED] += 1
+                for column, old_value, new_value in zip(self.value_columns, before, values):
+                    if old_value != new_value:
+                        changes[column] += 1
+                writer.writerow([CHANGED, *key, *values, *before])
+
+        for key, values in old.items():
+            self.summary[REMOVED] += 1
+            writer.writerow([REMOVED, *key, *blank, *values])
+        for key, rows in old_duplicates.items():
+            for values in rows:
+                self.summary[REMOVED] += 1
+                writer.writerow([REMOVED, *key, *blank, *values])
+
+
+def diff_reports(old_path: str, new_path: str, key_columns: List[str], output_path: str,
+                 progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """Diff two report outputs into `output_path` and store the counts in its summary sidecar."""
+    summary = ReportDiff(old_path, new_path, key_columns, progress).run(output_path)
+    write_atomic(summary_path(output_path), json.dumps(summary))
+    return summary
@@ -0,0 +1,237 @@
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .storage import write_atomic
+from .transformation import TransformationEngine, process_batch
+
+
+MANIFEST_SUFFIX = '.manifest.json'
+LOCK_SUFFIX = '.lock'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_fingerprint(path: str, prefix_size: Optional[int] = None) -> Dict:
+    """
+    Size, modification time and SHA-256 of a file, computed in one pass.
+    With `prefix_size`, also the SHA-256 of the first `prefix_size` bytes,
+    used to tell whether the file only grew by appended rows.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    prefix = None
+    read = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if prefix_size is not None and prefix is None and read + len(block) >= prefix_size:
+                split = prefix_size - read
+                digest.update(block[:split])
+                prefix = digest.copy().hexdigest()
+                digest.update(block[split:])
+            else:
+                digest.update(block)
+            read += len(block)
+            if not block:
+                break
+
+    fingerprint = {
+        "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino, "sha256": digest.hexdigest(),
+    }
+    if prefix is not None:
+        fingerprint["prefix_sha256"] = prefix
+    return fingerprint
+
+
+def _fingerprint(path: str, prefix_size: Optional[int] = None, cache: Optional[Dict] = None) -> Dict:
+    # Reports sharing an input are planned together; each file is hashed once for all of them.
+    if cache is None:
+        return file_fingerprint(path, prefix_size)
+    if (path, prefix_size) not in cache:
+        cache[(path, prefix_size)] = file_fingerprint(path, prefix_size)
+    return dict(cache[(path, prefix_size)])
+
+
+def _unchanged(path: str, previous: Optional[Dict], cache: Optional[Dict] = None) -> bool:
+    # Same size and mtime is trusted; otherwise compare the content hash.
+    if not previous:
+        return False
+    stat = os.stat(path)
+    if stat.st_size == previous["size"] and stat.st_mtime_ns == previous["mtime_ns"]:
+        return True
+    return _fingerprint(path, cache=cache)["sha256"] == previous["sha256"]
+
+
+def _ends_with_newline(path: str, size: int) -> bool:
+    if not size:
+        return False
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+
+def load_manifest(output_path: str) -> Optional[Dict]:
+    try:
+        with open(output_path + MANIFEST_SUFFIX, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+@contextmanager
+def report_lock(output_path: str):
+    """
+    Hold an exclusive lock for one scheduled report. Yields False when another
+    run of the same report still holds it, so overlapping ticks don't race.
+    """
+    with open(output_path + LOCK_SUFFIX, 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def plan_update(input_path: str, ref_path: str, rule_path: str, output_path: str,
+                manifest: Optional[Dict], cache: Optional[Dict] = None) -> Dict:
+    """
+    Decide how to bring `output_path` up to date:
+    'skipped' when no input changed, 'appended' when the input only gained
+    rows after the previously processed offset and nothing else changed, or
+    'full' otherwise. Returns {"mode", "start", "input"}.
+
+    Uploads are hard links to shared, read-only blobs (app.storage), so they
+    never grow in place: a new upload replaces the file with another inode
+    and is recomputed in full. Only a private file (a single link) that kept
+    its inode is read as having had rows appended.
+    """
+    full = {"mode": 'full', "start": 0, "input": None}
+    if not manifest or not os.path.exists(output_path):
+        return full
+    if not _unchanged(ref_path, manifest.get("reference"), cache):
+        return full
+    if not _unchanged(rule_path, manifest.get("rules"), cache):
+        return full
+
+    previous = manifest["input"]
+    stat = os.stat(input_path)
+    if stat.st_size == previous["size"] and stat.st_mtime_ns == previous["mtime_ns"]:
+        return {"mode": 'skipped', "start": 0, "input": previous}
+
+    current = _fingerprint(input_path, previous["size"], cache)
+    prefix = current.pop("prefix_sha256", None)
+    if current["sha256"] == previous["sha256"]:
+        return {"mode": 'skipped', "start": 0, "input": current}
+    if (
+        stat.st_nlink == 1
+        and stat.st_ino == previous.get("inode", stat.st_ino)
+        and current["size"] > previous["size"]
+        and prefix == previous["sha256"]
+        and _ends_with_newline(input_path, previous["size"])
+    ):
+        return {"mode": 'appended', "start": previous["size"], "input": current}
+    return dict(full, input=current)
+
+
+def update_report(input_path: str, ref_path: str, rule_path: str, output_path: str,
+                  progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """
+    Regenerate a scheduled report only as far as its inputs changed since the
+    last run, recorded in a `<output>.manifest.json` sidecar. Unchanged inputs
+    reuse the previous output; rows appended to the input are processed on
+    their own and appended to the output (summary reports merge them into the
+    saved partial aggregates); any other change recomputes the full report.
+    """
+    return update_reports(input_path, ref_path, [(rule_path, output_path)], progress)[0]
+
+
+def update_reports(input_path: str, ref_path: str, reports: List[Tuple[str, str]],
+                   progress: Optional[Callable[[int], None]] = None) -> List[Dict]:
+    """
+    update_report for several (rule_path, output_path) reports of the same
+    input and reference. Each report is planned on its own manifest; those
+    needing the input from the same offset are then written in one pass, so
+    the input and reference are read once however many reports share them.
+    """
+    results = [None] * len(reports)
+    cache = {}
+    with ExitStack() as locks:
+        passes = {}
+        for i, (rule_path, output_path) in enumerate(reports):
+            if not locks.enter_context(report_lock(output_path)):
+                results[i] = {"mode": 'locked', "output_path": output_path}
+                continue
+
+            engine = TransformationEngine(rule_path)
+            manifest = load_manifest(output_path)
+            update = plan_update(input_path, ref_path, rule_path, output_path, manifest, cache)
+            if update["mode"] == 'appended' and (
+                (engine.plan.aggregates and not manifest.get("aggregate_state"))
+                # Manifests written before row totals were recorded cannot give the totals of an append.
+                or "rows_written" not in manifest
+            ):
+                update["mode"], update["start"] = 'full', 0
+
+            if update["mode"] == 'skipped':
+                # Only the input's mtime may have moved; remember it so the next check stays cheap.
+                if update["input"] != manifest["input"]:
+                    write_atomic(output_path + MANIFEST_SUFFIX, json.dumps(dict(manifest, input=update["input"])))
+                results[i] = {
+                    "mode": 'skipped', "output_path": output_path,
+                    "rows_read": manifest.get("rows_read"), "rows_written": manifest.get("rows_written"),
+                }
+                continue
+            passes.setdefault(update["start"], []).append((i, engine, manifest, update))
+
+        for start, planned in passes.items():
+            _update_pass(input_path, ref_path, reports, start, planned, results, progress, cache)
+    return results
+
+
+def _update_pass(input_path: str, ref_path: str, reports: List[Tuple[str, str]], start: int, planned: List,
+                 results: List, progress: Optional[Callable[[int], None]], cache: Dict):
+    """Write the reports of `planned` from input offset `start` in one pass and record their manifests."""
+    outputs = [(engine, reports[i][1]) for i, engine, _, _ in planned]
+    states = [manifest.get("aggregate_state") if update["mode"] == 'appended' else None
+              for _, _, manifest, update in planned]
+    sizes = [os.path.getsize(output_path) if update["mode"] == 'appended' else None
+             for (_, output_path), (_, _, _, update) in zip(outputs, planned)]
+    try:
+        written = process_batch(input_path, ref_path, outputs, start, states, progress)
+    except Exception:
+        # Drop the partial tails so the next run can append from the recorded offsets again.
+        for (engine, output_path), size in zip(outputs, sizes):
+            if size is not None and not engine.plan.aggregates:
+                with open(output_path, 'r+b') as f:
+                    f.truncate(size)
+        raise
+
+    for (i, engine, previous, update), output in zip(planned, written):
+        rule_path, output_path = reports[i]
+        # An append only read and wrote the new rows; the run's totals include the earlier ones.
+        previous = previous if update["mode"] == 'appended' else {}
+        manifest = {
+            "input": update["input"] or _fingerprint(input_path, cache=cache),
+            "reference": _fingerprint(ref_path, cache=cache),
+            "rules": _fingerprint(rule_path, cache=cache),
+            "aggregate_state": output.aggregate_state(),
+            "rows_read": previous.get("rows_read", 0) + output.rows_read,
+            # Summary reports are rewritten whole, so their row count is not a sum.
+            "rows_written": output.rows_written if engine.plan.aggregates else (
+                previous.get("rows_written", 0) + output.rows_written
+            ),
+        }
+        write_atomic(output_path + MANIFEST_SUFFIX, json.dumps(manifest))
+        results[i] = {
+            "mode": update["mode"],
+            "output_path": output_path,
+            "rows_read": manifest["rows_read"],
+            "rows_written": manifest["rows_written"],
+        }
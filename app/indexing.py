@@ -0,0 +1,178 @@
+"""
+Row indexes of report outputs. A report requested with `index_columns`
+gets a SQLite sidecar holding, for each output row, its byte offset in the
+CSV and the text of the indexed columns. Queries find the matching offsets
+through the SQLite indexes and read only those rows from the CSV, so a few
+rows of a large report are served without scanning it.
+"""
+import csv
+import io
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+INDEX_SUFFIX = '.index.sqlite'
+
+
+class IndexQueryError(ValueError):
+    pass
+
+
+class _Lines:
+    """The lines of `text`, counting the bytes handed out so far."""
+
+    def __init__(self, text: str, encoding: str):
+        self.lines = io.StringIO(text, newline='')
+        self.encoding = None if text.isascii() else encoding
+        self.consumed = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = next(self.lines)
+        self.consumed += len(line.encode(self.encoding)) if self.encoding else len(line)
+        return line
+
+
+def records(text: str, encoding: str = 'utf-8') -> Iterator[Tuple[int, List[str]]]:
+    """Yield the byte offset within `text` and the fields of each CSV record."""
+    lines = _Lines(text, encoding)
+    position = 0
+    for record in csv.reader(lines):
+        yield position, record
+        position = lines.consumed
+
+
+def index_path(output_path: str) -> str:
+    return output_path + INDEX_SUFFIX
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    # The index is rebuilt with its report, so it does not need to survive a power loss.
+    connection.execute('PRAGMA synchronous=OFF')
+    return connection
+
+
+class ReportIndex:
+    """
+    The index of one report output, filled chunk by chunk as the rows are
+    written. Appending to an output keeps the rows already indexed, after
+    dropping any past `initial_size`, the length of the output being appended to.
+    """
+
+    def __init__(self, output_path: str, header: List[str], columns: List[str], initial_size: int = 0):
+        self.path = index_path(output_path)
+        self.positions = [header.index(column) for column in columns]
+        if not initial_size and os.path.exists(self.path):
+            os.remove(self.path)
+        self.connection = _connect(self.path)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [
+                ('header', json.dumps(header)), ('columns', json.dumps(columns)), ('complete', '0'),
+            ])
+            self.connection.execute('CREATE TABLE IF NOT EXISTS rows (offset INTEGER PRIMARY KEY, {})'.format(
+                ', '.join(f'c{i}' for i in range(len(columns)))
+            ))
+            self.connection.execute('DELETE FROM rows WHERE offset >= ?', (initial_size,))
+
+    def add(self, text: str, offset: int, encoding: str = 'utf-8', skip_header: bool = False):
+        """Index the rows of `text`, written at byte `offset` of the output."""
+        rows = records(text, encoding)
+        if skip_header:
+            next(rows, None)
+        placeholders = ', '.join('?' * (len(self.positions) + 1))
+        with self.connection:
+            self.connection.executemany(f'INSERT INTO rows VALUES ({placeholders})', (
+                (offset + position, *(record[i] for i in self.positions)) for position, record in rows
+            ))
+
+    def finish(self):
+        if self.connection is None:
+            self.connection = _connect(self.path)
+        with self.connection:
+            for i in range(len(self.positions)):
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS rows_c{i} ON rows (c{i}, offset)')
+            self.connection.execute("UPDATE meta SET value = '1' WHERE key = 'complete'")
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def index_file(output_path: str, header: List[str], columns: List[str]):
+    """Index an output written in one go, such as a summary report."""
+    index = ReportIndex(output_path, header, columns)
+    with open(output_path, newline='') as f:
+        index.add(f.read(), 0, f.encoding, skip_header=True)
+    index.finish()
+
+
+def indexed_columns(output_path: str) -> Optional[List[str]]:
+    """The columns a finished index covers, or None if the output has no finished index."""
+    if not os.path.exists(index_path(output_path)):
+        return None
+    connection = sqlite3.connect(f'file:{index_path(output_path)}?mode=ro', uri=True)
+    try:
+        meta = dict(connection.execute('SELECT key, value FROM meta'))
+    except sqlite3.Error:
+        return None
+    finally:
+        connection.close()
+    if meta.get('complete') != '1':
+        return None
+    return json.loads(meta['columns'])
+
+
+def query_report(output_path: str, filters: Dict[str, List[str]], fields: Optional[List[str]] = None,
+                 after: int = -1, limit: int = 100) -> Dict:
+    """
+    Return up to `limit` rows of the output whose indexed columns equal one
+    of the values given for them in `filters`, projected on `fields`, after
+    the row at byte offset `after`. `next` is the cursor of the following
+    page, or None on the last one.
+    """
+    connection = sqlite3.connect(f'file:{index_path(output_path)}?mode=ro', uri=True)
+    try:
+        meta = dict(connection.execute('SELECT key, value FROM meta'))
+        header, columns = json.loads(meta['header']), json.loads(meta['columns'])
+        unknown = [name for name in filters if name not in columns]
+        if unknown:
+            raise IndexQueryError(f"Columns not indexed: {', '.join(unknown)}. Indexed: {', '.join(columns)}.")
+        fields = fields or header
+        unknown = [name for name in fields if name not in header]
+        if unknown:
+            raise IndexQueryError(f"Unknown fields: {', '.join(unknown)}.")
+
+        where, params = ['offset > ?'], [after]
+        for name, values in filters.items():
+            where.append(f"c{columns.index(name)} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        offsets = [offset for offset, in connection.execute(
+            f"SELECT offset FROM rows WHERE {' AND '.join(where)} ORDER BY offset LIMIT ?", (*params, limit + 1)
+        )]
+    finally:
+        connection.close()
+
+    more = len(offsets) > limit
+    offsets = offsets[:limit]
+    positions = [header.index(name) for name in fields]
+    rows = []
+    with open(output_path, newline='') as f:
+        for offset in offsets:
+            # A seek cookie of a stateless decoder is the byte offset.
+            f.seek(offset)
+            record = next(csv.reader(f))
+            rows.append({name: record[i] for name, i in zip(fields, positions)})
+    return {"fields": fields, "rows": rows, "next": offsets[-1] if more else None}
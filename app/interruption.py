@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+from typing import Dict, Iterable, Optional, Set
+
+from celery.result import AsyncResult
+from django.conf import settings
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+
+from . import notifications
+from .diff import summary_path
+from .indexing import index_path
+from .models import ReportRun
+from .runs import run_event
+from .storage import write_atomic
+from .transformation import ReportInterrupted
+
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+
+
+def cancel_run(run: ReportRun) -> bool:
+    """
+    Cancel a pending or running report. A queued run is marked cancelled at
+    once and its task revoked; a running one is flagged and stops after its
+    current chunk. Returns False if the run has already finished.
+    """
+    runs = ReportRun.objects.filter(pk=run.pk)
+    cancelled = runs.filter(status=ReportRun.STATUS_PENDING).update(
+        status=ReportRun.STATUS_CANCELLED, interrupt=ReportRun.INTERRUPT_CANCEL, completed_at=timezone.now()
+    )
+    if cancelled:
+        _revoke(run.task_id)
+    elif not runs.filter(status=ReportRun.STATUS_RUNNING).update(interrupt=ReportRun.INTERRUPT_CANCEL):
+        return False
+
+    run.refresh_from_db()
+    notifications.publish(run.task_id, run_event(run))
+    return True
+
+
+def _revoke(task_id: str):
+    try:
+        AsyncResult(task_id).revoke()
+    except OperationalError as e:
+        # The task checks its run before it starts, so it is still skipped.
+        logger.warning("Could not revoke report task %s: %s", task_id, e)
+
+
+def preempt_for(queue: str, priority: int) -> Optional[ReportRun]:
+    """
+    Make room for a new task of `priority` (0 first) in `queue`. When all of
+    the queue's REPORT_QUEUE_CONCURRENCY workers are busy, the resumable run
+    with the lowest priority, at least REPORT_PREEMPT_PRIORITY_GAP levels
+    below the new task, is flagged: it checkpoints after its current chunk
+    and goes back to the queue behind the new task.
+    """
+    running = ReportRun.objects.active().filter(queue=queue, status=ReportRun.STATUS_RUNNING)
+    # Reports of a batch share one task and one input.
+    busy = running.exclude(interrupt=ReportRun.INTERRUPT_PREEMPT).order_by().values('input_path').distinct().count()
+    if busy < settings.REPORT_QUEUE_CONCURRENCY.get(queue, 1):
+        return None
+
+    victim = running.filter(
+        resumable=True, interrupt=None, priority__gte=priority + settings.REPORT_PREEMPT_PRIORITY_GAP
+    ).order_by('-priority', '-started_at').first()
+    if victim is None:
+        return None
+    flagged = ReportRun.objects.filter(pk=victim.pk, status=ReportRun.STATUS_RUNNING, interrupt=None).update(
+        interrupt=ReportRun.INTERRUPT_PREEMPT
+    )
+    return victim if flagged else None
+
+
+def check_interrupt(output_path: str, resumable: bool = False):
+    """
+    Raise ReportInterrupted if the run writing `output_path` was cancelled,
+    or preempted and `resumable`. Called by report tasks between chunks.
+    """
+    reason = ReportRun.objects.filter(output_path=output_path).exclude(interrupt=None).values_list(
+        'interrupt', flat=True
+    ).first()
+    if reason == ReportRun.INTERRUPT_CANCEL:
+        raise ReportInterrupted(reason)
+    if reason == ReportRun.INTERRUPT_PREEMPT and resumable:
+        raise ReportInterrupted(reason, resumable=True)
+
+
+def cancelled_outputs(output_paths: Iterable[str]) -> Set[str]:
+    return set(ReportRun.objects.filter(
+        output_path__in=list(output_paths), interrupt=ReportRun.INTERRUPT_CANCEL
+    ).values_list('output_path', flat=True))
+
+
+def load_checkpoint(output_path: str) -> Dict:
+    try:
+        with open(output_path + CHECKPOINT_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoint(output_path: str, rows_read: int, rows_written: int, aggregate_state: Optional[Dict]):
+    """Record how far the partial output at `output_path` got, so a requeued task resumes from there."""
+    write_atomic(output_path + CHECKPOINT_SUFFIX, json.dumps({
+        "rows_read": rows_read,
+        "rows_written": rows_written,
+        "aggregate_state": aggregate_state,
+    }))
+
+
+def discard_checkpoint(output_path: str):
+    if os.path.exists(output_path + CHECKPOINT_SUFFIX):
+        os.remove(output_path + CHECKPOINT_SUFFIX)
+
+
+def discard_output(output_path: str):
+    """Remove the partial output, index, summary and checkpoint of a cancelled report."""
+    for path in (output_path, index_path(output_path), summary_path(output_path)):
+        if os.path.exists(path):
+            os.remove(path)
+    discard_checkpoint(output_path)
@@ -1,12 +1,65 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 import uuid
 
+
+class ReportRunQuerySet(models.QuerySet):
+    def active(self):
+        # Runs still pending or running after REPORT_RUN_TIMEOUT lost their worker.
+        since = timezone.now() - timedelta(seconds=settings.REPORT_RUN_TIMEOUT)
+        return self.filter(status__in=ReportRun.ACTIVE_STATUSES, created_at__gte=since)
+
+
 class ReportRun(models.Model):
+    STATUS_SCHEDULED = "Scheduled"
+    STATUS_PENDING = "Pending"
+    STATUS_RUNNING = "Running"
+    STATUS_COMPLETED = "Completed"
+    STATUS_FAILED = "Failed"
+    STATUS_EVICTED = "Evicted"
+    STATUS_CANCELLED = "Cancelled"
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    INTERRUPT_CANCEL = "cancel"
+    INTERRUPT_PREEMPT = "preempt"
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     report_name = models.CharField(max_length=255)
-    task_id = models.CharField(max_length=255)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    task_id = models.CharField(max_length=255, db_index=True)
     output_path = models.CharField(max_length=255, null=True, blank=True)
-    status = models.CharField(max_length=50, default="Scheduled") 
+    status = models.CharField(max_length=50, default="Scheduled")
+    error = models.TextField(null=True, blank=True)
+    input_path = models.CharField(max_length=255, null=True, blank=True)
+    reference_path = models.CharField(max_length=255, null=True, blank=True)
+    rules_path = models.CharField(max_length=255, null=True, blank=True)
+    input_sha256 = models.CharField(max_length=64, null=True, blank=True)
+    reference_sha256 = models.CharField(max_length=64, null=True, blank=True)
+    input_bytes = models.BigIntegerField(default=0)
+    reference_bytes = models.BigIntegerField(default=0)
+    output_bytes = models.BigIntegerField(default=0)
+    rows_read = models.BigIntegerField(default=0)
+    rows_written = models.BigIntegerField(default=0)
+    estimated_rows = models.BigIntegerField(default=0)
+    estimated_cost = models.BigIntegerField(default=0)
+    queue = models.CharField(max_length=50, null=True, blank=True)
+    priority = models.PositiveSmallIntegerField(default=0)
+    resumable = models.BooleanField(default=False)
+    interrupt = models.CharField(max_length=20, null=True, blank=True)
+    index_columns = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    last_accessed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ReportRunQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', '-created_at'])]
 
     def __str__(self):
         return self.report_name
@@ -0,0 +1,134 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+import redis
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'report-events:'
+RETRY_SECONDS = 30
+
+
+class EventHub:
+    """
+    Process-local fan-out of run events to the requests waiting on them.
+    A waiter registers a queue for one task id before it reads the run's
+    current state, so no event published in between is lost.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = defaultdict(set)
+
+    @contextmanager
+    def listen(self, task_id: str):
+        events = queue.Queue()
+        with self._lock:
+            self._listeners[task_id].add(events)
+        try:
+            yield events
+        finally:
+            with self._lock:
+                self._listeners[task_id].discard(events)
+                if not self._listeners[task_id]:
+                    del self._listeners[task_id]
+
+    def dispatch(self, task_id: str, event: Dict):
+        with self._lock:
+            listeners = list(self._listeners.get(task_id, ()))
+        for events in listeners:
+            events.put(event)
+
+
+class MemoryEventBackend:
+    """Events published and received in the same process (tests, eager mode, single-process stacks)."""
+
+    def __init__(self, hub: EventHub):
+        self.hub = hub
+
+    def publish(self, task_id: str, event: Dict):
+        self.hub.dispatch(task_id, event)
+
+    def start(self):
+        pass
+
+
+class RedisEventBackend:
+    """
+    Events published on Redis pub/sub by the workers. Each web process holds a
+    single pattern subscription and feeds the local hub from a daemon thread,
+    however many requests are waiting. Publishing is best effort: if Redis is
+    unreachable, events are dropped for RETRY_SECONDS and waiters fall back to
+    their timeout.
+    """
+
+    def __init__(self, hub: EventHub, url: str):
+        self.hub = hub
+        self.url = url
+        self.client = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=5)
+        self._down_until = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, task_id: str, event: Dict):
+        if time.monotonic() < self._down_until:
+            return
+        try:
+            self.client.publish(CHANNEL_PREFIX + task_id, json.dumps(event))
+        except redis.RedisError as e:
+            logger.warning("Could not publish report event for %s: %s", task_id, e)
+            self._down_until = time.monotonic() + RETRY_SECONDS
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='report-events', daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(self.url, socket_connect_timeout=1).pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                for message in pubsub.listen():
+                    task_id = message['channel'].decode()[len(CHANNEL_PREFIX):]
+                    self.hub.dispatch(task_id, json.loads(message['data']))
+            except redis.RedisError as e:
+                logger.warning("Report event subscription lost: %s", e)
+                time.sleep(1)
+
+
+hub = EventHub()
+_backends = {}
+
+
+def get_backend():
+    url = settings.REPORT_EVENTS_URL
+    if url not in _backends:
+        if url.startswith('memory://'):
+            _backends[url] = MemoryEventBackend(hub)
+        else:
+            _backends[url] = RedisEventBackend(hub, url)
+    return _backends[url]
+
+
+def publish(task_id: str, event: Dict):
+    get_backend().publish(task_id, event)
+
+
+@contextmanager
+def listen(task_id: str):
+    """Yield a queue receiving the events published for `task_id` from now on."""
+    get_backend().start()
+    with hub.listen(task_id) as events:
+        yield events
@@ -0,0 +1,282 @@
+"""
+Compact in-memory reference tables. Instead of one dict per reference row,
+string columns are dictionary-encoded (pandas categoricals), numeric columns
+are downcast where no value changes, and refkey1/refkey2 are fixed-width
+bytes that map to row positions through a sorted integer array, so a large
+reference costs a few bytes per field.
+Rows are joined to a whole chunk at once and come out as the same dicts of
+Python values the dict-backed reference produces.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, union_categoricals
+
+
+CHUNK_ROWS = 100000
+
+KEYS = ('refkey1', 'refkey2')
+
+
+def _column_dtypes(ref_path: str) -> Optional[Dict[str, str]]:
+    """
+    Return the dtype a single pandas read would infer for each column,
+    from a chunked pass over the file: 'category' for text columns, or None
+    if a column holds values that would not survive dictionary encoding
+    (booleans with missing values, mixed objects).
+    """
+    kinds = {}
+    for chunk in pd.read_csv(ref_path, chunksize=CHUNK_ROWS):
+        for name in chunk.columns:
+            column = chunk[name]
+            if column.dtype == object:
+                if infer_dtype(column, skipna=True) not in ('string', 'empty'):
+                    return None
+                kind = 'object'
+            else:
+                kind = column.dtype.name
+            kinds.setdefault(name, set()).add(kind)
+
+    dtypes = {}
+    for name, seen in kinds.items():
+        if 'object' in seen:
+            # pandas keeps the text of a column that does not parse as one type.
+            if seen - {'object', 'int64', 'float64'}:
+                return None
+            dtypes[name] = 'category'
+        elif seen <= {'int64'}:
+            dtypes[name] = 'int64'
+        elif seen <= {'int64', 'float64'}:
+            dtypes[name] = 'float64'
+        elif seen == {'bool'}:
+            dtypes[name] = 'bool'
+        else:
+            return None
+    return dtypes
+
+
+def _encode(column: pd.Categorical) -> Optional[np.ndarray]:
+    """
+    The UTF-8 bytes of a text key column, b'' where a key is missing; None if
+    a key ends in NUL, which fixed-width bytes would drop.
+    """
+    if any(key.endswith('\x00') for key in column.categories):
+        return None
+    encoded = np.array([key.encode() for key in column.categories] + [b''])
+    # Code -1 picks the trailing b''.
+    return encoded.take(column.codes)
+
+
+def _downcast(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind in 'iu':
+        return pd.to_numeric(values, downcast='integer')
+    if values.dtype == np.float64:
+        narrow = values.astype(np.float32)
+        same = (narrow.astype(np.float64) == values) | (np.isnan(narrow) & np.isnan(values))
+        if same.all():
+            return narrow
+    return values
+
+
+class KeyIndex:
+    """
+    The row positions of a key column's values. Text keys are held as
+    fixed-width UTF-8 bytes and found by binary search through `order`, the
+    row positions in key order; numeric keys go through a pandas index.
+    """
+
+    def __init__(self, column: np.ndarray):
+        self.index = self.keys = None
+        if column.dtype.kind == 'S':
+            self.keys = column
+            # An empty field is read as NaN, so b'' only stands for a missing key.
+            self.missing = column == b''
+            self.order = np.argsort(column, kind='stable')
+            if len(column) < 2 ** 31:
+                self.order = self.order.astype(np.int32)
+            ordered = column[self.order][self.missing.sum():]
+            if (ordered[1:] == ordered[:-1]).any() or self.missing.sum() > 1:
+                raise ValueError("DataFrame index must be unique for orient='index'.")
+        else:
+            self.index = pd.Index(column)
+            if not self.index.is_unique:
+                raise ValueError("DataFrame index must be unique for orient='index'.")
+
+    @property
+    def nbytes(self) -> int:
+        if self.keys is None:
+            return self.index.memory_usage(deep=True)
+        return self.keys.nbytes + self.order.nbytes + self.missing.nbytes
+
+    def rows(self, values: pd.Series) -> np.ndarray:
+        """The row of each value, or -1; a missing value never matches, as a NaN dict key does not."""
+        if self.keys is None:
+            found = self.index.get_indexer(values)
+            found[values.isna().to_numpy()] = -1
+            return found
+        found = np.full(len(values), -1, dtype=np.int64)
+        # Only text matches text keys; an empty field is read as NaN, never as ''.
+        text = [isinstance(value, str) and value != '' for value in values]
+        if not len(self.keys) or not any(text):
+            return found
+        wanted = np.flatnonzero(text)
+        encoded = np.array([value.encode() for value in values.to_numpy()[wanted]])
+        at = np.searchsorted(self.keys, encoded, sorter=self.order)
+        rows = self.order[np.minimum(at, len(self.keys) - 1)]
+        hit = self.keys[rows] == encoded
+        found[wanted[hit]] = rows[hit]
+        return found
+
+    def take(self, rows: np.ndarray) -> list:
+        if self.keys is None:
+            return self.index.take(rows).tolist()
+        values = np.char.decode(self.keys.take(rows), 'utf-8').astype(object)
+        values[self.missing.take(rows)] = np.nan
+        return values.tolist()
+
+
+class CompactReference:
+    """
+    A reference table held column-wise, with refkey1 and refkey2 indexed by
+    KeyIndex. Changes applied on top of the loaded rows are kept aside:
+    `deleted` masks replaced and deleted rows, and `overlay` maps each key
+    to the row an upsert gave it.
+    """
+
+    def __init__(self, columns: Dict):
+        self.names = list(columns)
+        self.length = len(columns[KEYS[0]])
+        self.keys = {key: KeyIndex(columns[key]) for key in KEYS}
+        self.columns = {name: column for name, column in columns.items() if name not in KEYS}
+        self.deleted = None
+        self.overlay = {key: {} for key in KEYS}
+
+    @classmethod
+    def load(cls, ref_path: str) -> Optional['CompactReference']:
+        """Read a reference file in chunks; None if it cannot be held in compact form."""
+        dtypes = _column_dtypes(ref_path)
+        if dtypes is None or any(key not in dtypes for key in KEYS):
+            return None
+        parts = {name: [] for name in dtypes}
+        for chunk in pd.read_csv(ref_path, chunksize=CHUNK_ROWS, dtype=dtypes):
+            for name in dtypes:
+                values = chunk[name].values
+                if name in KEYS and dtypes[name] == 'category':
+                    values = _encode(values)
+                    if values is None:
+                        return None
+                elif dtypes[name] != 'category':
+                    values = _downcast(values)
+                parts[name].append(values)
+
+        columns = {}
+        for name, dtype in dtypes.items():
+            if name in KEYS and dtype == 'category':
+                columns[name] = np.concatenate(parts[name]) if parts[name] else np.array([], dtype='S1')
+            elif dtype == 'category':
+                columns[name] = union_categoricals(parts[name]) if parts[name] else pd.Categorical([])
+            elif parts[name]:
+                columns[name] = _downcast(np.concatenate(parts[name]).astype(dtype))
+            else:
+                columns[name] = np.array([], dtype=dtype)
+        return cls(columns)
+
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values()) + sum(
+            index.nbytes for index in self.keys.values()
+        )
+
+    def kinds(self) -> Dict[str, str]:
+        """The dtype kind of each column, as a dict-backed load would read it."""
+        kinds = {}
+        for name in self.names:
+            column = self.keys[name].keys if name in self.keys else self.columns[name]
+            if name in self.keys and column is None:
+                column = self.keys[name].index
+            kinds[name] = 'O' if column.dtype.kind == 'S' or isinstance(column, pd.Categorical) else column.dtype.kind
+        return kinds
+
+    def apply(self, changes: Iterable[Tuple[str, Dict]]):
+        """
+        Apply delta rows, as app.refstore.apply_to_dicts does to the dicts:
+        an upsert replaces every row with its refkey1 or its refkey2 and a
+        delete removes them. Loaded rows are looked up once per delta row.
+        """
+        changes = list(changes)
+        if not changes:
+            return
+        found = {
+            key: self.keys[key].rows(pd.Series([row.get(key) for _, row in changes], dtype=object))
+            for key in KEYS
+        }
+        if self.deleted is None:
+            self.deleted = np.zeros(self.length, dtype=bool)
+        for position, (operation, row) in enumerate(changes):
+            for key, other in (('refkey1', 'refkey2'), ('refkey2', 'refkey1')):
+                value = row.get(key)
+                if pd.isna(value):
+                    continue
+                if found[key][position] >= 0:
+                    self.deleted[found[key][position]] = True
+                old = self.overlay[key].pop(value, None)
+                if old is not None and not pd.isna(old[other]):
+                    self.overlay[other].pop(old[other], None)
+            if operation == 'upsert':
+                row = {name: row.get(name) for name in self.names}
+                for key in KEYS:
+                    if not pd.isna(row[key]):
+                        self.overlay[key][row[key]] = row
+
+    def _rows(self, key: str, chunk: pd.DataFrame) -> np.ndarray:
+        if key not in chunk.columns:
+            return np.full(len(chunk), -1)
+        rows = self.keys[key].rows(chunk[key])
+        if self.deleted is not None:
+            rows[self.deleted[np.maximum(rows, 0)] & (rows >= 0)] = -1
+        return rows
+
+    def _take(self, name: str, rows: np.ndarray) -> list:
+        if name in self.keys:
+            return self.keys[name].take(rows)
+        column = self.columns[name]
+        if isinstance(column, pd.Categorical):
+            codes = column.codes.take(rows)
+            values = np.asarray(column.categories, dtype=object).take(codes)
+            values[codes < 0] = np.nan
+            return values.tolist()
+        return column.take(rows).tolist()
+
+    def _fields(self, key: str, rows: np.ndarray) -> List[Optional[list]]:
+        """The fields of the matched rows, excluding `key`, as lists of (name, value) pairs."""
+        matched = rows >= 0
+        if not matched.any():
+            return [None] * len(rows)
+        names = [name for name in self.names if name != key]
+        safe = np.where(matched, rows, 0)
+        values = [self._take(name, safe) for name in names]
+        return [
+            list(zip(names, row)) if found else None
+            for found, row in zip(matched.tolist(), zip(*values) if values else [()] * len(rows))
+        ]
+
+    def join(self, chunk: pd.DataFrame) -> List[Dict]:
+        """The reference fields of each chunk row, matched on refkey1 then refkey2."""
+        fields1 = self._fields('refkey1', self._rows('refkey1', chunk))
+        fields2 = self._fields('refkey2', self._rows('refkey2', chunk))
+        for key, fields in (('refkey1', fields1), ('refkey2', fields2)):
+            overlay = self.overlay[key]
+            if overlay and key in chunk.columns:
+                for position, value in enumerate(chunk[key].tolist()):
+                    row = overlay.get(value)
+                    if row is not None:
+                        fields[position] = [(name, field) for name, field in row.items() if name != key]
+        ref_rows = []
+        for ref1_data, ref2_data in zip(fields1, fields2):
+            ref_row = {}
+            if ref1_data:
+                ref_row.update(ref1_data)
+            if ref2_data:
+                ref_row.update(ref2_data)
+            ref_rows.append(ref_row)
+        return ref_rows
@@ -0,0 +1,346 @@
+"""
+Versioned reference data. A named reference is uploaded once as a base file
+and then changed by deltas: CSV files of upserts and deletes keyed on
+refkey1 and refkey2. A version is a manifest naming its base and the deltas
+applied on top of it, so applying a delta stores the delta and writes one
+small manifest, whatever the size of the base. Reports pin a version by its
+manifest path; loaders read the base as before and overlay the deltas.
+Long delta chains are compacted into a new base in the background, under
+the same version id: a version's manifest never changes once written, and a
+compacted base is recorded beside it.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from .reference import KEYS
+from .storage import BlobStore, write_atomic
+
+
+VERSION_FORMAT = 1
+VERSION_SUFFIX = '.ref.json'
+COMPACTED_SUFFIX = '.compact.json'
+HEAD_POINTER = 'HEAD'
+LOCK_FILE = '.lock'
+OPERATION_COLUMN = 'op'
+OPERATIONS = ('upsert', 'delete')
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+VERSION_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class DeltaError(ValueError):
+    pass
+
+
+def _present(key) -> bool:
+    # pandas reads an empty key field as NaN.
+    return not pd.isna(key)
+
+
+def _coerce(value, kind: str):
+    """Type a delta value like the base column it updates, as far as no value changes."""
+    if kind == 'f' and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if kind in 'iu' and isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def load_manifest(path: str) -> Dict:
+    """A version's manifest, with the base and deltas replaced by its compacted base if it has one."""
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    try:
+        with open(path[:-len(VERSION_SUFFIX)] + COMPACTED_SUFFIX, 'r') as f:
+            manifest.update(json.load(f), deltas=[], delta_bytes=0)
+    except FileNotFoundError:
+        pass
+    return manifest
+
+
+class ReferenceVersion:
+    """A stored version: the base file and the delta files to apply to it, in order."""
+
+    def __init__(self, path: str):
+        self.manifest = load_manifest(path)
+        # Manifests live at <root>/<name>/versions/<version>.ref.json.
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(path))))
+        blobs = BlobStore(os.path.join(root, 'blobs'))
+        self.version = self.manifest["version"]
+        self.base_path = blobs.path(self.manifest["base"])
+        self.delta_paths = [blobs.path(digest) for digest in self.manifest["deltas"]]
+
+    def changes(self, kinds: Dict[str, str]) -> Iterator[Tuple[str, Dict]]:
+        """
+        Yield (operation, row) for each row of the deltas, in order, with the
+        values typed by `kinds`, the dtype kind of each base column.
+        """
+        # Text columns stay text, as in the base, even where a delta's values look numeric.
+        text = {name: str for name, kind in kinds.items() if kind == 'O'}
+        for path in self.delta_paths:
+            for record in pd.read_csv(path, dtype=text).to_dict('records'):
+                operation = record.pop(OPERATION_COLUMN)
+                yield operation, {name: _coerce(value, kinds.get(name, 'O')) for name, value in record.items()}
+
+
+def open_version(path: str) -> Optional[ReferenceVersion]:
+    """The stored version at `path`, or None for a plain reference file."""
+    return ReferenceVersion(path) if path.endswith(VERSION_SUFFIX) else None
+
+
+def apply_to_dicts(changes: Iterable[Tuple[str, Dict]], ref_dict1: Dict, ref_dict2: Dict):
+    """
+    Apply delta rows to the refkey1 and refkey2 indexes of a loaded
+    reference. An upsert replaces every row that has its refkey1 or its
+    refkey2; a delete removes them. Deleting a key that is not there does
+    nothing.
+    """
+    for operation, row in changes:
+        for key, index, other, other_index in (('refkey1', ref_dict1, 'refkey2', ref_dict2),
+                                               ('refkey2', ref_dict2, 'refkey1', ref_dict1)):
+            if not _present(row.get(key)):
+                continue
+            old = index.pop(row[key], None)
+            if old is not None and _present(old.get(other)):
+                other_index.pop(old[other], None)
+        if operation == 'upsert':
+            for key, index in (('refkey1', ref_dict1), ('refkey2', ref_dict2)):
+                if _present(row.get(key)):
+                    index[row[key]] = {name: value for name, value in row.items() if name != key}
+
+
+def read_delta(delta_file, columns: List[str]) -> Dict:
+    """
+    Check a delta against the columns of the reference it applies to and
+    return its counts of upserts and deletes. Raises DeltaError.
+    """
+    try:
+        delta = pd.read_csv(delta_file)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise DeltaError(f"Unreadable delta: {e}")
+    if OPERATION_COLUMN not in delta.columns:
+        raise DeltaError(f"A delta needs an '{OPERATION_COLUMN}' column.")
+    data_columns = [column for column in delta.columns if column != OPERATION_COLUMN]
+    if sorted(data_columns) != sorted(columns):
+        raise DeltaError(f"A delta must have the reference columns: {', '.join(columns)}.")
+
+    if delta.empty:
+        raise DeltaError("A delta needs at least one row.")
+    operations = delta[OPERATION_COLUMN]
+    unknown = sorted(set(operations.dropna().astype(str)) - set(OPERATIONS))
+    if unknown or operations.isna().any():
+        raise DeltaError(f"Unsupported operations {unknown or ['']}; use {' or '.join(OPERATIONS)}.")
+    unkeyed = delta[list(KEYS)].isna().all(axis=1)
+    if unkeyed.any():
+        raise DeltaError(f"Delta row {int(unkeyed.to_numpy().argmax()) + 1} has neither refkey1 nor refkey2.")
+    upserts = int((operations == 'upsert').sum())
+    return {"rows": len(delta), "upserts": upserts, "deletes": len(delta) - upserts}
+
+
+class ReferenceStore:
+    """
+    Named references under `root`: `<name>/versions/<version>.ref.json`
+    manifests and a `<name>/HEAD` pointer to the latest version, moved under
+    the `<name>/.lock` file lock, with the
+    base and delta files kept once by content in a BlobStore under
+    `root/blobs`. A base version is named by the SHA-256 of its file, and
+    each later version by the SHA-256 of its parent and its delta, so
+    uploading the same file or applying the same delta twice is a no-op.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.blobs = BlobStore(os.path.join(root, 'blobs'))
+
+    def version_path(self, name: str, version: str) -> str:
+        return os.path.join(self.root, name, 'versions', f"{version}{VERSION_SUFFIX}")
+
+    def exists(self, name: str, version: str) -> bool:
+        return (bool(NAME_PATTERN.match(name)) and bool(VERSION_PATTERN.match(version))
+                and os.path.exists(self.version_path(name, version)))
+
+    def head(self, name: str) -> Optional[str]:
+        if not NAME_PATTERN.match(name):
+            return None
+        try:
+            with open(os.path.join(self.root, name, HEAD_POINTER), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def manifest(self, name: str, version: str) -> Dict:
+        return load_manifest(self.version_path(name, version))
+
+    @contextmanager
+    def _lock(self, name: str):
+        """Hold the lock of `name`, so that reading and moving its head is one step across processes."""
+        directory = os.path.join(self.root, name)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, LOCK_FILE), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _save(self, name: str, manifest: Dict, move_head: bool = True):
+        path = self.version_path(name, manifest["version"])
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, json.dumps(manifest, indent=2))
+        if move_head:
+            write_atomic(os.path.join(self.root, name, HEAD_POINTER), manifest["version"])
+
+    def create(self, name: str, chunks: Iterable[bytes]) -> Dict:
+        """Store a full reference file as the base version of `name` and make it the head."""
+        if not NAME_PATTERN.match(name):
+            raise DeltaError("Reference names may only use letters, digits, '-' and '_'.")
+        digest, size = self.blobs.put(chunks)
+        try:
+            columns = list(pd.read_csv(self.blobs.path(digest), nrows=0).columns)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise DeltaError(f"Unreadable reference: {e}")
+        if any(key not in columns for key in KEYS) or OPERATION_COLUMN in columns:
+            raise DeltaError(f"A reference needs refkey1 and refkey2 columns and no '{OPERATION_COLUMN}' column.")
+
+        manifest = {
+            "format": VERSION_FORMAT,
+            "name": name,
+            "version": digest,
+            "parent": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "columns": columns,
+            "base": digest,
+            "deltas": [],
+            "base_bytes": size,
+            "delta_bytes": 0,
+        }
+        with self._lock(name):
+            self._save(name, manifest)
+        return manifest
+
+    def apply_delta(self, name: str, delta_file, parent: Optional[str] = None) -> Dict:
+        """
+        Store `delta_file` (an uploaded or django File) as a new version on top
+        of `parent`, the head by default. Only the delta is read, so this takes
+        time in proportion to its size. The head moves to the new version when
+        it was built on the head. Raises KeyError for an unknown parent.
+        """
+        if not NAME_PATTERN.match(name):
+            raise KeyError(parent)
+        # The head is read and moved under the lock, so a concurrent delta on
+        # the same head cannot be dropped from the lineage: it is applied on
+        # top of this one instead, or, given an explicit parent, left beside it.
+        with self._lock(name):
+            head = self.head(name)
+            parent = parent or head
+            if not parent or not self.exists(name, parent):
+                raise KeyError(parent)
+            manifest = self._new_version(name, parent, delta_file)
+            self._save(name, manifest, move_head=parent == head)
+        return manifest
+
+    def _new_version(self, name: str, parent: str, delta_file) -> Dict:
+        parent_manifest = self.manifest(name, parent)
+        counts = read_delta(delta_file, parent_manifest["columns"])
+        delta_file.seek(0)
+        digest, size = self.blobs.put(delta_file.chunks())
+
+        manifest = dict(
+            parent_manifest,
+            version=hashlib.sha256(f"{parent}:{digest}".encode()).hexdigest(),
+            parent=parent,
+            created_at=datetime.now(timezone.utc).isoformat(),
+            deltas=parent_manifest["deltas"] + [digest],
+            delta_bytes=parent_manifest["delta_bytes"] + size,
+            upserts=counts["upserts"],
+            deletes=counts["deletes"],
+        )
+        manifest.pop("compacted_at", None)
+        return manifest
+
+    def needs_compaction(self, manifest: Dict, max_deltas: int, max_ratio: float) -> bool:
+        deltas = len(manifest["deltas"])
+        return deltas >= max_deltas or (deltas > 0 and manifest["delta_bytes"] >= max_ratio * manifest["base_bytes"])
+
+    def compact(self, name: str, version: str) -> Dict:
+        """
+        Write the rows of `version` as a new base, recorded beside its
+        manifest, which then loads without deltas. The version id, its
+        manifest and its rows stay the same, so reports pinned to it are
+        unaffected; earlier base and delta files are kept for the versions
+        that still name them. A version whose rows would read back with other
+        column types (say, an int column given a blank) keeps its deltas.
+        """
+        path = self.version_path(name, version)
+        stored = ReferenceVersion(path)
+        if not stored.delta_paths:
+            return stored.manifest
+
+        ref_df = pd.read_csv(stored.base_path)
+        kinds = {column: dtype.kind for column, dtype in ref_df.dtypes.items()}
+        ref_dict1 = ref_df.set_index('refkey1').to_dict(orient='index')
+        ref_dict2 = ref_df.set_index('refkey2').to_dict(orient='index')
+        del ref_df
+        apply_to_dicts(stored.changes(kinds), ref_dict1, ref_dict2)
+
+        rows = [{'refkey1': key, **fields} for key, fields in ref_dict1.items() if _present(key)]
+        rows.extend(
+            {'refkey2': key, **fields} for key, fields in ref_dict2.items()
+            if _present(key) and not _present(fields.get('refkey1'))
+        )
+        columns = stored.manifest["columns"]
+        with tempfile.NamedTemporaryFile(dir=self.root, suffix='.csv.tmp', delete=False) as f:
+            tmp_path = f.name
+        try:
+            pd.DataFrame(rows, columns=columns).to_csv(tmp_path, index=False)
+            reread = {column: dtype.kind for column, dtype in pd.read_csv(tmp_path).dtypes.items()}
+            if rows and reread != kinds:
+                return stored.manifest
+            with open(tmp_path, 'rb') as f:
+                digest, size = self.blobs.put(iter(lambda: f.read(BlobStore.BLOCK_SIZE), b''))
+        finally:
+            os.remove(tmp_path)
+
+        compacted = {"base": digest, "base_bytes": size, "compacted_at": datetime.now(timezone.utc).isoformat()}
+        write_atomic(path[:-len(VERSION_SUFFIX)] + COMPACTED_SUFFIX, json.dumps(compacted, indent=2))
+        return self.manifest(name, version)
+
+    def names(self) -> List[Dict]:
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            {"name": entry.name, "head": self.head(entry.name)}
+            for entry in sorted(os.scandir(self.root), key=lambda entry: entry.name)
+            if entry.is_dir() and NAME_PATTERN.match(entry.name) and self.head(entry.name)
+        ]
+
+    def versions(self, name: str) -> List[Dict]:
+        versions_dir = os.path.join(self.root, name, 'versions')
+        if not NAME_PATTERN.match(name) or not os.path.isdir(versions_dir):
+            return []
+        head = self.head(name)
+        versions = []
+        for entry in os.scandir(versions_dir):
+            if not entry.name.endswith(VERSION_SUFFIX):
+                continue
+            manifest = load_manifest(entry.path)
+            versions.append({
+                "version": manifest["version"],
+                "parent": manifest["parent"],
+                "created_at": manifest["created_at"],
+                "deltas": len(manifest["deltas"]),
+                "upserts": manifest.get("upserts", 0),
+                "deletes": manifest.get("deletes", 0),
+                "bytes": manifest["base_bytes"] + manifest["delta_bytes"],
+                "head": manifest["version"] == head,
+            })
+        return sorted(versions, key=lambda v: v["created_at"], reverse=True)
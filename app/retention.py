@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Set
+
+from django.conf import settings
+from django_celery_beat.models import PeriodicTask
+
+from .diff import SUMMARY_SUFFIX
+from .incremental import LOCK_SUFFIX, MANIFEST_SUFFIX
+from .indexing import INDEX_SUFFIX
+from .interruption import CHECKPOINT_SUFFIX
+from .models import ReportRun
+from .rules import PLAN_SUFFIX, RuleSetStore
+from .storage import BlobStore
+
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIXES = (MANIFEST_SUFFIX, LOCK_SUFFIX, CHECKPOINT_SUFFIX, INDEX_SUFFIX, SUMMARY_SUFFIX)
+
+# Eviction order under quota pressure: untracked files first, then inputs of
+# finished runs, then outputs, least recently used first within each kind.
+ORPHAN, INPUT, OUTPUT = 0, 1, 2
+
+
+def _artifact(path: str) -> str:
+    for suffix in SIDECAR_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+class StorageManager:
+    """
+    Keeps MEDIA_ROOT under a byte quota and removes expired artifacts.
+
+    Files are grouped per artifact (an output and its incremental sidecars
+    count as one) and classified through `ReportRun`: outputs expire
+    STORAGE_OUTPUT_TTL seconds after their last download or completion,
+    inputs and references of finished runs after STORAGE_INPUT_TTL, and
+    untracked files after STORAGE_ORPHAN_TTL. While usage is above
+    STORAGE_QUOTA_BYTES further artifacts are evicted in LRU order.
+    Files named by an enabled schedule or a pending or running run, and files younger
+    than STORAGE_GRACE_SECONDS, are never removed. Uploads are hard links
+    into the shared BlobStore, so blobs left without links are collected last.
+    """
+
+    def __init__(self, media_root: Optional[str] = None, rules_root: Optional[str] = None):
+        self.media_root = media_root or settings.MEDIA_ROOT
+        self.rules_root = rules_root or settings.RULES_ROOT
+        self.quota_bytes = settings.STORAGE_QUOTA_BYTES
+        self.output_ttl = settings.STORAGE_OUTPUT_TTL
+        self.input_ttl = settings.STORAGE_INPUT_TTL
+        self.orphan_ttl = settings.STORAGE_ORPHAN_TTL
+        self.rules_ttl = settings.STORAGE_RULES_TTL
+        self.grace_seconds = settings.STORAGE_GRACE_SECONDS
+
+    def protected_paths(self) -> Set[str]:
+        protected = set()
+        for args in PeriodicTask.objects.filter(enabled=True).values_list('args', flat=True):
+            try:
+                values = json.loads(args or '[]')
+            except ValueError:
+                continue
+            for value in values if isinstance(values, list) else []:
+                if isinstance(value, str):
+                    protected.add(value)
+                    # Scheduled report tasks derive their output path from the input path.
+                    if value.endswith('input.csv'):
+                        protected.add(value.replace("input.csv", "output.csv"))
+
+        # Every pending or running run, however old: a run past REPORT_RUN_TIMEOUT may still be reading
+        # its files. Scheduled runs are protected above for as long as their schedule is enabled.
+        unfinished = ReportRun.objects.filter(status__in=ReportRun.ACTIVE_STATUSES)
+        for paths in unfinished.values_list('input_path', 'reference_path', 'output_path', 'rules_path'):
+            protected.update(path for path in paths if path)
+
+        scheduled = ReportRun.objects.filter(input_path__in=protected).exclude(output_path=None)
+        protected.update(scheduled.values_list('output_path', flat=True))
+        return protected
+
+    def _artifacts(self) -> Dict[str, Dict]:
+        artifacts = {}
+        if not os.path.isdir(self.media_root):
+            return artifacts
+        for entry in os.scandir(self.media_root):
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            artifact = artifacts.setdefault(_artifact(entry.path), {"paths": [], "size": 0, "mtime": 0})
+            artifact["paths"].append(entry.path)
+            # A hard link to a shared upload only frees space once it is the blob's last reference.
+            artifact["size"] += stat.st_size if stat.st_nlink <= 2 else 0
+            artifact["mtime"] = max(artifact["mtime"], stat.st_mtime)
+        return artifacts
+
+    def disk_usage(self) -> int:
+        """Bytes used under MEDIA_ROOT, counting hard-linked files once."""
+        seen, used = set(), 0
+        for directory, _, names in os.walk(self.media_root):
+            for name in names:
+                stat = os.lstat(os.path.join(directory, name))
+                if (stat.st_dev, stat.st_ino) not in seen:
+                    seen.add((stat.st_dev, stat.st_ino))
+                    used += stat.st_size
+        return used
+
+    def _classify(self, artifacts: Dict[str, Dict]):
+        # One pass over the runs instead of `__in` lookups, which can exceed the
+        # database's parameter limit on a large MEDIA_ROOT.
+        outputs, inputs = {}, set()
+        runs = ReportRun.objects.values_list(
+            'input_path', 'reference_path', 'output_path', 'last_accessed_at', 'completed_at', 'created_at'
+        )
+        for input_path, reference_path, output_path, *times in runs.iterator():
+            inputs.update((input_path, reference_path))
+            if output_path in artifacts:
+                used = next(t for t in times if t).timestamp()
+                outputs[output_path] = max(outputs.get(output_path, 0), used)
+
+        for path, artifact in artifacts.items():
+            if path in outputs:
+                artifact["kind"], artifact["last_used"], ttl = OUTPUT, outputs[path], self.output_ttl
+            elif path in inputs:
+                artifact["kind"], artifact["last_used"], ttl = INPUT, artifact["mtime"], self.input_ttl
+            else:
+                artifact["kind"], artifact["last_used"], ttl = ORPHAN, artifact["mtime"], self.orphan_ttl
+            artifact["expires"] = artifact["last_used"] + ttl
+
+    def _remove(self, path: str, artifact: Dict) -> int:
+        for file_path in artifact["paths"]:
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+        if artifact["kind"] == OUTPUT:
+            ReportRun.objects.filter(output_path=path).update(status=ReportRun.STATUS_EVICTED, output_bytes=0)
+        return artifact["size"]
+
+    def evict_rules(self, protected: Set[str]) -> int:
+        """Remove stored rule versions that are inactive, unreferenced and older than STORAGE_RULES_TTL."""
+        store = RuleSetStore(self.rules_root)
+        if not os.path.isdir(store.versions_dir):
+            return 0
+        active = store.active_plan_path()
+        cutoff = time.time() - self.rules_ttl
+        removed = 0
+        for entry in os.scandir(store.versions_dir):
+            if not entry.name.endswith(PLAN_SUFFIX) or entry.path in protected or entry.path == active:
+                continue
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+    def evict(self) -> Dict:
+        now = time.time()
+        protected = self.protected_paths()
+        artifacts = self._artifacts()
+        self._classify(artifacts)
+        used = self.disk_usage()
+
+        candidates = [
+            (path, artifact) for path, artifact in artifacts.items()
+            if path not in protected and artifact["mtime"] < now - self.grace_seconds
+        ]
+        candidates.sort(key=lambda item: (item[1]["kind"], item[1]["last_used"]))
+
+        removed = []
+        for path, artifact in candidates:
+            if artifact["expires"] <= now or used > self.quota_bytes:
+                used -= self._remove(path, artifact)
+                removed.append(path)
+
+        BlobStore(os.path.join(self.media_root, 'blobs')).collect(min_age=self.grace_seconds)
+        used = self.disk_usage()
+        if used > self.quota_bytes:
+            logger.warning("MEDIA_ROOT uses %d bytes after eviction, above the %d byte quota.", used, self.quota_bytes)
+
+        return {
+            "removed": removed,
+            "removed_rule_versions": self.evict_rules(protected),
+            "used_bytes": used,
+            "quota_bytes": self.quota_bytes,
+        }
@@ -0,0 +1,474 @@
+import ast
+import copy
+import functools
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import yaml
+
+from .aggregation import AGGREGATE_FUNCTIONS
+from .storage import write_atomic
+
+
+PLAN_FORMAT = 1
+PLAN_SUFFIX = '.plan.json'
+ACTIVE_POINTER = 'ACTIVE'
+ALLOWED_FUNCTIONS = {"max": max, "min": min, "abs": abs, "round": round}
+
+
+class RuleValidationError(ValueError):
+    pass
+
+
+class RuleStep:
+    """
+    One rule of an execution plan: the formula compiled once to a code object.
+    Formulas that do not compile keep their source text so that evaluation
+    reports the syntax error per row, as uncompiled rules always have.
+    A plan that shares sub-expressions between rules compiles `code` from the
+    rewritten formula, which reads the computed names in `uses`, and keeps
+    the formula's own code in `source_code` to fall back on.
+    """
+
+    def __init__(self, output: Optional[str], formula: str, names: List[str], intermediate: bool = False):
+        self.output = output
+        self.formula = formula
+        self.names = names
+        self.columns = [name for name in names if name not in ALLOWED_FUNCTIONS]
+        self.intermediate = intermediate
+        self.temporary = False
+        self.references = frozenset()
+        self.uses = frozenset()
+        try:
+            self.code = compile(formula, '<string>', 'eval')
+        except SyntaxError:
+            self.code = formula
+        self.source_code = self.code
+
+
+class AggregateStep(RuleStep):
+    """
+    An aggregate rule: `function` over the per-row value of `formula`.
+    A count without a formula counts rows.
+    """
+
+    def __init__(self, output: str, function: str, formula: Optional[str], names: List[str]):
+        super().__init__(output, formula or '1', names)
+        self.function = function
+
+
+class RulePlan:
+    """
+    The compiled form of a rule set. `steps` are its formula rules, the last
+    definition of each output, in the order the outputs first appear;
+    `program` is the order they are evaluated in: the order of those
+    definitions in the file, with the sub-expressions they share hoisted into
+    temporary steps. A name in a formula means the output of a rule defined
+    above it, and the input column otherwise, so a rule never reads an output
+    defined below it and outputs that shadow columns do not change what the
+    rules above them read. `outputs` are the columns the rules write, leaving
+    out intermediate ones.
+    """
+
+    def __init__(self, rules: List[Dict], version: Optional[str] = None):
+        self.rules = rules
+        self.version = version
+        self.filters = []
+        self.aggregates = []
+        self.group_by = []
+        steps = []
+        for rule in rules:
+            rule_type = rule.get("type")
+            if rule_type == 'filter':
+                self.filters.append(RuleStep(None, rule["formula"], formula_names(rule["formula"])))
+            elif rule_type == 'aggregate':
+                formula = rule.get("formula")
+                self.aggregates.append(AggregateStep(
+                    rule["output"], rule["function"], formula, formula_names(formula) if formula else [],
+                ))
+                self.group_by = list(rule.get("group_by", []))
+            else:
+                steps.append(RuleStep(
+                    rule["output"], rule["formula"], formula_names(rule["formula"]), rule.get("intermediate", False),
+                ))
+        # A later rule for the same output replaces an earlier one, as its value always has.
+        last = {step.output: step for step in steps}
+        self.steps = list(last.values())
+        positions = {step.output: index for index, step in enumerate(steps)}
+        for step in self.steps:
+            step.references = frozenset(
+                name for name in step.names if name in last and positions[name] < positions[step.output]
+            )
+            step.uses = step.references
+
+        temporaries = _share_subexpressions(self.steps, positions)
+        ordered = sorted(self.steps, key=lambda step: positions[step.output]) + temporaries
+        by_name = {step.output: step for step in ordered}
+        self.program = [by_name[name] for name in dependency_order(
+            {step.output: sorted(step.uses, key=list(by_name).index) for step in ordered}
+        )]
+        self.linear = not temporaries and not any(step.uses for step in self.steps)
+
+        self.outputs = [step.output for step in self.steps if not step.intermediate]
+        aggregate_names = set(self.group_by).union(*(step.names for step in self.aggregates))
+        self.aggregates_use_outputs = bool(aggregate_names & set(last))
+
+    @property
+    def columns(self) -> List[str]:
+        """The columns written to the report."""
+        if self.aggregates:
+            return self.group_by + [step.output for step in self.aggregates]
+        return self.outputs
+
+
+def dependency_order(dependencies: Dict[str, List[str]]) -> List[str]:
+    """
+    Order the names of `dependencies` so that each comes after the names it
+    depends on, otherwise keeping their order. Raises RuleValidationError
+    naming the rules of a cycle.
+    """
+    order, done, active = [], set(), set()
+    for root in dependencies:
+        if root in done:
+            continue
+        stack = [(root, iter(dependencies[root]))]
+        active.add(root)
+        while stack:
+            name, pending = stack[-1]
+            child = next(pending, None)
+            if child is None:
+                stack.pop()
+                active.discard(name)
+                done.add(name)
+                order.append(name)
+            elif child in active:
+                path = [name for name, _ in stack]
+                cycle = path[path.index(child):] + [child]
+                raise RuleValidationError(f"Rules reference each other in a cycle: {' -> '.join(cycle)}.")
+            elif child not in done:
+                active.add(child)
+                stack.append((child, iter(dependencies[child])))
+    return order
+
+
+TEMPORARY_PREFIX = '__shared'
+# Sub-expressions under these nodes bind their own names, so they are never hoisted out of them.
+_SCOPED_NODES = (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def _eager_nodes(node: ast.expr):
+    """Yield `node` and the sub-expressions evaluated whenever it is, skipping conditional branches."""
+    yield node
+    if isinstance(node, _SCOPED_NODES):
+        return
+    if isinstance(node, ast.IfExp):
+        children = [node.test]
+    elif isinstance(node, ast.BoolOp):
+        children = node.values[:1]
+    elif isinstance(node, ast.Compare):
+        children = [node.left, node.comparators[0]]
+    else:
+        children = [child.value if isinstance(child, ast.keyword) else child for child in ast.iter_child_nodes(node)]
+    for child in children:
+        if isinstance(child, ast.expr):
+            yield from _eager_nodes(child)
+
+
+def _shareable(node: ast.expr) -> bool:
+    if isinstance(node, (ast.Name, ast.Constant, ast.Starred, ast.Slice)):
+        return False
+    return not any(isinstance(child, ast.NamedExpr) for child in ast.walk(node))
+
+
+class _Replace(ast.NodeTransformer):
+    def __init__(self, key: str, name: str):
+        self.key = key
+        self.name = name
+
+    def visit(self, node):
+        if isinstance(node, _SCOPED_NODES):
+            return node
+        if isinstance(node, ast.expr) and ast.dump(node) == self.key:
+            return ast.copy_location(ast.Name(id=self.name, ctx=ast.Load()), node)
+        return super().visit(node)
+
+
+def _share_subexpressions(steps: List[RuleStep], positions: Dict[str, int]) -> List[RuleStep]:
+    """
+    Rewrite `steps` so that a sub-expression evaluated by more than one of
+    them is computed once per row: the largest shared one is replaced by the
+    output of the step whose whole formula it is, when every other step that
+    evaluates it comes after that step in the file (`positions`), or else by a
+    temporary step, and the search repeats until no sub-expression is shared.
+    Sub-expressions that read an output name where it means the input column,
+    in its own rule or the rules above it, are not shared, since that name
+    means the rule's output further down.
+    Returns the temporary steps.
+    """
+    trees = {}
+    for step in steps:
+        if isinstance(step.code, str):
+            continue
+        trees[step.output] = ast.parse(step.formula, mode='eval').body
+    # The output names each step reads as input columns.
+    columns = {
+        step.output: {name for name in positions if positions[name] >= positions[step.output]} for step in steps
+    }
+    rewritten, temporaries = set(), []
+    while True:
+        counts, blocked = {}, set()
+        for owner, tree in trees.items():
+            for node in _eager_nodes(tree):
+                if _shareable(node):
+                    key = ast.dump(node)
+                    counts[key] = counts.get(key, 0) + 1
+            for node in ast.walk(tree):
+                if isinstance(node, ast.expr) and any(
+                    isinstance(child, ast.Name) and child.id in columns.get(owner, ()) for child in ast.walk(node)
+                ):
+                    blocked.add(ast.dump(node))
+        shared = [key for key, count in counts.items() if count > 1 and key not in blocked]
+        if not shared:
+            break
+        key = max(shared, key=len)
+        users = [owner for owner, tree in trees.items() if key in ast.dump(tree)]
+        name = next((owner for owner, tree in trees.items()
+                     if not owner.startswith(TEMPORARY_PREFIX) and ast.dump(tree) == key
+                     and all(user == owner or positions.get(user, -1) > positions[owner] for user in users)), None)
+        if name is None:
+            name = f"{TEMPORARY_PREFIX}{len(temporaries)}"
+            temporaries.append(name)
+            trees[name] = copy.deepcopy(next(
+                node for tree in trees.values() for node in _eager_nodes(tree) if ast.dump(node) == key
+            ))
+        for owner, tree in trees.items():
+            if owner != name and key in ast.dump(tree):
+                trees[owner] = _Replace(key, name).visit(tree)
+                rewritten.add(owner)
+
+    computed = {step.output for step in steps}.union(temporaries)
+    for step in steps:
+        if step.output in rewritten:
+            tree = ast.fix_missing_locations(ast.Expression(trees[step.output]))
+            step.code = compile(tree, '<string>', 'eval')
+            step.uses = frozenset(set(formula_names(ast.unparse(tree))) & computed - columns[step.output])
+    temporary_steps = []
+    for name in temporaries:
+        formula = ast.unparse(trees[name])
+        step = RuleStep(name, formula, formula_names(formula))
+        step.temporary = True
+        step.source_code = None
+        step.uses = frozenset(set(step.names) & computed - {name})
+        temporary_steps.append(step)
+    return temporary_steps
+
+
+def parse_rules(content, file_type: str) -> List[Dict]:
+    if file_type == 'json':
+        return json.loads(content)
+    if file_type in ('yaml', 'yml'):
+        return yaml.safe_load(content)
+    raise ValueError("Unsupported rule file format. Use .json or .yaml")
+
+
+def formula_names(formula: str) -> List[str]:
+    try:
+        tree = ast.parse(formula, mode='eval')
+    except SyntaxError:
+        return []
+    return sorted({node.id for node in ast.walk(tree) if isinstance(node, ast.Name)})
+
+
+def _validate_aggregate(rule: Dict, label: str) -> Dict:
+    function = rule.get("function")
+    if function not in AGGREGATE_FUNCTIONS:
+        raise RuleValidationError(
+            f"Rule '{label}' needs a 'function' out of {', '.join(AGGREGATE_FUNCTIONS)}."
+        )
+    group_by = rule.get("group_by", [])
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    if not isinstance(group_by, list) or not all(isinstance(c, str) and c for c in group_by):
+        raise RuleValidationError(f"Rule '{label}' has an invalid 'group_by'; use a list of column names.")
+
+    normalized = {"type": 'aggregate', "output": rule["output"], "function": function, "group_by": group_by}
+    if rule.get("formula") is not None:
+        normalized["formula"] = rule["formula"]
+    elif function != 'count':
+        raise RuleValidationError(f"Rule '{label}' is missing a 'formula'.")
+    return normalized
+
+
+def validate_rules(rules) -> List[Dict]:
+    """
+    Check that `rules` is a list of {"output", "formula"} mappings (or
+    {"type": "filter", "formula"} row predicates, or {"type": "aggregate",
+    "output", "function", "formula", "group_by"} summaries) whose formulas are
+    valid expressions, and return them normalised to exactly those keys.
+    Formulas may read the outputs of the rules above them; rules marked
+    "intermediate" are computed for those below to read but not written to
+    the report.
+    """
+    if not isinstance(rules, list) or not rules:
+        raise RuleValidationError("Rules must be a non-empty list.")
+
+    normalized = []
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise RuleValidationError(f"Rule {index} must be an object with 'output' and 'formula'.")
+        rule_type = rule.get("type", 'formula')
+        output = rule.get("output")
+        formula = rule.get("formula")
+        label = output or f"#{index}"
+        if rule_type not in ('formula', 'filter', 'aggregate'):
+            raise RuleValidationError(f"Rule {label} has an unsupported type '{rule_type}'.")
+        if rule_type != 'filter' and (not isinstance(output, str) or not output):
+            raise RuleValidationError(f"Rule {index} is missing an 'output' name.")
+        if rule_type == 'aggregate':
+            aggregate = _validate_aggregate(rule, label)
+            if formula is None:
+                normalized.append(aggregate)
+                continue
+        if not isinstance(formula, str) or not formula.strip():
+            raise RuleValidationError(f"Rule '{label}' is missing a 'formula'.")
+        if '__' in formula:
+            raise RuleValidationError(f"Rule '{label}' uses a reserved name in '{formula}'.")
+        try:
+            ast.parse(formula, mode='eval')
+        except SyntaxError as e:
+            raise RuleValidationError(f"Rule '{label}' has an invalid formula '{formula}': {e.msg}")
+
+        intermediate = rule.get("intermediate", False)
+        if not isinstance(intermediate, bool) or (intermediate and rule_type != 'formula'):
+            raise RuleValidationError(f"Rule '{label}' has an invalid 'intermediate'; use true on formula rules.")
+
+        if rule_type == 'filter':
+            normalized.append({"type": 'filter', "formula": formula})
+        elif rule_type == 'aggregate':
+            normalized.append(aggregate)
+        elif intermediate:
+            normalized.append({"output": output, "formula": formula, "intermediate": True})
+        else:
+            normalized.append({"output": output, "formula": formula})
+
+    if not any(rule.get("type") != 'filter' and not rule.get("intermediate") for rule in normalized):
+        raise RuleValidationError("Rules must define at least one output.")
+
+    aggregates = [rule for rule in normalized if rule.get("type") == 'aggregate']
+    if aggregates:
+        group_by = aggregates[0]["group_by"]
+        if any(rule["group_by"] != group_by for rule in aggregates):
+            raise RuleValidationError("All aggregate rules in a rule set must use the same 'group_by'.")
+        if len({rule["output"] for rule in aggregates}) != len(aggregates):
+            raise RuleValidationError("Aggregate outputs must be unique.")
+        if set(group_by) & {rule["output"] for rule in aggregates}:
+            raise RuleValidationError("Aggregate outputs must not reuse a 'group_by' column name.")
+    return normalized
+
+
+def rules_version(rules: List[Dict]) -> str:
+    canonical = json.dumps(rules, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def load_rules_file(path: str) -> List[Dict]:
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            return json.load(f)
+    elif path.endswith('.yaml') or path.endswith('.yml'):
+        with open(path, 'r') as f:
+            return yaml.safe_load(f)
+    else:
+        raise ValueError("Unsupported rule file format. Use .json or .yaml")
+
+
+@functools.lru_cache(maxsize=128)
+def _load_stored_plan(path: str) -> RulePlan:
+    # Stored plans are immutable and named by their content hash, so the path is a safe cache key.
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return RulePlan(data["rules"], version=data["version"])
+
+
+def load_plan(path: str) -> RulePlan:
+    """
+    Load an execution plan from a stored version (cached per process) or
+    compile one from a plain .json/.yaml rules file.
+    """
+    if path.endswith(PLAN_SUFFIX):
+        return _load_stored_plan(os.path.abspath(path))
+    return RulePlan(load_rules_file(path))
+
+
+class RuleSetStore:
+    """
+    Immutable rule set versions stored as `versions/<sha256>.plan.json` under
+    `root`, plus an `ACTIVE` pointer file. Both are written to a temporary file
+    and renamed into place, so readers always see a complete plan and switching
+    the active version is a single atomic rename.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+
+    def plan_path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, f"{version}{PLAN_SUFFIX}")
+
+    def exists(self, version: str) -> bool:
+        return os.path.exists(self.plan_path(version))
+
+    def save(self, rules, source_type: str = 'json') -> str:
+        rules = validate_rules(rules)
+        version = rules_version(rules)
+        path = self.plan_path(version)
+        if not os.path.exists(path):
+            os.makedirs(self.versions_dir, exist_ok=True)
+            plan = {
+                "format": PLAN_FORMAT,
+                "version": version,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "source_type": source_type,
+                "rules": rules,
+                "names": [formula_names(rule["formula"]) if "formula" in rule else [] for rule in rules],
+            }
+            write_atomic(path, json.dumps(plan, indent=2))
+        return version
+
+    def activate(self, version: str):
+        if not self.exists(version):
+            raise KeyError(version)
+        write_atomic(os.path.join(self.root, ACTIVE_POINTER), version)
+
+    def active_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, ACTIVE_POINTER), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def active_plan_path(self) -> Optional[str]:
+        version = self.active_version()
+        return self.plan_path(version) if version else None
+
+    def versions(self) -> List[Dict]:
+        if not os.path.isdir(self.versions_dir):
+            return []
+        active = self.active_version()
+        versions = []
+        for name in os.listdir(self.versions_dir):
+            if not name.endswith(PLAN_SUFFIX):
+                continue
+            with open(os.path.join(self.versions_dir, name), 'r') as f:
+                data = json.load(f)
+            versions.append({
+                "version": data["version"],
+                "created_at": data["created_at"],
+                "source_type": data.get("source_type"),
+                "rule_count": len(data["rules"]),
+                "active": data["version"] == active,
+            })
+        return sorted(versions, key=lambda v: v["created_at"], reverse=True)
@@ -0,0 +1,87 @@
+import os
+from typing import Dict, Optional
+
+from django.utils import timezone
+
+from . import notifications
+from .models import ReportRun
+
+
+TERMINAL_STATUSES = (
+    ReportRun.STATUS_COMPLETED, ReportRun.STATUS_FAILED, ReportRun.STATUS_EVICTED, ReportRun.STATUS_CANCELLED,
+)
+
+
+def run_event(run: ReportRun) -> Dict:
+    return {
+        "task_id": run.task_id,
+        "status": run.status,
+        "rows_read": run.rows_read,
+        "rows_written": run.rows_written,
+        "error": run.error,
+    }
+
+
+def _active(output_path: str):
+    return ReportRun.objects.filter(output_path=output_path, status__in=ReportRun.ACTIVE_STATUSES)
+
+
+def _publish(output_path: str):
+    for run in ReportRun.objects.filter(output_path=output_path).exclude(task_id=''):
+        notifications.publish(run.task_id, run_event(run))
+
+
+def record_started(output_path: str):
+    """Mark the runs writing `output_path` as running; scheduled runs keep their status."""
+    ReportRun.objects.filter(output_path=output_path).update(started_at=timezone.now())
+    _active(output_path).update(status=ReportRun.STATUS_RUNNING)
+    _publish(output_path)
+
+
+def record_progress(output_path: str, rows_read: int):
+    ReportRun.objects.filter(output_path=output_path).update(rows_read=rows_read)
+    _publish(output_path)
+
+
+def record_output(output_path: str, rows_read: Optional[int] = None, rows_written: Optional[int] = None):
+    """Mark the runs writing `output_path` as completed and record the output size and row counts."""
+    fields = {
+        "output_bytes": os.path.getsize(output_path) if os.path.exists(output_path) else 0,
+        "completed_at": timezone.now(),
+        "error": None,
+    }
+    if rows_read is not None:
+        fields["rows_read"] = rows_read
+    if rows_written is not None:
+        fields["rows_written"] = rows_written
+    ReportRun.objects.filter(output_path=output_path).update(**fields)
+    _active(output_path).update(status=ReportRun.STATUS_COMPLETED)
+    _publish(output_path)
+
+
+def record_failure(output_path: str, error: Optional[Exception] = None):
+    now = timezone.now()
+    ReportRun.objects.filter(output_path=output_path).update(completed_at=now, error=str(error) if error else None)
+    _active(output_path).update(status=ReportRun.STATUS_FAILED)
+    _publish(output_path)
+
+
+def record_cancelled(output_path: str):
+    _active(output_path).update(status=ReportRun.STATUS_CANCELLED, completed_at=timezone.now(), output_bytes=0)
+    _publish(output_path)
+
+
+def record_preempted(output_path: str, rows_read: int) -> bool:
+    """Return a preempted run to the queue; False if it was cancelled in the meantime."""
+    requeued = ReportRun.objects.filter(
+        output_path=output_path, status=ReportRun.STATUS_RUNNING, interrupt=ReportRun.INTERRUPT_PREEMPT
+    ).update(status=ReportRun.STATUS_PENDING, interrupt=None, rows_read=rows_read)
+    _publish(output_path)
+    return bool(requeued)
+
+
+def record_download(output_path: str) -> Optional[ReportRun]:
+    run = ReportRun.objects.filter(output_path=output_path).first()
+    if run is not None and run.status != ReportRun.STATUS_EVICTED:
+        ReportRun.objects.filter(output_path=output_path).update(last_accessed_at=timezone.now())
+    return run
@@ -0,0 +1,120 @@
+"""
+Beat scheduler that coalesces scheduled reports. Schedules are often set on
+the same cron boundary, and those uploaded with the same input and reference
+files share them on disk (see BlobStore). Instead of one task each, all
+reading the same files and competing for workers, the reports due within
+REPORT_SCHEDULE_COALESCE_SECONDS of each other on the same files are sent as
+one generate_scheduled_batch_task, which writes them in a single pass.
+"""
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django_celery_beat.schedulers import DatabaseScheduler
+
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_TASK = 'app.utils.generate_scheduled_report_task'
+BATCH_TASK = 'app.utils.generate_scheduled_batch_task'
+
+
+def input_fingerprint(input_path: str, ref_path: str) -> Optional[Tuple]:
+    """
+    The identity and version of an input/reference pair: the same for every
+    schedule linked to the same stored files, as long as they are unchanged.
+    """
+    try:
+        stats = [os.stat(input_path), os.stat(ref_path)]
+    except OSError:
+        return None
+    return tuple((stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns) for stat in stats)
+
+
+class PendingBatch:
+    """Scheduled reports on one input/reference pair waiting for the coalescing window to close."""
+
+    def __init__(self, input_path: str, ref_path: str, deadline: float):
+        self.input_path = input_path
+        self.ref_path = ref_path
+        self.deadline = deadline
+        self.entries = []
+
+    def add(self, entry, rule_path: str, output_path: str):
+        self.entries.append((entry, [rule_path, output_path]))
+
+    @property
+    def reports(self) -> List[List[str]]:
+        return [report for _, report in self.entries]
+
+    def options(self) -> Dict:
+        # The batch runs where its heaviest report would, as early as its most urgent one.
+        options = [entry.options for entry, _ in self.entries]
+        queues = {option.get('queue') for option in options}
+        merged = dict(options[0])
+        if len(queues) > 1:
+            merged['queue'] = settings.REPORT_LARGE_QUEUE
+        priorities = [option['priority'] for option in options if option.get('priority') is not None]
+        if priorities:
+            merged['priority'] = min(priorities)
+        return merged
+
+
+class CoalescingScheduler(DatabaseScheduler):
+    def __init__(self, *args, **kwargs):
+        self.pending = {}
+        super().__init__(*args, **kwargs)
+
+    def apply_async(self, entry, producer=None, advance=True, **kwargs):
+        window = settings.REPORT_SCHEDULE_COALESCE_SECONDS
+        args = list(entry.args or [])
+        if entry.task != SCHEDULED_TASK or window <= 0 or len(args) != 3 or entry.kwargs:
+            return super().apply_async(entry, producer, advance, **kwargs)
+        input_path, ref_path, rule_path = args
+        fingerprint = input_fingerprint(input_path, ref_path)
+        if fingerprint is None:
+            # Missing files fail in the task, where the run records the error.
+            return super().apply_async(entry, producer, advance, **kwargs)
+
+        entry = self.reserve(entry) if advance else entry
+        batch = self.pending.get(fingerprint)
+        if batch is None:
+            batch = self.pending[fingerprint] = PendingBatch(input_path, ref_path, time.monotonic() + window)
+        # generate_scheduled_report_task derives the output path from the input path.
+        batch.add(entry, rule_path, input_path.replace("input.csv", "output.csv"))
+        if len(batch.entries) >= settings.BATCH_MAX_REPORTS:
+            del self.pending[fingerprint]
+            self.send_batch(batch, producer)
+        return None
+
+    def tick(self, *args, **kwargs):
+        delay = super().tick(*args, **kwargs)
+        now = time.monotonic()
+        for fingerprint, batch in list(self.pending.items()):
+            if batch.deadline <= now:
+                del self.pending[fingerprint]
+                self.send_batch(batch, self.producer)
+        if self.pending:
+            delay = min(delay, max(min(batch.deadline for batch in self.pending.values()) - now, 0))
+        return delay
+
+    def send_batch(self, batch: PendingBatch, producer=None):
+        try:
+            if len(batch.entries) == 1:
+                entry, _ = batch.entries[0]
+                return super().apply_async(entry, producer, advance=False)
+            logger.info("Scheduler: Sending %d scheduled reports on %s as one batch",
+                        len(batch.entries), batch.input_path)
+            return self.app.tasks[BATCH_TASK].apply_async(
+                (batch.input_path, batch.ref_path, batch.reports), producer=producer, **batch.options()
+            )
+        except Exception as e:
+            logger.error("Could not send scheduled reports %s: %s",
+                         ', '.join(entry.name for entry, _ in batch.entries), e, exc_info=True)
+        finally:
+            if len(batch.entries) > 1:
+                self._tasks_since_sync += len(batch.entries)
+                if self.should_sync():
+                    self._do_sync()
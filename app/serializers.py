@@ -0,0 +1,21 @@
+from rest_framework import serializers
+from .models import ReportRun
+
+
+class ReportRunSerializer(serializers.ModelSerializer):
+    duration_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportRun
+        fields = [
+            'id', 'task_id', 'report_name', 'status', 'error',
+            'rows_read', 'rows_written', 'input_bytes', 'reference_bytes', 'output_bytes',
+            'input_sha256', 'reference_sha256', 'queue', 'estimated_rows', 'estimated_cost',
+            'priority', 'interrupt', 'index_columns',
+            'created_at', 'started_at', 'completed_at', 'last_accessed_at', 'duration_seconds',
+        ]
+
+    def get_duration_seconds(self, run):
+        if run.started_at and run.completed_at:
+            return round((run.completed_at - run.started_at).total_seconds(), 3)
+        return None
@@ -0,0 +1,103 @@
+import errno
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from typing import Iterable, Tuple
+
+
+def write_atomic(path: str, content: str):
+    """
+    Write `content` to a temporary file next to `path` and rename it into
+    place, so readers see either the old file or the complete new one.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class BlobStore:
+    """
+    Content-addressed, deduplicated file store: each distinct upload is kept
+    once as `<root>/<sha256[:2]>/<sha256>` and every report gets a hard link
+    to it under its own name. The blob's link count is its reference count,
+    so removing a report's file releases its reference, and `collect` deletes
+    blobs nobody links to any more. Blobs are read-only because every link
+    shares the same content.
+    """
+
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def refcount(self, digest: str) -> int:
+        return os.stat(self.path(digest)).st_nlink - 1
+
+    def put(self, chunks: Iterable[bytes]) -> Tuple[str, int]:
+        """Store the streamed bytes, hashing them on the way, and return (digest, size)."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = digest.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                # Refresh the mtime so `collect` leaves the blob alone until it is linked.
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return digest, size
+
+    def link(self, digest: str, path: str):
+        """Expose a blob under `path`, copying it where hard links are not supported."""
+        try:
+            os.link(self.path(digest), path)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            shutil.copyfile(self.path(digest), path)
+
+    def collect(self, min_age: float = 0) -> int:
+        """Delete unreferenced blobs older than `min_age` seconds and return the bytes freed."""
+        if not os.path.isdir(self.root):
+            return 0
+        cutoff = time.time() - min_age
+        freed = 0
+        for directory in os.scandir(self.root):
+            if not directory.is_dir(follow_symlinks=False):
+                # Leftovers of interrupted uploads.
+                if directory.name.endswith('.tmp') and directory.stat().st_mtime < cutoff:
+                    os.remove(directory.path)
+                continue
+            for entry in os.scandir(directory.path):
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_nlink == 1 and stat.st_mtime < cutoff:
+                    os.remove(entry.path)
+                    freed += stat.st_size
+        return freed
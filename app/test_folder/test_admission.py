@@ -0,0 +1,48 @@
+from django.test import TestCase, override_settings
+
+from app.admission import admission_delay, estimate_rows, route
+from app.models import ReportRun
+from users.models import CustomUser
+
+
+class EstimateRowsTest(TestCase):
+    def test_whole_file_is_counted(self):
+        content = b"id,value\n1,10\n2,20\n"
+        self.assertEqual(estimate_rows(len(content), content), 2)
+
+    def test_rows_are_extrapolated_from_the_sample(self):
+        content = b"id,value\n" + b"1,10\n" * 1000
+        self.assertEqual(estimate_rows(len(content), content[:100]), 1000)
+
+
+@override_settings(
+    REPORT_LARGE_INPUT_BYTES=1000,
+    REPORT_LARGE_COST=900,
+    REPORT_COST_PER_SECOND=10,
+    REPORT_MAX_BACKLOG_COST=1000,
+    REPORT_MAX_ACTIVE_PER_USER=2,
+)
+class AdmissionTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="queue@example.com", password="testpass123", name="Queue")
+
+    def test_route(self):
+        self.assertEqual(route(10, 0), {"queue": "reports_small", "priority": 0})
+        self.assertEqual(route(10, 500), {"queue": "reports_small", "priority": 5})
+        self.assertEqual(route(10, 900), {"queue": "reports_large", "priority": 9})
+        self.assertEqual(route(1000, 1), {"queue": "reports_large", "priority": 9})
+
+    def test_per_user_limit(self):
+        for cost in (40, 70):
+            ReportRun.objects.create(report_name="r", user=self.user, status=ReportRun.STATUS_PENDING, estimated_cost=cost)
+        self.assertEqual(admission_delay(self.user, 10), 4)
+
+        other = CustomUser.objects.create_user(email="other@example.com", password="testpass123", name="Other")
+        self.assertIsNone(admission_delay(other, 10))
+
+    def test_backlog_limit(self):
+        ReportRun.objects.create(report_name="r", status=ReportRun.STATUS_RUNNING, estimated_cost=800)
+        ReportRun.objects.create(report_name="done", status=ReportRun.STATUS_COMPLETED, estimated_cost=10 ** 6)
+
+        self.assertIsNone(admission_delay(self.user, 200))
+        self.assertEqual(admission_delay(self.user, 450), 25)
@@ -0,0 +1,52 @@
+import json
+
+from django.test import TestCase
+
+from app.aggregation import GroupAggregator, group_value
+
+
+class GroupAggregatorTest(TestCase):
+    def setUp(self):
+        self.functions = ["sum", "count", "min", "max", "mean"]
+
+    def test_add_and_results(self):
+        aggregator = GroupAggregator(["region"], self.functions)
+        for region, value in [("EU", 1.0), ("EU", 3.0), ("US", 5.0), ("EU", None)]:
+            aggregator.add((region,), [value] * 5)
+
+        results = dict(aggregator.results())
+        self.assertEqual(results[("EU",)], [4.0, 2, 1.0, 3.0, 2.0])
+        self.assertEqual(results[("US",)], [5.0, 1, 5.0, 5.0, 5.0])
+
+    def test_merge_of_partials_matches_single_pass(self):
+        rows = [(("k%d" % (i % 3),), [float(i)] * 5) for i in range(30)]
+
+        single = GroupAggregator(["key"], self.functions)
+        for key, values in rows:
+            single.add(key, values)
+
+        merged = GroupAggregator(["key"], self.functions)
+        for start in range(0, 30, 7):
+            partial = GroupAggregator(["key"], self.functions)
+            for key, values in rows[start:start + 7]:
+                partial.add(key, values)
+            merged.merge(partial)
+
+        self.assertEqual(dict(merged.results()), dict(single.results()))
+
+    def test_state_round_trip_for_sharded_execution(self):
+        shard = GroupAggregator(["key"], self.functions)
+        shard.add(("a",), [1, 1, 1, 1, 1])
+        shard.add(("a",), ["x", None, None, None, None])
+
+        restored = GroupAggregator.from_state(json.loads(json.dumps(shard.to_state())))
+        total = GroupAggregator(["key"], self.functions)
+        total.merge(restored)
+        total.merge(restored)
+
+        self.assertEqual(dict(total.results())[("a",)], [2, 2, 1, 1, 1.0])
+        self.assertEqual(total.errors, [2, 0, 0, 0, 0])
+
+    def test_group_value_normalizes_missing_values(self):
+        self.assertIsNone(group_value(float("nan")))
+        self.assertEqual(group_value("EU"), "EU")
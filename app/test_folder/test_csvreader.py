@@ -0,0 +1,104 @@
+import json
+import mmap
+import os
+import tempfile
+from unittest.mock import patch
+
+import pandas as pd
+from django.test import TestCase, override_settings
+
+from app import csvreader
+from app.csvreader import read_csv_parallel, split_ranges
+from app.transformation import TransformationEngine, read_input
+
+
+class ParallelReaderTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "input.csv")
+        rows = ['id,note,value']
+        for i in range(500):
+            note = f'"line {i}\nsays ""hi, there"""' if i % 3 == 0 else f"plain {i}"
+            rows.append(f"{i},{note},{i * 1.5}")
+        with open(self.path, "w") as f:
+            f.write("\n".join(rows) + "\n")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read(self, **kwargs):
+        return pd.concat(list(read_csv_parallel(self.path, **kwargs)), ignore_index=True)
+
+    def test_matches_sequential_reader(self):
+        expected = pd.read_csv(self.path)
+        for range_bytes in (7, 100, 10 ** 6):
+            pd.testing.assert_frame_equal(self.read(workers=3, range_bytes=range_bytes), expected)
+
+    def write_blanks(self):
+        lines = []
+        for i in range(30000):
+            if i in (14000, 25000):
+                lines.append(f"{i},")
+            elif i == 20000:
+                lines.append(f'{i},"7"\n\n ')
+            else:
+                lines.append(f"{i},{i}")
+        with open(self.path, "w") as f:
+            f.write("id,v\n" + "\n".join(lines))
+
+    def test_chunks_and_dtypes_match_the_serial_reader(self):
+        # Blank values widen the dtypes of the chunks they fall in, so chunks must hold the same rows.
+        self.write_blanks()
+        for skip_rows in (0, 12345):
+            serial = list(pd.read_csv(self.path, chunksize=csvreader.CHUNK_ROWS, skiprows=range(1, skip_rows + 1)))
+            for range_bytes in (7, 50000, 10 ** 8):
+                chunks = list(read_csv_parallel(self.path, workers=3, range_bytes=range_bytes, skip_rows=skip_rows))
+                self.assertEqual(len(chunks), len(serial))
+                for chunk, expected in zip(chunks, serial):
+                    pd.testing.assert_frame_equal(chunk.reset_index(drop=True), expected.reset_index(drop=True))
+
+    def test_report_is_the_same_read_in_parallel(self):
+        self.write_blanks()
+        ref_path = os.path.join(self.temp_dir.name, "reference.csv")
+        rules_path = os.path.join(self.temp_dir.name, "rules.json")
+        with open(ref_path, "w") as f:
+            f.write("refkey1,refkey2,refdata1,refdata2,refdata3,refdata4\nR1,R2,X,Y,Z,99")
+        with open(rules_path, "w") as f:
+            json.dump([{"output": "id", "formula": "id"}, {"output": "total", "formula": "v + refdata4"}], f)
+
+        outputs = []
+        for min_bytes in (10 ** 12, 0):
+            output_path = os.path.join(self.temp_dir.name, f"output_{min_bytes}.csv")
+            with override_settings(REPORT_PARALLEL_READ_MIN_BYTES=min_bytes, REPORT_READ_WORKERS=3), \
+                    patch.object(csvreader, "RANGE_BYTES", 50000):
+                TransformationEngine(rules_path).process_dataframe(self.path, ref_path, output_path)
+            with open(output_path, "rb") as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_ranges_end_outside_quoted_fields(self):
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ranges = list(split_ranges(mm, 0, len(mm), 50))
+            for start, end in ranges:
+                self.assertEqual(mm[start:end].count(b'"') % 2, 0)
+                self.assertEqual(mm[end - 1:end], b"\n")
+        self.assertGreater(len(ranges), 10)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.path))
+
+    def test_chunks_are_bounded(self):
+        with patch.object(csvreader, "CHUNK_ROWS", 40):
+            chunks = list(read_csv_parallel(self.path, workers=2, range_bytes=10 ** 6))
+        self.assertEqual([len(chunk) for chunk in chunks], [40] * 12 + [20])
+
+    def test_read_input_uses_parallel_reader_for_large_files(self):
+        with open(self.path, "rb") as f:
+            start = f.read().index(b"\n300,") + 1
+
+        with override_settings(REPORT_PARALLEL_READ_MIN_BYTES=0, REPORT_READ_WORKERS=2), \
+                patch.object(csvreader, "read_csv_parallel", wraps=read_csv_parallel) as parallel:
+            skipped = pd.concat(list(read_input(self.path, skip_rows=450)))
+            appended = pd.concat(list(read_input(self.path, start=start)))
+
+        self.assertEqual(parallel.call_count, 2)
+        self.assertEqual(list(skipped["id"]), list(range(450, 500)))
+        self.assertEqual(list(appended["id"]), list(range(300, 500)))
@@ -0,0 +1,71 @@
+import os
+import random
+import tempfile
+
+import pandas as pd
+from django.test import TestCase
+
+from app.csvwriter import ColumnarCSVWriter, format_column
+
+
+VALUES = [
+    0, 1, -5, 30, 2 ** 62, 2 ** 63, 0.1, 1e16, 1e-5, 30.0, -0.0, float("nan"), float("inf"), None,
+    True, False, "a", "", "x,y", 'q"q', "line\nbreak", " sp ", "3.5",
+]
+
+
+class ColumnarCSVWriterTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.expected_path = os.path.join(self.temp_dir.name, "expected.csv")
+        self.path = os.path.join(self.temp_dir.name, "output.csv")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, columns, chunks):
+        writer = ColumnarCSVWriter(self.path, columns)
+        for rows in chunks:
+            for row in rows:
+                position = writer.reserve()
+                for i, column in enumerate(columns):
+                    writer.columns[i][position] = row[column]
+            writer.flush()
+        writer.close()
+
+    def test_output_matches_pandas_chunk_by_chunk(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            columns = [f"c{i}" for i in range(rng.randint(1, 3))]
+            chunks = []
+            for _ in range(rng.randint(1, 3)):
+                choices = {column: rng.sample(VALUES, rng.randint(1, 3)) for column in columns}
+                chunks.append([
+                    {column: rng.choice(choices[column]) for column in columns} for _ in range(rng.randint(0, 5))
+                ])
+            for path in (self.expected_path, self.path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+            for i, rows in enumerate(chunks):
+                pd.DataFrame(rows, columns=columns).to_csv(self.expected_path, index=False, mode="a", header=i == 0)
+            self.write(columns, chunks)
+
+            with open(self.expected_path, "rb") as expected, open(self.path, "rb") as written:
+                self.assertEqual(written.read(), expected.read(), chunks)
+
+    def test_buffers_grow_and_file_stays_open(self):
+        writer = ColumnarCSVWriter(self.path, ["n"], write_header=False)
+        for chunk in range(2):
+            for i in range(25000):
+                writer.columns[0][writer.reserve()] = i
+            self.assertEqual(writer.flush(), 25000)
+            handle = handle if chunk else writer._file
+            self.assertIs(writer._file, handle)
+        writer.close()
+
+        self.assertEqual(list(pd.read_csv(self.path, header=None)[0]), list(range(25000)) * 2)
+
+    def test_format_column_falls_back_for_unknown_types(self):
+        self.assertEqual(format_column([1, 2.5, None]), ["1.0", "2.5", ""])
+        self.assertIsNone(format_column([[1], "a"]))
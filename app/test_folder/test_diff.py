@@ -0,0 +1,175 @@
+import csv
+import os
+import random
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from app import diff
+from app.diff import DiffError, ReportDiff, diff_reports, read_summary
+from app.models import ReportRun
+from app.utils import diff_reports_task
+from users.models import CustomUser
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+class ReportDiffTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.old_path = os.path.join(self.temp_dir.name, "old_output.csv")
+        self.new_path = os.path.join(self.temp_dir.name, "new_output.csv")
+        self.output_path = os.path.join(self.temp_dir.name, "diff.csv")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_added_removed_and_changed_rows(self):
+        write_csv(self.old_path, ["id", "region", "amount", "note"], [
+            ["1", "EU", "10", "a"], ["2", "EU", "20", "b"], ["3", "US", "30", "c"],
+        ])
+        write_csv(self.new_path, ["region", "id", "amount", "extra"], [
+            ["EU", "1", "10", "x"], ["EU", "2", "25", "y"], ["US", "4", "40", "z"],
+        ])
+        summary = diff_reports(self.old_path, self.new_path, ["id"], self.output_path)
+
+        rows = read_rows(self.output_path)
+        self.assertEqual(rows[0], ["change", "id", "region", "amount", "region_old", "amount_old"])
+        self.assertCountEqual(rows[1:], [
+            ["changed", "2", "EU", "25", "EU", "20"],
+            ["added", "4", "US", "40", "", ""],
+            ["removed", "3", "", "", "US", "30"],
+        ])
+        self.assertEqual(summary, read_summary(self.output_path))
+        self.assertEqual(
+            {key: summary[key] for key in ("rows_old", "rows_new", "added", "removed", "changed", "unchanged")},
+            {"rows_old": 3, "rows_new": 3, "added": 1, "removed": 1, "changed": 1, "unchanged": 1},
+        )
+        self.assertEqual(summary["column_changes"], {"region": 0, "amount": 1})
+        self.assertEqual(summary["columns_added"], ["extra"])
+        self.assertEqual(summary["columns_removed"], ["note"])
+
+    def test_partitioned_diff_matches_in_memory_diff(self):
+        rng = random.Random(0)
+        old = {(f"k{i}", str(i % 7)): [str(rng.randint(0, 3)), "v"] for i in range(3000)}
+        new = {key: list(values) for key, values in old.items() if rng.random() > 0.1}
+        for key in rng.sample(sorted(new), 300):
+            new[key][0] = "9"
+        new.update({(f"n{i}", "0"): ["1", "w"] for i in range(200)})
+        write_csv(self.old_path, ["a", "b", "x", "y"], [[*key, *values] for key, values in old.items()])
+        write_csv(self.new_path, ["a", "b", "x", "y"], [[*key, *values] for key, values in new.items()])
+
+        progress = []
+        # Capping the first split at two partitions leaves them too large, so they are split again.
+        with override_settings(REPORT_DIFF_PARTITION_BYTES=4096), patch.object(diff, "MAX_PARTITIONS", 2), \
+                patch.object(diff, "PROGRESS_ROWS", 1000), \
+                patch.object(ReportDiff, "_merge", autospec=True, side_effect=ReportDiff._merge) as merge:
+            summary = diff_reports(self.old_path, self.new_path, ["a", "b"], self.output_path, progress.append)
+        self.assertTrue(any(call.args[4] > 1 for call in merge.call_args_list))
+        self.assertEqual(progress, [1000 * i for i in range(1, 6)])
+
+        changed = [key for key in new if key in old and new[key] != old[key]]
+        self.assertEqual(summary["added"], 200)
+        self.assertEqual(summary["removed"], len(old) - len(new) + 200)
+        self.assertEqual(summary["changed"], len(changed))
+        self.assertEqual(summary["unchanged"], len(new) - 200 - len(changed))
+        self.assertEqual(summary["column_changes"], {"x": len(changed), "y": 0})
+        self.assertEqual(len(read_rows(self.output_path)) - 1, summary["added"] + summary["removed"] + len(changed))
+        self.assertEqual([name for name in os.listdir(self.temp_dir.name) if name.startswith(".diff-")], [])
+
+    def test_duplicate_keys_are_paired_in_order(self):
+        write_csv(self.old_path, ["id", "amount"], [["1", "10"], ["1", "11"], ["1", "12"]])
+        write_csv(self.new_path, ["id", "amount"], [["1", "10"], ["1", "13"]])
+        summary = diff_reports(self.old_path, self.new_path, ["id"], self.output_path)
+
+        self.assertEqual(summary["duplicate_keys"], {"old": 2, "new": 1})
+        self.assertEqual(read_rows(self.output_path)[1:], [
+            ["changed", "1", "13", "11"], ["removed", "1", "", "12"],
+        ])
+
+    def test_key_columns_must_exist(self):
+        write_csv(self.old_path, ["id", "amount"], [["1", "10"]])
+        write_csv(self.new_path, ["key", "amount"], [["1", "10"]])
+        with self.assertRaises(DiffError):
+            ReportDiff(self.old_path, self.new_path, ["id"])
+        with self.assertRaises(DiffError):
+            ReportDiff(self.old_path, self.new_path, [])
+
+
+class ReportDiffViewTest(APITestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.user = CustomUser.objects.create_user(email="diff@example.com", password="testpass123", name="Diff")
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_run(self, task_id, rows, **kwargs):
+        output_path = os.path.join(self.temp_dir.name, f"{task_id}_output.csv")
+        write_csv(output_path, ["id", "amount"], rows)
+        fields = dict(
+            report_name=task_id, task_id=task_id, status=ReportRun.STATUS_COMPLETED, completed_at=timezone.now(),
+            output_path=output_path, rows_written=len(rows), output_bytes=os.path.getsize(output_path),
+        )
+        fields.update(kwargs)
+        return ReportRun.objects.create(**fields)
+
+    @patch("app.views.diff_reports_task.apply_async")
+    def test_diff_runs_and_is_downloadable(self, mock_task):
+        mock_task.return_value.id = "diff-task"
+        self.make_run("old", [["1", "10"], ["2", "20"]])
+        self.make_run("new", [["1", "15"], ["3", "30"]])
+        with override_settings(MEDIA_ROOT=self.temp_dir.name):
+            response = self.client.post(
+                reverse("report-diff"), {"old": "old", "new": "new", "key_columns": ["id"]}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        task_id = response.data["task_id"]
+        self.assertEqual(task_id, "diff-task")
+        # Run the queued task in-process, as a worker would.
+        diff_reports_task.apply(mock_task.call_args.args[0], task_id=task_id)
+
+        run = ReportRun.objects.get(task_id=task_id)
+        self.assertEqual(run.status, ReportRun.STATUS_COMPLETED)
+        self.assertEqual((run.rows_read, run.rows_written), (4, 3))
+
+        result = self.client.get(reverse("report-diff-result", args=[task_id]))
+        self.assertEqual(result.status_code, status.HTTP_200_OK)
+        summary = result.data["summary"]
+        self.assertEqual((summary["added"], summary["removed"], summary["changed"]), (1, 1, 1))
+
+        download = self.client.get(reverse("download-report", args=[task_id]))
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        lines = b"".join(download.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "change,id,amount,amount_old")
+        self.assertEqual(len(lines), 4)
+
+    def test_invalid_requests(self):
+        self.make_run("old", [["1", "10"]])
+        self.make_run("pending", [], status=ReportRun.STATUS_RUNNING, completed_at=None)
+        url = reverse("report-diff")
+
+        response = self.client.post(url, {"old": "old", "new": "old", "key_columns": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {"old": "old", "new": "missing", "key_columns": "id"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(url, {"old": "old", "new": "pending", "key_columns": "id"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.post(url, {"old": "old", "new": "old", "key_columns": "id,other"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,148 @@
+import json
+import os
+import tempfile
+
+import pandas as pd
+from django.test import TestCase
+
+from app.incremental import MANIFEST_SUFFIX, file_fingerprint, report_lock, update_report
+from app.models import ReportRun
+from app.utils import generate_scheduled_report_task
+
+
+class FileFingerprintTest(TestCase):
+    def test_prefix_hash_matches_hash_of_shorter_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "data.csv")
+            with open(path, "w") as f:
+                f.write("a,b\n1,2\n")
+            before = file_fingerprint(path)
+            with open(path, "a") as f:
+                f.write("3,4\n")
+
+            after = file_fingerprint(path, prefix_size=before["size"])
+            self.assertEqual(after["prefix_sha256"], before["sha256"])
+            self.assertNotEqual(after["sha256"], before["sha256"])
+
+
+class UpdateReportTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.temp_dir.name, "input.csv")
+        self.ref_path = os.path.join(self.temp_dir.name, "reference.csv")
+        self.rules_path = os.path.join(self.temp_dir.name, "rules.json")
+        self.output_path = os.path.join(self.temp_dir.name, "output.csv")
+
+        with open(self.input_path, "w") as f:
+            f.write("field1,field2,refkey1,refkey2\n1,2,A,B\n3,4,A,B\n")
+        with open(self.ref_path, "w") as f:
+            f.write("refkey1,refkey2,refdata1,refdata2,refdata3,refdata4\nA,B,x,y,z,10\n")
+        self.write_rules([{"output": "total", "formula": "field1 + field2"}])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_rules(self, rules):
+        with open(self.rules_path, "w") as f:
+            json.dump(rules, f)
+
+    def append_input(self, rows):
+        with open(self.input_path, "a") as f:
+            f.write(rows)
+
+    def test_unchanged_inputs_skip_the_run(self):
+        self.assertEqual(update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)["mode"], "full")
+        mtime = os.path.getmtime(self.output_path)
+
+        os.utime(self.input_path)
+        result = update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+
+        self.assertEqual(result["mode"], "skipped")
+        self.assertEqual(os.path.getmtime(self.output_path), mtime)
+
+    def test_appended_rows_are_appended_to_output(self):
+        update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+        self.append_input("5,6,A,B\n7,8,A,B\n")
+
+        result = update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+
+        self.assertEqual(result["mode"], "appended")
+        self.assertEqual(pd.read_csv(self.output_path)["total"].tolist(), [3.0, 7.0, 11.0, 15.0])
+        self.assertEqual((result["rows_read"], result["rows_written"]), (4, 4))
+
+    def test_grown_shared_or_replaced_inputs_recompute_in_full(self):
+        update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+        # A hard link, as an upload linked to a shared blob.
+        os.link(self.input_path, os.path.join(self.temp_dir.name, "blob"))
+        self.append_input("5,6,A,B\n")
+        self.assertEqual(update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)["mode"], "full")
+
+        replacement = os.path.join(self.temp_dir.name, "replacement.csv")
+        with open(self.input_path) as f, open(replacement, "w") as out:
+            out.write(f.read() + "7,8,A,B\n")
+        os.replace(replacement, self.input_path)
+        result = update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+
+        self.assertEqual(result["mode"], "full")
+        self.assertEqual(pd.read_csv(self.output_path)["total"].tolist(), [3.0, 7.0, 11.0, 15.0])
+
+    def test_appended_rows_merge_into_aggregates(self):
+        self.write_rules([
+            {"type": "aggregate", "output": "rows", "function": "count", "group_by": ["refkey1"]},
+            {"type": "aggregate", "output": "total", "function": "sum", "formula": "field1", "group_by": ["refkey1"]},
+        ])
+        update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+        self.append_input("5,6,A,B\n")
+
+        result = update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+
+        self.assertEqual(result["mode"], "appended")
+        report = pd.read_csv(self.output_path)
+        self.assertEqual(report.to_dict("records"), [{"refkey1": "A", "rows": 3, "total": 9.0}])
+        self.assertEqual((result["rows_read"], result["rows_written"]), (3, 1))
+
+    def test_other_changes_recompute_in_full(self):
+        update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+        with open(self.input_path, "w") as f:
+            f.write("field1,field2,refkey1,refkey2\n10,20,A,B\n")
+        self.assertEqual(update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)["mode"], "full")
+        self.assertEqual(pd.read_csv(self.output_path)["total"].tolist(), [30.0])
+
+        self.write_rules([{"output": "total", "formula": "field1 * field2"}])
+        self.assertEqual(update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)["mode"], "full")
+        self.assertEqual(pd.read_csv(self.output_path)["total"].tolist(), [200.0])
+
+    def test_overlapping_run_is_skipped(self):
+        with report_lock(self.output_path) as acquired:
+            self.assertTrue(acquired)
+            result = update_report(self.input_path, self.ref_path, self.rules_path, self.output_path)
+        self.assertEqual(result["mode"], "locked")
+        self.assertFalse(os.path.exists(self.output_path + MANIFEST_SUFFIX))
+
+    def test_scheduled_task_returns_output_path(self):
+        input_path = os.path.join(self.temp_dir.name, "abc_input.csv")
+        os.rename(self.input_path, input_path)
+
+        output_path = generate_scheduled_report_task(input_path, self.ref_path, self.rules_path)
+
+        self.assertEqual(output_path, os.path.join(self.temp_dir.name, "abc_output.csv"))
+        self.assertTrue(os.path.exists(output_path + MANIFEST_SUFFIX))
+
+    def test_scheduled_task_records_run_totals(self):
+        input_path = os.path.join(self.temp_dir.name, "abc_input.csv")
+        os.rename(self.input_path, input_path)
+        output_path = os.path.join(self.temp_dir.name, "abc_output.csv")
+        run = ReportRun.objects.create(report_name="r", output_path=output_path)
+
+        generate_scheduled_report_task(input_path, self.ref_path, self.rules_path)
+        with open(input_path, "a") as f:
+            f.write("5,6,A,B\n")
+        generate_scheduled_report_task(input_path, self.ref_path, self.rules_path)
+        run.refresh_from_db()
+        self.assertEqual((run.rows_read, run.rows_written), (3, 3))
+
+        completed_at = run.completed_at
+        with report_lock(output_path):
+            generate_scheduled_report_task(input_path, self.ref_path, self.rules_path)
+        run.refresh_from_db()
+        self.assertEqual((run.completed_at, run.rows_read), (completed_at, 3))
@@ -0,0 +1,185 @@
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from app.indexing import IndexQueryError, index_path, indexed_columns, query_report, records
+from app.models import ReportRun
+from app.transformation import ReportInterrupted, TransformationEngine
+from app.utils import generate_report_task
+from users.models import CustomUser
+
+
+class IndexTestMixin:
+    rows = 25000
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.temp_dir.name, "abc_input.csv")
+        self.ref_path = os.path.join(self.temp_dir.name, "abc_reference.csv")
+        self.rules_path = os.path.join(self.temp_dir.name, "rules.json")
+        self.output_path = os.path.join(self.temp_dir.name, "abc_output.csv")
+        with open(self.input_path, "w") as f:
+            f.write("data1,refkey1,refkey2\n")
+            f.writelines(f"{i},R1,R2\n" for i in range(self.rows))
+        with open(self.ref_path, "w") as f:
+            f.write("refkey1,refkey2,refdata1,refdata2,refdata3,refdata4\nR1,R2,X,Y,Z,99")
+        self.write_rules([
+            {"output": "account", "formula": "'A' + str(data1 % 100)"},
+            {"output": "note", "formula": "'line\\nbreak, ü' if data1 % 3 == 0 else 'plain'"},
+            {"output": "amount", "formula": "data1 * 2"},
+        ])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_rules(self, rules):
+        with open(self.rules_path, "w") as f:
+            json.dump(rules, f)
+
+    def expected(self, account):
+        return [
+            {"note": 'line\nbreak, ü' if i % 3 == 0 else 'plain', "amount": str(i * 2)}
+            for i in range(self.rows) if i % 100 == account
+        ]
+
+
+class ReportIndexTest(IndexTestMixin, TestCase):
+    def test_records_report_byte_offsets(self):
+        text = 'a,b\n"x\ny",ü\n3,4\n'
+        self.assertEqual(list(records(text)), [
+            (0, ["a", "b"]), (4, ["x\ny", "ü"]), (text.encode().index(b"3,4"), ["3", "4"]),
+        ])
+
+    def test_query_filters_projects_and_pages(self):
+        engine = TransformationEngine(self.rules_path)
+        engine.process_dataframe(self.input_path, self.ref_path, self.output_path, index_columns=["account"])
+        self.assertEqual(indexed_columns(self.output_path), ["account"])
+
+        rows, after = [], -1
+        while after is not None:
+            page = query_report(self.output_path, {"account": ["A7"]}, ["note", "amount"], after, limit=40)
+            rows.extend(page["rows"])
+            after = page["next"]
+        self.assertEqual(rows, self.expected(7))
+
+        both = query_report(self.output_path, {"account": ["A1", "A2"]}, limit=1000)
+        self.assertEqual(len(both["rows"]), 2 * self.rows // 100)
+        self.assertEqual(both["fields"], ["account", "note", "amount"])
+        self.assertIsNone(both["next"])
+
+        with self.assertRaises(IndexQueryError):
+            query_report(self.output_path, {"amount": ["2"]})
+        with self.assertRaises(IndexQueryError):
+            query_report(self.output_path, {}, ["missing"])
+
+    def test_resumed_output_keeps_index_consistent(self):
+        engine = TransformationEngine(self.rules_path)
+
+        def progress(rows):
+            if rows >= 20000:
+                raise ReportInterrupted("stop", resumable=True)
+
+        with self.assertRaises(ReportInterrupted):
+            engine.process_dataframe(
+                self.input_path, self.ref_path, self.output_path, progress=progress, index_columns=["account"]
+            )
+        self.assertIsNone(indexed_columns(self.output_path))
+
+        engine.process_dataframe(
+            self.input_path, self.ref_path, self.output_path, skip_rows=20000, index_columns=["account"]
+        )
+        page = query_report(self.output_path, {"account": ["A7"]}, ["note", "amount"], limit=1000)
+        self.assertEqual(page["rows"], self.expected(7))
+
+    def test_summary_reports_are_indexed(self):
+        self.write_rules([
+            {"output": "account", "formula": "'A' + str(data1 % 5)"},
+            {"type": "aggregate", "output": "rows", "function": "count", "group_by": ["account"]},
+        ])
+        engine = TransformationEngine(self.rules_path)
+        engine.process_dataframe(self.input_path, self.ref_path, self.output_path, index_columns=["account"])
+
+        page = query_report(self.output_path, {"account": ["A3"]})
+        self.assertEqual(page["rows"], [{"account": "A3", "rows": str(self.rows // 5)}])
+
+    def test_unindexed_output_has_no_index(self):
+        TransformationEngine(self.rules_path).process_dataframe(self.input_path, self.ref_path, self.output_path)
+        self.assertFalse(os.path.exists(index_path(self.output_path)))
+        self.assertIsNone(indexed_columns(self.output_path))
+
+
+class ReportRowsViewTest(IndexTestMixin, APITestCase):
+    rows = 500
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(email="rows@example.com", password="testpass123", name="Rows")
+        self.client.force_authenticate(user=self.user)
+
+    def make_run(self, **kwargs):
+        fields = dict(
+            report_name="abc", task_id="task-abc", status=ReportRun.STATUS_COMPLETED, completed_at=timezone.now(),
+            output_path=self.output_path, index_columns=["account"],
+        )
+        fields.update(kwargs)
+        return ReportRun.objects.create(**fields)
+
+    def test_rows_are_filtered_and_paginated(self):
+        TransformationEngine(self.rules_path).process_dataframe(
+            self.input_path, self.ref_path, self.output_path, index_columns=["account"]
+        )
+        self.make_run()
+        url = reverse("report-rows", args=["task-abc"])
+
+        response = self.client.get(url, {"account": "A7", "fields": "amount", "limit": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["rows"], [{"amount": "14"}, {"amount": "214"}, {"amount": "414"}])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.data["rows"], [{"amount": "614"}, {"amount": "814"}])
+        self.assertIsNone(response.data["next"])
+
+        response = self.client.get(url, {"account": ["A1", "A2"], "fields": "amount", "limit": 3})
+        self.assertEqual(response.data["rows"], [{"amount": "2"}, {"amount": "4"}, {"amount": "202"}])
+
+        self.assertEqual(self.client.get(url, {"amount": "2"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"limit": "0"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unindexed_and_pending_reports(self):
+        TransformationEngine(self.rules_path).process_dataframe(self.input_path, self.ref_path, self.output_path)
+        self.make_run(index_columns=None)
+        self.make_run(task_id="pending", status=ReportRun.STATUS_PENDING, completed_at=None)
+
+        response = self.client.get(reverse("report-rows", args=["task-abc"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("report-rows", args=["pending"]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    @patch("app.views.generate_report_task.apply_async")
+    def test_generate_report_indexes_requested_columns(self, mock_task):
+        mock_task.return_value.id = "task-indexed"
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, RULES_ROOT=self.temp_dir.name):
+            with open(self.input_path, "rb") as input_file, open(self.ref_path, "rb") as reference_file:
+                response = self.client.post(reverse("generate-report"), data={
+                    "input": input_file, "reference": reference_file, "index_columns": "account",
+                }, format="multipart")
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            # Run the queued task in-process, as a worker would.
+            generate_report_task.apply(*mock_task.call_args.args, task_id="task-indexed")
+
+            rows = self.client.get(reverse("report-rows", args=[response.data["task_id"]]), {"account": "A99"})
+            self.assertEqual(rows.status_code, status.HTTP_200_OK)
+            self.assertEqual([row["amount"] for row in rows.data["rows"]], ["198", "398", "598", "798", "998"])
+
+            with open(self.input_path, "rb") as input_file, open(self.ref_path, "rb") as reference_file:
+                response = self.client.post(reverse("generate-report"), data={
+                    "input": input_file, "reference": reference_file, "index_columns": "account,unknown",
+                }, format="multipart")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,182 @@
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+import pandas as pd
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from app.interruption import CHECKPOINT_SUFFIX, cancel_run, preempt_for
+from app.models import ReportRun
+from app.transformation import ReportInterrupted, TransformationEngine
+from app.utils import generate_batch_report_task, generate_report_task
+from users.models import CustomUser
+
+
+class InterruptionTestMixin:
+    rows = 12000
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.temp_dir.name, "abc_input.csv")
+        self.ref_path = os.path.join(self.temp_dir.name, "abc_reference.csv")
+        self.rules_path = os.path.join(self.temp_dir.name, "rules.json")
+        self.output_path = os.path.join(self.temp_dir.name, "abc_output.csv")
+        with open(self.input_path, "w") as f:
+            f.write("data1,data2,refkey1,refkey2\n")
+            f.writelines(f"{i},{i % 7},R1,R2\n" for i in range(self.rows))
+        with open(self.ref_path, "w") as f:
+            f.write("refkey1,refkey2,refdata1,refdata2,refdata3,refdata4\nR1,R2,X,Y,Z,99")
+        self.write_rules([{"output": "sum", "formula": "data1 + data2"}])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_rules(self, rules):
+        with open(self.rules_path, "w") as f:
+            json.dump(rules, f)
+
+    def make_run(self, **kwargs):
+        fields = dict(
+            report_name="abc", task_id="task-abc", status=ReportRun.STATUS_PENDING, input_path=self.input_path,
+            reference_path=self.ref_path, rules_path=self.rules_path, output_path=self.output_path,
+        )
+        fields.update(kwargs)
+        return ReportRun.objects.create(**fields)
+
+
+class EngineInterruptionTest(InterruptionTestMixin, TestCase):
+    def interrupt(self, resumable):
+        def progress(rows):
+            raise ReportInterrupted("stop", resumable=resumable)
+        return progress
+
+    def test_cancelled_output_is_removed(self):
+        engine = TransformationEngine(self.rules_path)
+        with self.assertRaises(ReportInterrupted):
+            engine.process_dataframe(self.input_path, self.ref_path, self.output_path, progress=self.interrupt(False))
+        self.assertFalse(os.path.exists(self.output_path))
+
+    def test_preempted_output_resumes_after_skipped_rows(self):
+        engine = TransformationEngine(self.rules_path)
+        with self.assertRaises(ReportInterrupted) as interrupted:
+            engine.process_dataframe(self.input_path, self.ref_path, self.output_path, progress=self.interrupt(True))
+        self.assertEqual(interrupted.exception.outputs[0].rows_read, 10000)
+
+        output = engine.process_dataframe(self.input_path, self.ref_path, self.output_path, skip_rows=10000)
+        self.assertEqual(output.rows_read, self.rows - 10000)
+        sums = pd.read_csv(self.output_path)["sum"]
+        self.assertEqual(list(sums), [i + i % 7 for i in range(self.rows)])
+
+
+class ReportTaskInterruptionTest(InterruptionTestMixin, TestCase):
+    def test_cancelled_before_start(self):
+        run = self.make_run(status=ReportRun.STATUS_CANCELLED, interrupt=ReportRun.INTERRUPT_CANCEL)
+
+        self.assertIsNone(generate_report_task(self.input_path, self.ref_path, self.rules_path))
+        self.assertFalse(os.path.exists(self.output_path))
+        run.refresh_from_db()
+        self.assertEqual(run.status, ReportRun.STATUS_CANCELLED)
+
+    def test_cancelled_while_running(self):
+        run = self.make_run()
+        with patch("app.runs.record_progress") as record_progress:
+            record_progress.side_effect = lambda *args: ReportRun.objects.filter(pk=run.pk).update(
+                interrupt=ReportRun.INTERRUPT_CANCEL
+            )
+            generate_report_task(self.input_path, self.ref_path, self.rules_path)
+
+        self.assertEqual(record_progress.call_count, 1)
+        self.assertFalse(os.path.exists(self.output_path))
+        run.refresh_from_db()
+        self.assertEqual(run.status, ReportRun.STATUS_CANCELLED)
+
+    def test_preempted_run_is_requeued_and_resumed(self):
+        self.write_rules([
+            {"type": "aggregate", "output": "total", "function": "sum", "formula": "data1", "group_by": ["refdata1"]},
+        ])
+        run = self.make_run(interrupt=ReportRun.INTERRUPT_PREEMPT, queue="reports_small", priority=7)
+        with patch.object(generate_report_task, "apply_async") as requeue:
+            generate_report_task.apply(args=(self.input_path, self.ref_path, self.rules_path), task_id="task-abc")
+
+        args, kwargs = requeue.call_args.args
+        self.assertEqual(requeue.call_args.kwargs, {"task_id": "task-abc", "queue": "reports_small", "priority": 7})
+        run.refresh_from_db()
+        self.assertEqual(run.status, ReportRun.STATUS_PENDING)
+        self.assertTrue(os.path.exists(self.output_path + CHECKPOINT_SUFFIX))
+
+        generate_report_task.apply(args=args, kwargs=kwargs, task_id="task-abc")
+        run.refresh_from_db()
+        self.assertEqual(run.status, ReportRun.STATUS_COMPLETED)
+        self.assertEqual(run.rows_read, self.rows)
+        self.assertEqual(list(pd.read_csv(self.output_path)["total"]), [sum(range(self.rows))])
+        self.assertFalse(os.path.exists(self.output_path + CHECKPOINT_SUFFIX))
+
+    def test_batch_stops_when_every_report_is_cancelled(self):
+        reports = [["r0", self.rules_path, self.output_path]]
+        self.make_run(task_id="r0", status=ReportRun.STATUS_CANCELLED, interrupt=ReportRun.INTERRUPT_CANCEL)
+
+        with patch.object(generate_batch_report_task, "_backend") as backend:
+            self.assertIsNone(generate_batch_report_task(self.input_path, self.ref_path, reports))
+        backend.mark_as_revoked.assert_called_once_with("r0")
+        self.assertFalse(os.path.exists(self.output_path))
+
+
+@override_settings(REPORT_QUEUE_CONCURRENCY={"reports_small": 1}, REPORT_PREEMPT_PRIORITY_GAP=3)
+class PreemptionTest(InterruptionTestMixin, TestCase):
+    def test_busy_queue_preempts_lowest_priority_resumable_run(self):
+        victim = self.make_run(status=ReportRun.STATUS_RUNNING, queue="reports_small", priority=8, resumable=True)
+
+        self.assertIsNone(preempt_for("reports_small", 6))
+        self.assertEqual(preempt_for("reports_small", 1), victim)
+        victim.refresh_from_db()
+        self.assertEqual(victim.interrupt, ReportRun.INTERRUPT_PREEMPT)
+        # The preempted run's slot is already being freed.
+        self.assertIsNone(preempt_for("reports_small", 0))
+
+    def test_free_queue_and_batches_are_left_alone(self):
+        self.make_run(status=ReportRun.STATUS_RUNNING, queue="reports_small", priority=8)
+
+        self.assertIsNone(preempt_for("reports_large", 0))
+        self.assertIsNone(preempt_for("reports_small", 0))
+
+
+class CancelRunTest(InterruptionTestMixin, TestCase):
+    @patch("app.interruption.AsyncResult")
+    def test_pending_run_is_revoked(self, async_result):
+        run = self.make_run()
+
+        self.assertTrue(cancel_run(run))
+        async_result.assert_called_once_with("task-abc")
+        async_result.return_value.revoke.assert_called_once_with()
+        self.assertEqual(run.status, ReportRun.STATUS_CANCELLED)
+
+    def test_running_run_is_flagged(self):
+        run = self.make_run(status=ReportRun.STATUS_RUNNING)
+
+        self.assertTrue(cancel_run(run))
+        self.assertEqual((run.status, run.interrupt), (ReportRun.STATUS_RUNNING, ReportRun.INTERRUPT_CANCEL))
+        self.assertFalse(cancel_run(self.make_run(task_id="done", status=ReportRun.STATUS_COMPLETED)))
+
+
+class CancelViewTest(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="cancel@example.com", password="testpass123", name="Cancel")
+        self.client.force_authenticate(user=self.user)
+
+    def test_cancel(self):
+        ReportRun.objects.create(report_name="r", task_id="running", user=self.user, status=ReportRun.STATUS_RUNNING)
+        ReportRun.objects.create(report_name="r", task_id="done", status=ReportRun.STATUS_COMPLETED)
+        other = CustomUser.objects.create_user(email="other@example.com", password="testpass123", name="Other")
+        ReportRun.objects.create(report_name="r", task_id="other", user=other, status=ReportRun.STATUS_RUNNING)
+
+        response = self.client.post(reverse("report-run-cancel", args=["running"]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["interrupt"], ReportRun.INTERRUPT_CANCEL)
+
+        self.assertEqual(self.client.post(reverse("report-run-cancel", args=["done"])).status_code, 409)
+        self.assertEqual(self.client.post(reverse("report-run-cancel", args=["other"])).status_code, 403)
+        self.assertEqual(self.client.post(reverse("report-run-cancel", args=["missing"])).status_code, 404)
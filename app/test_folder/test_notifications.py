@@ -0,0 +1,33 @@
+from django.test import TestCase, override_settings
+
+from app import notifications
+from app.models import ReportRun
+from app.runs import record_output
+
+
+@override_settings(REPORT_EVENTS_URL="memory://")
+class NotificationTest(TestCase):
+    def test_listeners_receive_events_for_their_task_only(self):
+        with notifications.listen("a") as a_events, notifications.listen("b") as b_events:
+            notifications.publish("a", {"status": "Running"})
+
+            self.assertEqual(a_events.get(timeout=1), {"status": "Running"})
+            self.assertTrue(b_events.empty())
+        self.assertNotIn("a", notifications.hub._listeners)
+
+    def test_run_updates_are_published(self):
+        ReportRun.objects.create(report_name="r", task_id="task-r", status=ReportRun.STATUS_RUNNING,
+                                 output_path="/tmp/missing_output.csv")
+        with notifications.listen("task-r") as events:
+            record_output("/tmp/missing_output.csv", rows_read=5, rows_written=4)
+            event = events.get(timeout=1)
+
+        self.assertEqual(event["status"], ReportRun.STATUS_COMPLETED)
+        self.assertEqual(event["rows_written"], 4)
+
+
+class RedisBackendTest(TestCase):
+    def test_publish_failure_is_not_raised(self):
+        backend = notifications.RedisEventBackend(notifications.EventHub(), "redis://127.0.0.1:1/0")
+        backend.publish("task", {"status": "Running"})
+        self.assertGreater(backend._down_until, 0)
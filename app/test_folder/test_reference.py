@@ -0,0 +1,101 @@
+import json
+import os
+import random
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from django.test import TestCase, override_settings
+
+from app import reference
+from app.reference import CompactReference
+from app.transformation import TransformationEngine
+
+
+class CompactReferenceTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.ref_path = os.path.join(self.temp_dir.name, "reference.csv")
+        self.rules_path = os.path.join(self.temp_dir.name, "rules.json")
+        with open(self.rules_path, "w") as f:
+            json.dump([{"output": "total", "formula": "data1 + refdata4"}], f)
+        self.engine = TransformationEngine(self.rules_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, text):
+        with open(self.ref_path, "w") as f:
+            f.write(text)
+
+    def assert_joins_like_dicts(self, chunk):
+        compact = CompactReference.load(self.ref_path)
+        ref_dict1, ref_dict2 = self.engine._load_reference(self.ref_path)
+        expected = [self.engine._reference_row(row.to_dict(), ref_dict1, ref_dict2) for _, row in chunk.iterrows()]
+        joined = [self.engine._complete_reference_row(row) for row in compact.join(chunk)]
+        # NaN != NaN, so compare the reprs, which also tell 1 from 1.0 and '1'.
+        self.assertEqual([list(map(repr, row.items())) for row in joined],
+                         [list(map(repr, row.items())) for row in expected])
+
+    def test_join_matches_dict_reference(self):
+        rng = random.Random(0)
+        texts = ["alpha", "beta", "x y", "", "1", "2.5"]
+        for _ in range(50):
+            rows = ["refkey1,refdata1,refkey2,refdata2,refdata3,refdata4"]
+            keys1 = rng.sample(range(100), 20)
+            keys2 = rng.sample(range(100), 20)
+            for i, (key1, key2) in enumerate(zip(keys1, keys2)):
+                rows.append(",".join([
+                    "" if i == 0 and rng.random() < 0.3 else f"K{key1}" if key1 % 2 else f"Kü{key1}", rng.choice(texts), str(key2), rng.choice(texts),
+                    rng.choice(["0.5", "1.1", "", "3"]), str(rng.randint(-300, 300)),
+                ]))
+            self.write("\n".join(rows) + "\n")
+            chunk = pd.DataFrame({
+                "refkey1": [rng.choice([f"K{k}" for k in range(100)] + [f"Kü{k}" for k in range(100)] + [None, 5])
+                            for _ in range(30)],
+                "refkey2": [rng.randint(0, 100) for _ in range(30)],
+                "data1": range(30),
+            })
+            with patch.object(reference, "CHUNK_ROWS", 7):
+                self.assert_joins_like_dicts(chunk)
+
+    def test_columns_are_compact(self):
+        self.write("refkey1,refdata1,refkey2,refdata4,ratio,price\n" + "".join(
+            f"k{i},{'abc'[i % 3]},{i},{i % 100},{i / 4},{i / 10}\n" for i in range(1000)
+        ))
+        compact = CompactReference.load(self.ref_path)
+
+        self.assertEqual(compact.keys["refkey1"].keys.dtype, np.dtype("S4"))
+        self.assertEqual(len(compact.columns["refdata1"].categories), 3)
+        self.assertEqual(compact.columns["refdata4"].dtype, np.int8)
+        self.assertEqual(compact.columns["ratio"].dtype, np.float32)
+        self.assertEqual(compact.columns["price"].dtype, np.float64)
+        self.assertEqual(compact.join(pd.DataFrame({"refkey1": ["k7"], "refkey2": [5000]})),
+                         [{"refdata1": "b", "refkey2": 7, "refdata4": 7, "ratio": 1.75, "price": 0.7}])
+
+    def test_unsupported_columns_fall_back(self):
+        self.write("refkey1,refkey2,flag\na,1,True\nb,2,\n")
+        self.assertIsNone(CompactReference.load(self.ref_path))
+
+    def test_duplicate_keys_are_rejected(self):
+        self.write("refkey1,refkey2\na,1\na,2\n")
+        with self.assertRaises(ValueError):
+            CompactReference.load(self.ref_path)
+
+    def test_process_dataframe_output_is_unchanged(self):
+        input_path = os.path.join(self.temp_dir.name, "input.csv")
+        with open(input_path, "w") as f:
+            f.write("data1,refkey1,refkey2\n" + "".join(f"{i},k{i % 13},{i % 7}\n" for i in range(200)))
+        self.write("refkey1,refdata1,refkey2,refdata4\n" + "".join(f"k{i},d{i},{i},{i * 3}\n" for i in range(10)))
+
+        outputs = []
+        for min_bytes in (10 ** 12, 0):
+            output_path = os.path.join(self.temp_dir.name, f"output_{min_bytes}.csv")
+            with override_settings(REPORT_COMPACT_REFERENCE_MIN_BYTES=min_bytes), \
+                    patch.object(CompactReference, "load", wraps=CompactReference.load) as load:
+                self.engine.process_dataframe(input_path, self.ref_path, output_path)
+            self.assertEqual(load.called, min_bytes == 0)
+            with open(output_path, "rb") as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
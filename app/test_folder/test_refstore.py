@@ -0,0 +1,269 @@
+import io
+import json
+import os
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pandas as pd
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from app.models import ReportRun
+from app.reference import CompactReference
+from app.refstore import DeltaError, ReferenceStore, ReferenceVersion
+from app.transformation import TransformationEngine
+from app.utils import compact_reference_task
+from users.models import CustomUser
+
+
+HEADER = "refkey1,refdata1,refkey2,refdata4"
+
+
+def rows_repr(ref_dict):
+    # NaN != NaN, so compare the reprs, which also tell 1 from 1.0 and '1'.
+    return {repr(key): list(map(repr, fields.items())) for key, fields in ref_dict.items()}
+
+
+class ReferenceStoreTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = ReferenceStore(os.path.join(self.temp_dir.name, "references"))
+        rules_path = os.path.join(self.temp_dir.name, "rules.json")
+        with open(rules_path, "w") as f:
+            json.dump([{"output": "total", "formula": "refdata4 + 1"}], f)
+        self.engine = TransformationEngine(rules_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create(self, text, name="prices"):
+        return self.store.create(name, [text.encode()])
+
+    def delta(self, text, name="prices", parent=None):
+        return self.store.apply_delta(name, ContentFile(text.encode()), parent=parent)
+
+    def load(self, manifest):
+        return self.engine._load_reference(self.store.version_path(manifest["name"], manifest["version"]))
+
+    def full(self, text):
+        path = os.path.join(self.temp_dir.name, "full.csv")
+        with open(path, "w") as f:
+            f.write(text)
+        return self.engine._load_reference(path)
+
+    def test_delta_gives_the_rows_of_an_updated_file(self):
+        base = self.create(f"{HEADER}\na,x,1,10\nb,y,2,20\nc,z,3,30\n")
+        version = self.delta(f"op,{HEADER}\nupsert,b,Y,2,21\ndelete,,,3,\nupsert,d,w,4,40\nupsert,e,v,1,50\n")
+
+        self.assertEqual(version["parent"], base["version"])
+        self.assertEqual((version["upserts"], version["deletes"]), (3, 1))
+        self.assertEqual(self.store.head("prices"), version["version"])
+        expected = self.full(f"{HEADER}\nb,Y,2,21\nd,w,4,40\ne,v,1,50\n")
+        self.assertEqual([rows_repr(index) for index in self.load(version)], [rows_repr(index) for index in expected])
+        # The base version still reads as uploaded.
+        expected = self.full(f"{HEADER}\na,x,1,10\nb,y,2,20\nc,z,3,30\n")
+        self.assertEqual([rows_repr(index) for index in self.load(base)], [rows_repr(index) for index in expected])
+
+    def test_compact_reference_applies_deltas_like_dicts(self):
+        rng = random.Random(0)
+        for case in range(30):
+            name = f"random{case}"
+            keys = rng.sample(range(60), 25)
+            self.create(HEADER + "\n" + "".join(
+                f"K{key},t{rng.randint(0, 3)},{key + 100},{rng.randint(-50, 50)}\n" for key in keys
+            ), name=name)
+            for _ in range(rng.randint(1, 3)):
+                lines = []
+                for _ in range(rng.randint(1, 10)):
+                    key1 = f"K{rng.randint(0, 70)}" if rng.random() < 0.8 else ""
+                    key2 = str(rng.randint(95, 170)) if rng.random() < 0.8 or not key1 else ""
+                    lines.append(f"{rng.choice(['upsert', 'delete'])},{key1},u{rng.randint(0, 3)},{key2},"
+                                 f"{rng.randint(-50, 50)}")
+                manifest = self.delta(f"op,{HEADER}\n" + "\n".join(lines) + "\n", name=name)
+
+            stored = ReferenceVersion(self.store.version_path(name, manifest["version"]))
+            compact = CompactReference.load(stored.base_path)
+            compact.apply(stored.changes(compact.kinds()))
+            ref_dict1, ref_dict2 = self.load(manifest)
+            chunk = pd.DataFrame({
+                "refkey1": [rng.choice([f"K{k}" for k in range(70)] + [None]) for _ in range(40)],
+                "refkey2": [rng.randint(95, 170) for _ in range(40)],
+            })
+            expected = [self.engine._reference_row(row.to_dict(), ref_dict1, ref_dict2) for _, row in chunk.iterrows()]
+            joined = [self.engine._complete_reference_row(row) for row in compact.join(chunk)]
+            self.assertEqual([sorted(map(repr, row.items())) for row in joined],
+                             [sorted(map(repr, row.items())) for row in expected])
+
+    def test_report_on_a_version_is_the_same_compact_or_not(self):
+        self.create(f"{HEADER}\na,x,1,10\nb,y,2,20\n")
+        version = self.delta(f"op,{HEADER}\nupsert,a,X,1,11\ndelete,b,,,\n")
+        input_path = os.path.join(self.temp_dir.name, "input.csv")
+        with open(input_path, "w") as f:
+            f.write("refkey1,refkey2\na,1\nb,2\n")
+        ref_path = self.store.version_path("prices", version["version"])
+
+        outputs = []
+        for min_bytes in (0, 1 << 40):
+            output_path = os.path.join(self.temp_dir.name, f"output{min_bytes}.csv")
+            with override_settings(REPORT_COMPACT_REFERENCE_MIN_BYTES=min_bytes):
+                self.engine.process_dataframe(input_path, ref_path, output_path)
+            with open(output_path) as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(pd.read_csv(io.StringIO(outputs[0]))["total"].tolist(), [12, 1])
+
+    def test_compaction_keeps_version_and_rows(self):
+        self.create(f"{HEADER}\na,x,1,10\nb,y,2,20\n")
+        self.delta(f"op,{HEADER}\nupsert,a,X,1,11\n")
+        version = self.delta(f"op,{HEADER}\ndelete,b,,,\nupsert,c,z,3,30\n")
+        path = self.store.version_path("prices", version["version"])
+        with open(path) as f:
+            manifest_text = f.read()
+        before = [rows_repr(index) for index in self.load(version)]
+
+        self.assertTrue(self.store.needs_compaction(version, max_deltas=2, max_ratio=100))
+        compacted = self.store.compact("prices", version["version"])
+
+        self.assertEqual((compacted["version"], compacted["deltas"]), (version["version"], []))
+        self.assertNotEqual(compacted["base"], version["base"])
+        self.assertEqual([rows_repr(index) for index in self.load(version)], before)
+        with open(path) as f:
+            self.assertEqual(f.read(), manifest_text)
+        # A delta on the compacted version builds on its new base.
+        self.assertEqual(len(self.delta(f"op,{HEADER}\ndelete,a,,,\n")["deltas"]), 1)
+
+    def test_compaction_keeps_deltas_that_would_retype_a_column(self):
+        self.create(f"{HEADER}\na,x,1,10\n")
+        version = self.delta(f"op,{HEADER}\nupsert,b,7,,20\n")
+
+        self.assertEqual(self.store.compact("prices", version["version"])["deltas"], version["deltas"])
+        ref_dict1, _ = self.load(version)
+        self.assertEqual((ref_dict1["a"]["refkey2"], ref_dict1["b"]["refdata1"]), (1, "7"))
+
+    def test_delta_on_an_older_version_leaves_the_head(self):
+        base = self.create(f"{HEADER}\na,x,1,10\n")
+        head = self.delta(f"op,{HEADER}\nupsert,b,y,2,20\n")
+        branch = self.delta(f"op,{HEADER}\ndelete,a,,,\n", parent=base["version"])
+
+        self.assertEqual(self.store.head("prices"), head["version"])
+        self.assertEqual(self.load(branch), ({}, {}))
+        self.assertEqual(self.delta(f"op,{HEADER}\nupsert,b,y,2,20\n", parent=base["version"])["version"],
+                         head["version"])
+
+    def test_concurrent_deltas_all_stay_in_the_head_lineage(self):
+        self.create(f"{HEADER}\na,x,1,10\n")
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda i: self.delta(f"op,{HEADER}\nupsert,k{i},y,{i + 2},{i}\n"), range(16)))
+
+        head = self.store.manifest("prices", self.store.head("prices"))
+        self.assertEqual(len(head["deltas"]), 16)
+        self.assertEqual(len(self.load(head)[0]), 17)
+
+    def test_invalid_deltas(self):
+        self.create(f"{HEADER}\na,x,1,10\n")
+        cases = [
+            (f"{HEADER}\na,x,1,10\n", "needs an 'op' column"),
+            ("op,refkey1,refkey2\nupsert,a,1\n", "must have the reference columns"),
+            (f"op,{HEADER}\nreplace,a,x,1,10\n", "Unsupported operations ['replace']"),
+            (f"op,{HEADER}\nupsert,a,x,1,10\ndelete,,x,,\n", "Delta row 2 has neither"),
+            (f"op,{HEADER}\n", "at least one row"),
+        ]
+        for text, message in cases:
+            with self.assertRaisesRegex(DeltaError, message.replace("[", r"\[").replace("]", r"\]")):
+                self.delta(text)
+        with self.assertRaises(KeyError):
+            self.delta(f"op,{HEADER}\ndelete,a,,,\n", parent="0" * 64)
+        self.assertEqual(len(self.store.versions("prices")), 1)
+
+
+class ReferenceViewTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="refs@example.com", password="testpass123", name="Refs")
+        self.client.force_authenticate(user=self.user)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            REFERENCES_ROOT=os.path.join(self.temp_dir.name, "references"),
+            MEDIA_ROOT=os.path.join(self.temp_dir.name, "media"),
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def upload_delta(self, text):
+        return self.client.post(reverse("reference-deltas", args=["prices"]), data={
+            'delta': SimpleUploadedFile("delta.csv", text.encode()),
+        }, format='multipart')
+
+    @patch("app.views.generate_report_task.apply_async")
+    def test_reports_pin_a_version(self, mock_task):
+        mock_task.return_value.id = "task"
+        created = self.client.post(reverse("references"), data={
+            'name': "prices", 'reference': SimpleUploadedFile("reference.csv", f"{HEADER}\na,x,1,10\n".encode()),
+        }, format='multipart')
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+
+        def generate(**data):
+            return self.client.post(reverse("generate-report"), data={
+                'input': SimpleUploadedFile("input.csv", b"refkey1,refkey2\na,1\n"), **data,
+            }, format='multipart')
+
+        self.assertEqual(generate(reference_name="prices").status_code, status.HTTP_202_ACCEPTED)
+        delta = self.upload_delta(f"op,{HEADER}\nupsert,a,X,1,11\n")
+        self.assertEqual(delta.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((delta.data["head"], delta.data["upserts"], delta.data["deltas"]), (True, 1, 1))
+        generate(reference_name="prices")
+        generate(reference_name="prices", reference_version=created.data["version"])
+
+        runs = ReportRun.objects.order_by('created_at')
+        self.assertEqual([run.reference_sha256 for run in runs],
+                         [created.data["version"], delta.data["version"], created.data["version"]])
+        self.assertEqual(runs[0].reference_path, mock_task.call_args_list[0].args[0][1])
+        self.assertTrue(runs[0].reference_path.endswith(f"{created.data['version']}.ref.json"))
+
+        versions = self.client.get(reverse("reference-versions", args=["prices"])).data
+        self.assertEqual(versions["head"], delta.data["version"])
+        self.assertEqual([v["version"] for v in versions["versions"]], [delta.data["version"], created.data["version"]])
+        self.assertEqual(self.client.get(reverse("references")).data["references"],
+                         [{"name": "prices", "head": delta.data["version"]}])
+
+        response = generate(reference_name="prices", reference_version="0" * 64)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(REFERENCE_COMPACT_DELTAS=2, REFERENCE_COMPACT_RATIO=100)
+    @patch("app.views.compact_reference_task.delay")
+    def test_long_delta_chains_are_compacted(self, mock_task):
+        self.client.post(reverse("references"), data={
+            'name': "prices", 'reference': SimpleUploadedFile("reference.csv", f"{HEADER}\na,x,1,10\n".encode()),
+        }, format='multipart')
+        first = self.upload_delta(f"op,{HEADER}\nupsert,b,y,2,20\n")
+        second = self.upload_delta(f"op,{HEADER}\ndelete,a,,,\n")
+
+        self.assertEqual((first.data["compacting"], second.data["compacting"]), (False, True))
+        mock_task.assert_called_once_with("prices", second.data["version"])
+        # Run the queued compaction in-process, as a worker would.
+        compact_reference_task(*mock_task.call_args.args)
+        versions = self.client.get(reverse("reference-versions", args=["prices"])).data["versions"]
+        self.assertEqual([v["deltas"] for v in versions], [0, 1, 0])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.upload_delta(f"op,{HEADER}\ndelete,a,,,\n").status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse("references"), data={
+            'name': "../prices", 'reference': SimpleUploadedFile("reference.csv", f"{HEADER}\na,x,1,10\n".encode()),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.post(reverse("references"), data={
+            'name': "prices", 'reference': SimpleUploadedFile("reference.csv", f"{HEADER}\na,x,1,10\n".encode()),
+        }, format='multipart')
+        response = self.upload_delta(f"op,{HEADER}\nmerge,a,x,1,10\n")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Invalid delta", response.data["error"])
+        self.assertEqual(self.client.get(reverse("reference-versions", args=["other"])).status_code, 404)
@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_celery_beat.models import CrontabSchedule, PeriodicTask
+
+from app.incremental import MANIFEST_SUFFIX
+from app.models import ReportRun
+from app.retention import StorageManager
+from app.rules import RuleSetStore
+from app.storage import BlobStore
+
+
+DAY = 24 * 3600
+
+
+class StorageManagerTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.media_root = os.path.join(self.temp_dir.name, "media")
+        self.rules_root = os.path.join(self.temp_dir.name, "configs")
+        os.makedirs(self.media_root)
+        self.settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            RULES_ROOT=self.rules_root,
+            STORAGE_QUOTA_BYTES=10 ** 6,
+            STORAGE_OUTPUT_TTL=7 * DAY,
+            STORAGE_INPUT_TTL=DAY,
+            STORAGE_ORPHAN_TTL=DAY,
+            STORAGE_RULES_TTL=30 * DAY,
+            REPORT_RUN_TIMEOUT=DAY,
+            STORAGE_GRACE_SECONDS=60,
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.temp_dir.cleanup()
+
+    def write(self, name, size=100, age=2 * DAY):
+        path = os.path.join(self.media_root, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def make_run(self, name, status=ReportRun.STATUS_COMPLETED, accessed_days_ago=None, **kwargs):
+        paths = {
+            "input_path": self.write(f"{name}_input.csv"),
+            "reference_path": self.write(f"{name}_reference.csv"),
+            "output_path": self.write(f"{name}_output.csv"),
+        }
+        paths.update(kwargs)
+        run = ReportRun.objects.create(report_name=name, task_id=name, status=status, **paths)
+        if accessed_days_ago is not None:
+            ReportRun.objects.filter(pk=run.pk).update(
+                last_accessed_at=timezone.now() - timedelta(days=accessed_days_ago)
+            )
+        return run
+
+    def test_expired_inputs_and_orphans_are_removed(self):
+        run = self.make_run("done", accessed_days_ago=0)
+        orphan = self.write("stray_dryrun_input.csv")
+        fresh_orphan = self.write("new_input.csv", age=0)
+
+        result = StorageManager().evict()
+
+        self.assertIn(orphan, result["removed"])
+        self.assertFalse(os.path.exists(run.input_path))
+        self.assertFalse(os.path.exists(run.reference_path))
+        self.assertTrue(os.path.exists(run.output_path))
+        self.assertTrue(os.path.exists(fresh_orphan))
+
+    def test_outputs_expire_after_last_download(self):
+        stale = self.make_run("stale", accessed_days_ago=8)
+        manifest = self.write(os.path.basename(stale.output_path) + MANIFEST_SUFFIX)
+
+        StorageManager().evict()
+
+        self.assertFalse(os.path.exists(stale.output_path))
+        self.assertFalse(os.path.exists(manifest))
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ReportRun.STATUS_EVICTED)
+
+    @override_settings(STORAGE_QUOTA_BYTES=150, STORAGE_INPUT_TTL=30 * DAY)
+    def test_quota_evicts_least_recently_downloaded_outputs(self):
+        old = self.make_run("old", accessed_days_ago=3)
+        recent = self.make_run("recent", accessed_days_ago=1)
+
+        result = StorageManager().evict()
+
+        self.assertLessEqual(result["used_bytes"], 150)
+        self.assertFalse(os.path.exists(old.output_path))
+        self.assertTrue(os.path.exists(recent.output_path))
+
+    @override_settings(STORAGE_QUOTA_BYTES=0)
+    def test_pending_runs_and_schedules_are_protected(self):
+        pending = self.make_run("pending", status=ReportRun.STATUS_PENDING)
+        scheduled = self.make_run("scheduled", status=ReportRun.STATUS_SCHEDULED)
+        long_running = self.make_run("long", status=ReportRun.STATUS_RUNNING)
+        ReportRun.objects.filter(pk=long_running.pk).update(created_at=timezone.now() - timedelta(days=3))
+        store = RuleSetStore(self.rules_root)
+        rules_path = store.plan_path(store.save([{"output": "x", "formula": "a"}]))
+        os.utime(rules_path, (0, 0))
+        PeriodicTask.objects.create(
+            name="nightly",
+            task="app.utils.generate_scheduled_report_task",
+            crontab=CrontabSchedule.objects.create(minute="0", hour="0"),
+            args=json.dumps([scheduled.input_path, scheduled.reference_path, rules_path]),
+        )
+
+        StorageManager().evict()
+
+        for run in (pending, scheduled, long_running):
+            for path in (run.input_path, run.reference_path, run.output_path):
+                self.assertTrue(os.path.exists(path), path)
+        self.assertTrue(os.path.exists(rules_path))
+
+        PeriodicTask.objects.all().delete()
+        StorageManager().evict()
+        self.assertFalse(os.path.exists(scheduled.output_path))
+        self.assertFalse(os.path.exists(rules_path))
+
+    def test_shared_uploads_count_once_and_are_collected(self):
+        blobs = BlobStore(os.path.join(self.media_root, "blobs"))
+        digest, _ = blobs.put([b"x" * 1000])
+        blob_time = time.time() - 2 * DAY
+        os.utime(blobs.path(digest), (blob_time, blob_time))
+        links = [os.path.join(self.media_root, f"{i}_reference.csv") for i in range(2)]
+        for path in links:
+            blobs.link(digest, path)
+
+        manager = StorageManager()
+        self.assertEqual(manager.disk_usage(), 1000)
+        result = manager.evict()
+
+        self.assertEqual(sorted(result["removed"]), links)
+        self.assertFalse(blobs.exists(digest))
+        self.assertEqual(result["used_bytes"], 0)
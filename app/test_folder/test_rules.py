@@ -0,0 +1,194 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from app.rules import (
+    TEMPORARY_PREFIX, RulePlan, RuleSetStore, RuleValidationError, load_plan, parse_rules, rules_version,
+    validate_rules,
+)
+from app.transformation import TransformationEngine
+
+
+class RuleValidationTest(TestCase):
+    def test_validate_normalizes_rules(self):
+        rules = validate_rules([{"output": "total", "formula": "a + b", "comment": "ignored"}])
+        self.assertEqual(rules, [{"output": "total", "formula": "a + b"}])
+
+    def test_validate_rejects_syntax_errors(self):
+        with self.assertRaises(RuleValidationError) as ctx:
+            validate_rules([{"output": "total", "formula": "a +"}])
+        self.assertIn("invalid formula", str(ctx.exception))
+
+    def test_validate_rejects_missing_keys_and_dunder(self):
+        with self.assertRaises(RuleValidationError):
+            validate_rules([{"formula": "a"}])
+        with self.assertRaises(RuleValidationError):
+            validate_rules([{"output": "x", "formula": "a.__class__"}])
+        with self.assertRaises(RuleValidationError):
+            validate_rules({"output": "x", "formula": "a"})
+
+    def test_version_is_independent_of_source_format(self):
+        json_rules = parse_rules(b'[{"output": "x", "formula": "a + 1"}]', 'json')
+        yaml_rules = parse_rules(b'- output: x\n  formula: a + 1\n', 'yaml')
+        self.assertEqual(rules_version(json_rules), rules_version(yaml_rules))
+
+
+class RuleSetStoreTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = RuleSetStore(self.temp_dir.name)
+        self.rules = [{"output": "sum", "formula": "field1 + field2"}]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_save_is_content_addressed_and_immutable(self):
+        version = self.store.save(self.rules)
+        path = self.store.plan_path(version)
+        mtime = os.path.getmtime(path)
+
+        self.assertEqual(self.store.save(list(self.rules)), version)
+        self.assertEqual(os.path.getmtime(path), mtime)
+        self.assertEqual(len(self.store.versions()), 1)
+
+    def test_activate_switches_active_version(self):
+        self.assertIsNone(self.store.active_plan_path())
+        first = self.store.save(self.rules)
+        second = self.store.save([{"output": "diff", "formula": "field1 - field2"}])
+
+        self.store.activate(first)
+        self.assertEqual(self.store.active_version(), first)
+        self.store.activate(second)
+        self.assertEqual(self.store.active_plan_path(), self.store.plan_path(second))
+        self.assertEqual([v["version"] for v in self.store.versions() if v["active"]], [second])
+
+        with self.assertRaises(KeyError):
+            self.store.activate("unknown")
+
+    def test_engine_loads_stored_plan_from_cache(self):
+        version = self.store.save(self.rules)
+        plan = load_plan(self.store.plan_path(version))
+
+        self.assertIs(load_plan(self.store.plan_path(version)), plan)
+        self.assertEqual(plan.version, version)
+
+        engine = TransformationEngine(self.store.plan_path(version))
+        self.assertEqual(engine.rules, self.rules)
+        self.assertEqual(engine.apply_rules({"field1": "1", "field2": "2"}, {})["sum"], 3.0)
+
+
+class FilterRuleValidationTest(TestCase):
+    def test_filter_rules_are_normalized_without_output(self):
+        rules = validate_rules([
+            {"type": "filter", "formula": "region == 'EU'", "output": "ignored"},
+            {"output": "total", "formula": "a + b"},
+        ])
+        self.assertEqual(rules[0], {"type": "filter", "formula": "region == 'EU'"})
+
+        plan = RulePlan(rules)
+        self.assertEqual([f.columns for f in plan.filters], [["region"]])
+        self.assertEqual(plan.outputs, ["total"])
+
+    def test_rules_need_an_output(self):
+        with self.assertRaises(RuleValidationError):
+            validate_rules([{"type": "filter", "formula": "a > 1"}])
+        with self.assertRaises(RuleValidationError):
+            validate_rules([{"type": "aggregate", "formula": "a"}])
+
+
+class AggregateRuleValidationTest(TestCase):
+    def test_aggregate_rules_are_normalized(self):
+        rules = validate_rules([
+            {"type": "aggregate", "output": "n", "function": "count", "group_by": "region"},
+            {"type": "aggregate", "output": "total", "function": "sum", "formula": "amount", "group_by": ["region"]},
+        ])
+        self.assertEqual(rules[0], {"type": "aggregate", "output": "n", "function": "count", "group_by": ["region"]})
+
+        plan = RulePlan(rules)
+        self.assertEqual(plan.columns, ["region", "n", "total"])
+        self.assertFalse(plan.aggregates_use_outputs)
+
+    def test_aggregate_rules_are_checked(self):
+        with self.assertRaises(RuleValidationError):
+            validate_rules([{"type": "aggregate", "output": "x", "function": "median", "formula": "a"}])
+        with self.assertRaises(RuleValidationError):
+            validate_rules([{"type": "aggregate", "output": "x", "function": "sum"}])
+        with self.assertRaises(RuleValidationError):
+            validate_rules([
+                {"type": "aggregate", "output": "x", "function": "count", "group_by": ["a"]},
+                {"type": "aggregate", "output": "y", "function": "count", "group_by": ["b"]},
+            ])
+
+
+class RuleDependencyTest(TestCase):
+    def test_rules_read_outputs_above_them(self):
+        rules = validate_rules([
+            {"output": "price", "formula": "price * 2"},
+            {"output": "base", "formula": "price * quantity", "intermediate": True},
+            {"output": "fee", "formula": "round(base * 0.1, 2)", "intermediate": False},
+            {"output": "total", "formula": "base + fee"},
+            {"output": "quantity", "formula": "quantity + 1"},
+        ])
+        self.assertEqual(rules[1], {"output": "base", "formula": "price * quantity", "intermediate": True})
+        self.assertEqual(rules[2], {"output": "fee", "formula": "round(base * 0.1, 2)"})
+
+        plan = RulePlan(rules)
+        self.assertEqual([step.output for step in plan.program], ["price", "base", "fee", "total", "quantity"])
+        self.assertEqual(plan.outputs, ["price", "fee", "total", "quantity"])
+        self.assertEqual(plan.steps[0].references, frozenset())
+        # `quantity` is written below `base`, so `base` still reads the input column.
+        self.assertEqual(plan.steps[1].references, {"price"})
+
+    def test_names_written_below_mean_input_columns(self):
+        rules = validate_rules([{"output": "a", "formula": "b + 1"}, {"output": "b", "formula": "a + 1"}])
+        plan = RulePlan(rules)
+        self.assertEqual([step.output for step in plan.program], ["a", "b"])
+        self.assertEqual((plan.steps[0].references, plan.steps[1].references), (frozenset(), {"a"}))
+        # The last definition of an output is the one that counts, where it stands.
+        plan = RulePlan([
+            {"output": "x", "formula": "1"}, {"output": "y", "formula": "x + 1"}, {"output": "x", "formula": "2"},
+        ])
+        self.assertEqual([step.output for step in plan.program], ["y", "x"])
+        self.assertEqual(plan.steps[1].references, frozenset())
+
+    def test_intermediate_rules_are_checked(self):
+        with self.assertRaises(RuleValidationError):
+            validate_rules([{"output": "a", "formula": "x", "intermediate": True}])
+        with self.assertRaises(RuleValidationError):
+            validate_rules([{"output": "a", "formula": "x", "intermediate": "yes"}, {"output": "b", "formula": "a"}])
+        with self.assertRaises(RuleValidationError):
+            validate_rules([
+                {"type": "filter", "formula": "x > 1", "intermediate": True}, {"output": "b", "formula": "x"},
+            ])
+
+    def test_shared_subexpressions_are_computed_once(self):
+        plan = RulePlan([
+            {"output": "peak", "formula": "max(field5, refdata4)"},
+            {"output": "scaled", "formula": "field3 * max(field5, refdata4)"},
+            {"output": "lower", "formula": "min(field5, refdata4) * 2"},
+            {"output": "upper", "formula": "min(field5, refdata4) + 1"},
+            {"output": "floor", "formula": "min(field5, refdata4)"},
+            {"output": "a", "formula": "round(field1 / field2, 2) + 1"},
+            {"output": "b", "formula": "round(field1 / field2, 2) * 2"},
+            {"output": "c", "formula": "field1 / field2 if field2 else 0"},
+            {"output": "d", "formula": "d + abs(field1 - d)"},
+            {"output": "e", "formula": "abs(field1 - d)"},
+        ])
+        by_output = {step.output: step for step in plan.program}
+        shared = [step for step in plan.program if step.temporary]
+
+        self.assertEqual(sorted(step.formula for step in shared),
+                         ["min(field5, refdata4)", "round(field1 / field2, 2)"])
+        self.assertEqual(by_output["scaled"].uses, {"peak"})
+        # `floor` is below the rules that share its formula, so they share a temporary instead of its output.
+        self.assertEqual(by_output["lower"].uses, by_output["floor"].uses)
+        self.assertTrue(all(name.startswith(TEMPORARY_PREFIX) for name in by_output["lower"].uses))
+        self.assertEqual(len(by_output["a"].uses), 1)
+        self.assertEqual(by_output["a"].uses, by_output["b"].uses)
+        # Sub-expressions under a condition are not evaluated ahead of it.
+        self.assertEqual(by_output["c"].uses, frozenset())
+        # `d` means the input column in its own rule and the output in the rules below it.
+        self.assertEqual(by_output["e"].uses, {"d"})
+        self.assertEqual(by_output["d"].uses, frozenset())
+        self.assertFalse(plan.linear)
@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+
+from django.test import TestCase
+
+from app.models import ReportRun
+from app.runs import record_download, record_output
+from app.utils import generate_report_task
+
+
+class ReportRunLifecycleTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.temp_dir.name, "abc_input.csv")
+        self.ref_path = os.path.join(self.temp_dir.name, "abc_reference.csv")
+        self.rules_path = os.path.join(self.temp_dir.name, "rules.json")
+        self.output_path = os.path.join(self.temp_dir.name, "abc_output.csv")
+
+        with open(self.input_path, "w") as f:
+            f.write("data1,data2,refkey1,refkey2\n10,20,R1,R2\n1,2,R1,R2\n")
+        with open(self.ref_path, "w") as f:
+            f.write("refkey1,refkey2,refdata1,refdata2,refdata3,refdata4\nR1,R2,X,Y,Z,99")
+        with open(self.rules_path, "w") as f:
+            json.dump([{"output": "sum", "formula": "data1 + data2"}], f)
+
+        self.run = ReportRun.objects.create(
+            report_name="abc", task_id="task-abc", status=ReportRun.STATUS_PENDING,
+            input_path=self.input_path, reference_path=self.ref_path, output_path=self.output_path,
+        )
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_task_records_counts_sizes_and_timings(self):
+        generate_report_task(self.input_path, self.ref_path, self.rules_path)
+
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.status, ReportRun.STATUS_COMPLETED)
+        self.assertEqual(self.run.rows_read, 2)
+        self.assertEqual(self.run.rows_written, 2)
+        self.assertEqual(self.run.output_bytes, os.path.getsize(self.output_path))
+        self.assertLessEqual(self.run.started_at, self.run.completed_at)
+
+    def test_task_records_failure(self):
+        with self.assertRaises(Exception):
+            generate_report_task(self.input_path, self.ref_path, os.path.join(self.temp_dir.name, "missing.json"))
+
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.status, ReportRun.STATUS_FAILED)
+        self.assertIn("missing.json", self.run.error)
+
+    def test_download_updates_last_access(self):
+        with open(self.output_path, "w") as f:
+            f.write("sum\n30\n")
+        record_output(self.output_path)
+        record_download(self.output_path)
+
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.output_bytes, 7)
+        self.assertIsNotNone(self.run.last_accessed_at)
@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pandas as pd
+from django.test import TestCase, override_settings
+
+from app import incremental
+from app.celery import app as celery_app
+from app.incremental import update_report, update_reports
+from app.models import ReportRun
+from app.scheduling import BATCH_TASK, SCHEDULED_TASK, CoalescingScheduler
+from app.transformation import process_batch
+from app.utils import generate_scheduled_batch_task
+
+
+class CoalescedScheduleTestMixin:
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.temp_dir.name, "shared_input.csv")
+        self.ref_path = os.path.join(self.temp_dir.name, "shared_reference.csv")
+        with open(self.input_path, "w") as f:
+            f.write("field1,field2,refkey1,refkey2\n1,2,A,B\n3,4,A,B\n")
+        with open(self.ref_path, "w") as f:
+            f.write("refkey1,refkey2,refdata1,refdata2,refdata3,refdata4\nA,B,x,y,z,10\n")
+
+        self.reports = []
+        formulas = ["field1 + field2", "field1 * refdata4", "field2 - field1"]
+        for i, formula in enumerate(formulas):
+            rules_path = os.path.join(self.temp_dir.name, f"rules_{i}.json")
+            with open(rules_path, "w") as f:
+                json.dump([{"output": "total", "formula": formula}], f)
+            # Schedules uploaded with the same files get links to one stored copy.
+            input_path = os.path.join(self.temp_dir.name, f"s{i}_input.csv")
+            os.link(self.input_path, input_path)
+            self.reports.append((rules_path, input_path.replace("input.csv", "output.csv"), input_path))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+class UpdateReportsTest(CoalescedScheduleTestMixin, TestCase):
+    def test_reports_share_one_pass(self):
+        reports = [(rules_path, output_path) for rules_path, output_path, _ in self.reports]
+        with patch.object(incremental, "process_batch", wraps=process_batch) as batch:
+            results = update_reports(self.input_path, self.ref_path, reports)
+        self.assertEqual(batch.call_count, 1)
+        self.assertEqual([result["mode"] for result in results], ["full"] * 3)
+        self.assertEqual([pd.read_csv(output_path)["total"].tolist() for _, output_path in reports],
+                         [[3, 7], [10, 30], [1, 1]])
+
+        with patch.object(incremental, "process_batch", wraps=process_batch) as batch:
+            results = update_reports(self.input_path, self.ref_path, reports)
+        batch.assert_not_called()
+        self.assertEqual([result["mode"] for result in results], ["skipped"] * 3)
+
+        # Shared uploads never grow in place; with the links gone the input is a private file that may.
+        for _, _, input_path in self.reports:
+            os.remove(input_path)
+        with open(self.input_path, "a") as f:
+            f.write("5,6,A,B\n")
+        rules_path, output_path = reports[2]
+        update_report(self.input_path, self.ref_path, rules_path, output_path)
+        with patch.object(incremental, "process_batch", wraps=process_batch) as batch:
+            results = update_reports(self.input_path, self.ref_path, reports)
+        self.assertEqual(batch.call_count, 1)
+        self.assertEqual([result["mode"] for result in results], ["appended", "appended", "skipped"])
+        self.assertEqual(pd.read_csv(reports[0][1])["total"].tolist(), [3, 7, 11])
+
+    def test_batch_task_records_each_run(self):
+        for i, (rules_path, output_path, input_path) in enumerate(self.reports):
+            ReportRun.objects.create(
+                report_name=f"scheduled_{i}", status=ReportRun.STATUS_SCHEDULED, input_path=input_path,
+                reference_path=self.ref_path, rules_path=rules_path, output_path=output_path,
+            )
+        reports = [[rules_path, output_path] for rules_path, output_path, _ in self.reports]
+        generate_scheduled_batch_task(self.reports[0][2], self.ref_path, reports)
+
+        for _, output_path, _ in self.reports:
+            run = ReportRun.objects.get(output_path=output_path)
+            self.assertEqual((run.status, run.rows_read, run.rows_written), (ReportRun.STATUS_SCHEDULED, 2, 2))
+            self.assertIsNotNone(run.completed_at)
+
+
+@override_settings(REPORT_SCHEDULE_COALESCE_SECONDS=5)
+class CoalescingSchedulerTest(CoalescedScheduleTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.scheduler = CoalescingScheduler(app=celery_app, lazy=True)
+        self.now = 1000.0
+        clock = patch("app.scheduling.time.monotonic", side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def entry(self, name, rules_path, input_path, ref_path=None, queue="reports_small", priority=3):
+        return SimpleNamespace(
+            name=name, task=SCHEDULED_TASK, args=[input_path, ref_path or self.ref_path, rules_path], kwargs={},
+            options={"queue": queue, "priority": priority},
+        )
+
+    def test_due_schedules_on_shared_files_are_sent_as_one_batch(self):
+        other_ref = os.path.join(self.temp_dir.name, "other_reference.csv")
+        with open(other_ref, "w") as f:
+            f.write("refkey1,refkey2,refdata4\nA,B,1\n")
+        entries = [
+            self.entry(f"s{i}", rules_path, input_path, priority=5 - i)
+            for i, (rules_path, _, input_path) in enumerate(self.reports)
+        ]
+        entries[2].options["queue"] = "reports_large"
+        lone = self.entry("lone", self.reports[0][0], self.reports[0][2], ref_path=other_ref)
+
+        with patch.object(celery_app.tasks[BATCH_TASK], "apply_async") as batch, \
+                patch("celery.beat.Scheduler.apply_async") as single, \
+                patch("django_celery_beat.schedulers.DatabaseScheduler.tick", return_value=60):
+            for entry in entries[:2] + [lone]:
+                self.assertIsNone(self.scheduler.apply_async(entry, advance=False))
+            self.assertEqual(self.scheduler.tick(), 5)
+            self.now += 3
+            self.scheduler.apply_async(entries[2], advance=False)
+            self.assertEqual(self.scheduler.tick(), 2)
+            batch.assert_not_called()
+            single.assert_not_called()
+
+            self.now += 2
+            self.assertEqual(self.scheduler.tick(), 60)
+
+        self.assertEqual(batch.call_count, 1)
+        args, options = batch.call_args
+        self.assertEqual(args[0], (
+            self.reports[0][2], self.ref_path,
+            [[rules_path, output_path] for rules_path, output_path, _ in self.reports],
+        ))
+        self.assertEqual((options["queue"], options["priority"]), ("reports_large", 3))
+        self.assertEqual(single.call_args.args[0], lone)
+
+    def test_other_tasks_are_sent_at_once(self):
+        entry = SimpleNamespace(name="evict", task="app.utils.evict_storage_task", args=[], kwargs={}, options={})
+        with patch("celery.beat.Scheduler.apply_async") as single:
+            self.scheduler.apply_async(entry, advance=False)
+        single.assert_called_once()
+        self.assertEqual(self.scheduler.pending, {})
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from app.storage import BlobStore
+
+
+class BlobStoreTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = BlobStore(os.path.join(self.temp_dir.name, "blobs"))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_identical_uploads_are_stored_once(self):
+        first, size = self.store.put([b"refkey1,", b"refdata1\n"])
+        second, _ = self.store.put([b"refkey1,refdata1\n"])
+
+        self.assertEqual(first, second)
+        self.assertEqual(size, 17)
+        self.assertEqual(len(os.listdir(os.path.dirname(self.store.path(first)))), 1)
+
+    def test_links_are_reference_counted_and_collected(self):
+        digest, _ = self.store.put([b"a,b\n1,2\n"])
+        links = [os.path.join(self.temp_dir.name, f"{i}_reference.csv") for i in range(2)]
+        for path in links:
+            self.store.link(digest, path)
+
+        self.assertEqual(self.store.refcount(digest), 2)
+        with open(links[0]) as f:
+            self.assertEqual(f.read(), "a,b\n1,2\n")
+
+        os.remove(links[0])
+        self.assertEqual(self.store.collect(), 0)
+        os.remove(links[1])
+        self.assertEqual(self.store.collect(), 8)
+        self.assertFalse(self.store.exists(digest))
@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from app import tracing
+from app.tracing import SpanContext, format_traceparent, parse_traceparent
+from users.models import CustomUser
+
+
+class TracingTestMixin:
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.trace_path = os.path.join(self.temp_dir.name, "traces.jsonl")
+        traced = override_settings(REPORT_TRACE_PATH=self.trace_path, REPORT_TRACE_SAMPLE_RATE=1.0)
+        traced.enable()
+        self.addCleanup(traced.disable)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def spans(self):
+        if not os.path.exists(self.trace_path):
+            return []
+        with open(self.trace_path) as f:
+            return [
+                span
+                for line in f
+                for resource in json.loads(line)["resourceSpans"]
+                for scope in resource["scopeSpans"]
+                for span in scope["spans"]
+            ]
+
+
+class TracingTest(TracingTestMixin, TestCase):
+    def test_traceparent_round_trip(self):
+        context = SpanContext("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+        parsed = parse_traceparent(format_traceparent(context))
+        self.assertEqual((parsed.trace_id, parsed.span_id, parsed.sampled), (context.trace_id, context.span_id, True))
+        self.assertFalse(parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00").sampled)
+        for value in (None, "", "00-xyz-00f067aa0ba902b7-01", "00-" + "0" * 32 + "-00f067aa0ba902b7-01"):
+            self.assertIsNone(parse_traceparent(value))
+
+    def test_nested_spans_are_exported_together(self):
+        with tracing.span("outer", size=3) as outer:
+            with tracing.span("inner"):
+                pass
+            self.assertEqual(self.spans(), [])
+            with self.assertRaises(ValueError), tracing.span("failing"):
+                raise ValueError("bad row")
+        inner, failing, exported_outer = self.spans()
+
+        self.assertEqual({inner["traceId"], failing["traceId"]}, {outer.context.trace_id})
+        self.assertEqual(inner["parentSpanId"], exported_outer["spanId"])
+        self.assertNotIn("parentSpanId", exported_outer)
+        self.assertEqual(exported_outer["attributes"], [{"key": "size", "value": {"intValue": "3"}}])
+        self.assertEqual(failing["status"], {"code": tracing.STATUS_ERROR, "message": "ValueError: bad row"})
+
+    def test_unsampled_traces_record_nothing(self):
+        with override_settings(REPORT_TRACE_SAMPLE_RATE=0.0):
+            with tracing.span("outer"):
+                unsampled = tracing.current_context()
+                with tracing.span("inner") as inner:
+                    inner.set_attribute("ignored", 1)
+        self.assertFalse(unsampled.sampled)
+        self.assertIsNone(tracing.current_context())
+        self.assertEqual(self.spans(), [])
+
+    def test_task_continues_the_published_trace(self):
+        headers = {}
+        with tracing.span("request") as request_span:
+            tracing._inject(headers=headers)
+        task = SimpleNamespace(name="app.utils.generate_report_task", request=SimpleNamespace(**headers))
+        tracing._start_task(task_id="task-1", task=task)
+        with tracing.span("engine.process_batch"):
+            pass
+        tracing._end_task(task_id="task-1", state="SUCCESS")
+        self.assertIsNone(tracing.current_context())
+
+        spans = {span["name"]: span for span in self.spans()}
+        task_span = spans["celery.task app.utils.generate_report_task"]
+        self.assertEqual(task_span["parentSpanId"], request_span.context.span_id)
+        self.assertEqual(spans["celery.queue"]["parentSpanId"], request_span.context.span_id)
+        self.assertEqual(spans["engine.process_batch"]["parentSpanId"], task_span["spanId"])
+        self.assertEqual(len({span["traceId"] for span in spans.values()}), 1)
+
+
+class TracedReportTest(TracingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(email="trace@example.com", password="testpass123", name="Trace")
+        self.client.force_authenticate(user=self.user)
+        self.input_path = os.path.join(self.temp_dir.name, "input.csv")
+        self.ref_path = os.path.join(self.temp_dir.name, "reference.csv")
+        with open(self.input_path, "w") as f:
+            f.write("data1,refkey1,refkey2\n" + "".join(f"{i},R1,R2\n" for i in range(25000)))
+        with open(self.ref_path, "w") as f:
+            f.write("refkey1,refkey2,refdata1,refdata2,refdata3,refdata4\nR1,R2,X,Y,Z,99")
+        with open(os.path.join(self.temp_dir.name, "rules.json"), "w") as f:
+            json.dump([{"output": "total", "formula": "data1 + refdata4"}], f)
+
+    def test_report_request_is_traced_to_engine_stages(self):
+        media_root = os.path.join(self.temp_dir.name, "media")
+        parent = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+        # The task runs in-process, so the whole trace is in this process's trace file.
+        with override_settings(MEDIA_ROOT=media_root, RULES_ROOT=self.temp_dir.name, REPORT_TRACE_SAMPLE_RATE=0.0,
+                               CELERY_TASK_ALWAYS_EAGER=True):
+            with open(self.input_path, "rb") as input_file, open(self.ref_path, "rb") as reference_file:
+                response = self.client.post(
+                    reverse("generate-report"), data={"input": input_file, "reference": reference_file},
+                    format="multipart", HTTP_TRACEPARENT=parent,
+                )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        spans = self.spans()
+        by_id = {span["spanId"]: span for span in spans}
+        names = [span["name"] for span in spans]
+        self.assertEqual({span["traceId"] for span in spans}, {"4bf92f3577b34da6a3ce929d0e0e4736"})
+        self.assertIn("HTTP POST /api/generate-report/", names)
+        self.assertEqual(names.count("upload.store"), 2)
+        self.assertEqual(names.count("engine.chunk"), 3)
+        self.assertEqual(names.count("engine.read"), 4)
+        for name in ("celery.task app.utils.generate_report_task", "engine.reference_load", "engine.finish"):
+            self.assertIn(name, names)
+
+        def ancestors(span):
+            while span.get("parentSpanId") in by_id:
+                span = by_id[span["parentSpanId"]]
+                yield span["name"]
+
+        write = next(span for span in spans if span["name"] == "engine.write")
+        self.assertEqual(list(ancestors(write))[:3], [
+            "engine.chunk", "engine.process_batch", "celery.task app.utils.generate_report_task",
+        ])
+        self.assertEqual(by_id[write["parentSpanId"]]["attributes"][0], {"key": "rows", "value": {"intValue": "10000"}})
+        self.assertEqual(response["traceresponse"].split("-")[1], "4bf92f3577b34da6a3ce929d0e0e4736")
@@ -4,7 +4,7 @@ import yaml
 import tempfile
 import pandas as pd
 from django.test import TestCase
-from app.transformation import TransformationEngine
+from app.transformation import TransformationEngine, process_batch
 
 
 class TransformationEngineTest(TestCase):
@@ -171,3 +171,230 @@ class TransformationEngineTest(TestCase):
 
         self.assertAlmostEqual(float(row["outfield4"]), float(3) * max(5.5, 0))
         self.assertAlmostEqual(float(row["outfield5"]), max(5.5, 0))
+
+    def _write_dry_run_files(self, rows=50):
+        input_path = os.path.join(self.temp_dir.name, "input.csv")
+        ref_path = os.path.join(self.temp_dir.name, "reference.csv")
+        pd.DataFrame([{
+            "field1": f"A{i}", "field2": f"B{i}", "field3": str(i), "field4": "X",
+            "field5": str(i * 1.5), "refkey1": f"k{i % 5}", "refkey2": f"j{i % 5}"
+        } for i in range(rows)]).to_csv(input_path, index=False)
+        pd.DataFrame([{
+            "refkey1": f"k{i}", "refdata1": "D", "refkey2": f"j{i}",
+            "refdata2": "E", "refdata3": "F", "refdata4": i
+        } for i in range(5)]).to_csv(ref_path, index=False)
+        return input_path, ref_path
+
+    def test_dry_run_reports_per_rule_error_rate(self):
+        rules = self.rules + [{"output": "bad", "formula": "field1 * field2"}]
+        rules_path = os.path.join(self.temp_dir.name, "dry_rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(rules, f)
+        input_path, ref_path = self._write_dry_run_files(rows=50)
+
+        result = TransformationEngine(rules_path).dry_run(input_path, ref_path, sample_size=10)
+
+        self.assertEqual(result["sample_rows"], 10)
+        self.assertAlmostEqual(result["estimated_total_rows"], 50, delta=10)
+        by_output = {rule["output"]: rule for rule in result["rules"]}
+        self.assertEqual(by_output["outfield1"]["error_rate"], 0.0)
+        self.assertEqual(by_output["bad"]["error_rate"], 1.0)
+        self.assertIn("ERROR in", by_output["bad"]["example"])
+        self.assertGreater(result["rows_per_sec"], 0)
+        # Rounded to milliseconds, a 50-row projection can be 0.0.
+        self.assertGreaterEqual(result["projected_seconds"], 0)
+
+    def test_dry_run_reservoir_sample_counts_rows(self):
+        input_path, ref_path = self._write_dry_run_files(rows=200)
+
+        engine = TransformationEngine(self.rules_json_path)
+        result = engine.dry_run(input_path, ref_path, sample_size=20, mode="reservoir", seed=7)
+        again = engine.dry_run(input_path, ref_path, sample_size=20, mode="reservoir", seed=7)
+
+        self.assertEqual(result["sample_rows"], 20)
+        self.assertEqual(result["estimated_total_rows"], 200)
+        self.assertEqual(result["rules"], again["rules"])
+        self.assertEqual(result["error_rate"], 0.0)
+
+    def test_dry_run_invalid_mode(self):
+        input_path, ref_path = self._write_dry_run_files(rows=5)
+        with self.assertRaises(ValueError):
+            TransformationEngine(self.rules_json_path).dry_run(input_path, ref_path, mode="tail")
+
+    def test_filter_rules_drop_rows_before_evaluation(self):
+        rules = [
+            {"type": "filter", "formula": "field3 >= 10"},
+            {"type": "filter", "formula": "refdata4 != 2"},
+            {"output": "outfield1", "formula": "field1 + field2"},
+            {"output": "outfield5", "formula": "max(field5, refdata4)"},
+        ]
+        rules_path = os.path.join(self.temp_dir.name, "filter_rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(rules, f)
+        input_path, ref_path = self._write_dry_run_files(rows=50)
+        output_path = os.path.join(self.temp_dir.name, "filtered_output.csv")
+
+        engine = TransformationEngine(rules_path)
+        input_filters, joined_filters = engine._split_filters(["field3", "refkey1"])
+        self.assertEqual([f.formula for f in input_filters], ["field3 >= 10"])
+        self.assertEqual([f.formula for f in joined_filters], ["refdata4 != 2"])
+
+        engine.process_dataframe(input_path, ref_path, output_path)
+
+        df = pd.read_csv(output_path)
+        self.assertEqual(list(df.columns), ["outfield1", "outfield5"])
+        # Rows 10..49 pass the input filter; those with refkey k2 are dropped after the join.
+        self.assertEqual(len(df), 32)
+        self.assertNotIn("A2B2", set(df["outfield1"]))
+        self.assertNotIn("A12B12", set(df["outfield1"]))
+
+    def test_filter_rules_that_drop_everything_keep_header(self):
+        rules = [
+            {"type": "filter", "formula": "field3 > 1000"},
+            {"output": "outfield1", "formula": "field1 + field2"},
+        ]
+        rules_path = os.path.join(self.temp_dir.name, "filter_rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(rules, f)
+        input_path, ref_path = self._write_dry_run_files(rows=5)
+        output_path = os.path.join(self.temp_dir.name, "empty_output.csv")
+
+        TransformationEngine(rules_path).process_dataframe(input_path, ref_path, output_path)
+
+        with open(output_path) as f:
+            self.assertEqual(f.read(), "outfield1\n")
+
+    def test_dry_run_reports_filter_selectivity(self):
+        rules = [
+            {"type": "filter", "formula": "field3 < 5"},
+            {"type": "filter", "formula": "unknown > 1"},
+            {"output": "outfield1", "formula": "field1 + field2"},
+        ]
+        rules_path = os.path.join(self.temp_dir.name, "filter_rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(rules, f)
+        input_path, ref_path = self._write_dry_run_files(rows=10)
+
+        result = TransformationEngine(rules_path).dry_run(input_path, ref_path, sample_size=10)
+
+        self.assertEqual(result["output_rows"], 0)
+        self.assertEqual(result["filters"][0]["stage"], "input")
+        self.assertEqual(result["filters"][0]["pass_rate"], 0.5)
+        self.assertEqual(result["filters"][1]["stage"], "joined")
+        self.assertEqual(result["filters"][1]["errors"], 10)
+
+    def test_aggregate_rules_write_one_row_per_group(self):
+        rules = [
+            {"type": "filter", "formula": "field3 >= 5"},
+            {"output": "scaled", "formula": "field3 * 2"},
+            {"type": "aggregate", "output": "rows", "function": "count", "group_by": ["refkey1"]},
+            {"type": "aggregate", "output": "total", "function": "sum", "formula": "scaled", "group_by": ["refkey1"]},
+            {"type": "aggregate", "output": "top", "function": "max", "formula": "refdata4 + field3", "group_by": ["refkey1"]},
+        ]
+        rules_path = os.path.join(self.temp_dir.name, "aggregate_rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(rules, f)
+        input_path, ref_path = self._write_dry_run_files(rows=20)
+        output_path = os.path.join(self.temp_dir.name, "aggregate_output.csv")
+
+        TransformationEngine(rules_path).process_dataframe(input_path, ref_path, output_path)
+
+        df = pd.read_csv(output_path).set_index("refkey1")
+        self.assertEqual(list(df.columns), ["rows", "total", "top"])
+        self.assertEqual(len(df), 5)
+        # Rows 5..19 pass the filter; key k0 gets rows 5, 10 and 15.
+        self.assertEqual(df.loc["k0", "rows"], 3)
+        self.assertEqual(df.loc["k0", "total"], (5 + 10 + 15) * 2)
+        self.assertEqual(df.loc["k4", "top"], 4 + 19)
+
+    def test_process_batch_matches_separate_runs(self):
+        summary_rules = [
+            {"type": "filter", "formula": "field3 < 30"},
+            {"type": "aggregate", "output": "total", "function": "sum", "formula": "field3", "group_by": ["refkey1"]},
+        ]
+        summary_path = os.path.join(self.temp_dir.name, "summary_rules.json")
+        with open(summary_path, "w") as f:
+            json.dump(summary_rules, f)
+        input_path, ref_path = self._write_dry_run_files(rows=40)
+
+        engines = [TransformationEngine(self.rules_json_path), TransformationEngine(summary_path)]
+        batch_outputs = [os.path.join(self.temp_dir.name, f"batch_{i}.csv") for i in range(2)]
+        single_outputs = [os.path.join(self.temp_dir.name, f"single_{i}.csv") for i in range(2)]
+
+        process_batch(input_path, ref_path, list(zip(engines, batch_outputs)))
+        for engine, output_path in zip(engines, single_outputs):
+            engine.process_dataframe(input_path, ref_path, output_path)
+
+        for batch_path, single_path in zip(batch_outputs, single_outputs):
+            with open(batch_path) as batch, open(single_path) as single:
+                self.assertEqual(batch.read(), single.read())
+
+    def test_rules_read_other_outputs(self):
+        rules = [
+            {"output": "base", "formula": "field3 * max(field5, refdata4)", "intermediate": True},
+            {"output": "fee", "formula": "round(field3 * max(field5, refdata4) / 10, 2)"},
+            {"output": "total", "formula": "base + fee"},
+            {"output": "ratio", "formula": "round(field3 / refdata4, 2)"},
+            {"output": "scaled", "formula": "round(field3 / refdata4, 2) * 100"},
+            {"output": "shifted", "formula": "ratio + refdata4"},
+            {"output": "level", "formula": "round(field3 / refdata4, 2) if refdata4 else -1"},
+        ]
+        rules_path = os.path.join(self.temp_dir.name, "dependent_rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(rules, f)
+        input_path, ref_path = self._write_dry_run_files(rows=10)
+        output_path = os.path.join(self.temp_dir.name, "dependent_output.csv")
+
+        engine = TransformationEngine(rules_path)
+        engine.process_dataframe(input_path, ref_path, output_path)
+
+        df = pd.read_csv(output_path)
+        self.assertEqual(list(df.columns), ["fee", "total", "ratio", "scaled", "shifted", "level"])
+        row = df.iloc[6]
+        self.assertAlmostEqual(row["fee"], round(6 * 9.0 / 10, 2))
+        self.assertAlmostEqual(row["total"], 6 * 9.0 + round(6 * 9.0 / 10, 2))
+        self.assertEqual(float(row["ratio"]), 6.0)
+        self.assertEqual(float(row["scaled"]), 600.0)
+        self.assertEqual(float(row["shifted"]), 7.0)
+        self.assertEqual(row["level"], 6.0)
+        # A failed shared sub-expression fails each rule with its own formula's error.
+        row = df.iloc[5]
+        self.assertTrue(row["ratio"].startswith("ERROR in 'round(field3 / refdata4, 2)': division by zero"))
+        self.assertTrue(row["scaled"].startswith("ERROR in 'round(field3 / refdata4, 2) * 100'"))
+        self.assertEqual(row["shifted"], "ERROR in 'ratio + refdata4': output 'ratio' failed")
+        self.assertEqual(row["level"], -1)
+
+        result = engine.dry_run(input_path, ref_path, sample_size=10)
+        by_output = {rule["output"]: rule for rule in result["rules"]}
+        self.assertTrue(by_output["base"]["intermediate"])
+        self.assertEqual(by_output["shifted"]["error_rate"], 0.2)
+
+    def test_outputs_that_shadow_columns_leave_the_rules_above_them_unchanged(self):
+        rules = [
+            {"output": "early", "formula": "field3 * 10"},
+            {"output": "field3", "formula": "field3 + 1"},
+            {"output": "late", "formula": "field3 * 10"},
+            {"output": "bump", "formula": "(field3 + 1) * 2"},
+            # Swapped names: each rule reads the other's input column unless that rule is above it.
+            {"output": "refdata4", "formula": "field5 + 1"},
+            {"output": "field5", "formula": "refdata4 + 1"},
+        ]
+        input_path, ref_path = self._write_dry_run_files(rows=10)
+
+        def run(rules, name):
+            rules_path = os.path.join(self.temp_dir.name, f"{name}_rules.json")
+            output_path = os.path.join(self.temp_dir.name, f"{name}_output.csv")
+            with open(rules_path, "w") as f:
+                json.dump(rules, f)
+            TransformationEngine(rules_path).process_dataframe(input_path, ref_path, output_path)
+            return pd.read_csv(output_path)
+
+        df = run(rules, "shadowed")
+        # Rules that read no other output are evaluated on the columns alone, as before outputs could be read.
+        baseline = run([rules[0], rules[1], rules[4]], "baseline")
+        for column in baseline.columns:
+            self.assertEqual(df[column].tolist(), baseline[column].tolist())
+        for i, row in df.iterrows():
+            self.assertEqual((row["early"], row["field3"], row["late"], row["bump"]),
+                             (i * 10, i + 1, (i + 1) * 10, (i + 2) * 2))
+            self.assertEqual((row["refdata4"], row["field5"]), (i * 1.5 + 1, i * 1.5 + 2))
@@ -5,7 +5,8 @@ import json
 import pandas as pd
 
 from django.test import TestCase
-from app.utils import generate_report_task
+from unittest.mock import patch
+from app.utils import generate_report_task, generate_batch_report_task
 
 
 class GenerateReportTaskTest(TestCase):
@@ -42,3 +43,38 @@ class GenerateReportTaskTest(TestCase):
             if os.path.exists(file_path):
                 os.remove(file_path)
         os.rmdir(self.temp_dir)
+
+
+class GenerateBatchReportTaskTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.temp_dir.name, "input.csv")
+        self.ref_path = os.path.join(self.temp_dir.name, "reference.csv")
+
+        with open(self.input_path, "w") as f:
+            f.write("data1,data2,refkey1,refkey2\n10,20,R1,R2\n1,2,R1,R2")
+        with open(self.ref_path, "w") as f:
+            f.write("refkey1,refkey2,refdata1,refdata2,refdata3,refdata4\nR1,R2,X,Y,Z,99")
+
+        self.reports = []
+        for i, rules in enumerate([
+            [{"output": "sum", "formula": "data1 + data2"}],
+            [{"output": "product", "formula": "data1 * refdata4"}],
+        ]):
+            rules_path = os.path.join(self.temp_dir.name, f"rules_{i}.json")
+            with open(rules_path, "w") as f:
+                json.dump(rules, f)
+            self.reports.append([f"report-{i}", rules_path, os.path.join(self.temp_dir.name, f"output_{i}.csv")])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_batch_writes_one_output_per_rule_set(self):
+        with patch.object(generate_batch_report_task, "_backend") as backend:
+            result = generate_batch_report_task(self.input_path, self.ref_path, self.reports)
+
+        self.assertEqual(set(result), {"report-0", "report-1"})
+        self.assertEqual(list(pd.read_csv(result["report-0"])["sum"]), [30, 3])
+        self.assertEqual(list(pd.read_csv(result["report-1"])["product"]), [990, 99])
+        backend.mark_as_done.assert_any_call("report-0", result["report-0"])
+        backend.mark_as_done.assert_any_call("report-1", result["report-1"])
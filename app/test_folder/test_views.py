@@ -1,14 +1,21 @@
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
+from django.test import override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from unittest.mock import patch
 from users.models import CustomUser
+from app.models import ReportRun
 from rest_framework_simplejwt.tokens import RefreshToken
+import json
 import tempfile
+import threading
+import time
 from unittest.mock import patch, MagicMock
 import os
 
+from app import notifications
+
 
 class ReportGenerationTests(APITestCase):
     def setUp(self):
@@ -65,6 +72,53 @@ class ReportGenerationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn("task_id", response.data)
 
+    @patch("app.views.generate_report_task.apply_async")
+    def test_generate_report_deduplicates_uploads(self, mock_task):
+        mock_task.return_value.id = "task"
+        url = reverse("generate-report")
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for i in range(2):
+                self.client.post(url, data={
+                    'input': SimpleUploadedFile("input.csv", f"id,value\n{i},10".encode()),
+                    'reference': SimpleUploadedFile("reference.csv", b"refkey1,refdata1\n1,Data1"),
+                }, format='multipart')
+
+            runs = list(ReportRun.objects.all())
+            self.assertEqual(len({run.reference_sha256 for run in runs}), 1)
+            self.assertEqual(len({run.input_sha256 for run in runs}), 2)
+            first, second = (os.stat(run.reference_path) for run in runs)
+            self.assertEqual(first.st_ino, second.st_ino)
+
+    @patch("app.views.generate_report_task.apply_async")
+    def test_generate_report_routes_by_size(self, mock_task):
+        mock_task.return_value.id = "task"
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            self.client.post(reverse("generate-report"), data={
+                'input': SimpleUploadedFile("input.csv", b"id,value\n1,10\n2,20"),
+                'reference': SimpleUploadedFile("reference.csv", b"refkey1,refdata1\n1,Data1"),
+            }, format='multipart')
+
+        self.assertEqual(mock_task.call_args.kwargs, {"queue": "reports_small", "priority": 0})
+        run = ReportRun.objects.get()
+        self.assertEqual((run.user, run.estimated_rows, run.queue), (self.user, 2, "reports_small"))
+
+    @override_settings(REPORT_MAX_ACTIVE_PER_USER=1, REPORT_COST_PER_SECOND=10)
+    @patch("app.views.generate_report_task.apply_async")
+    def test_generate_report_rejected_when_user_is_busy(self, mock_task):
+        ReportRun.objects.create(
+            report_name="busy", task_id="busy", user=self.user, status=ReportRun.STATUS_RUNNING, estimated_cost=25,
+        )
+        response = self.client.post(reverse("generate-report"), data={
+            'input': self.input_file,
+            'reference': self.reference_file,
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "3")
+        self.assertEqual(response.data["retry_after"], 3)
+        mock_task.assert_not_called()
+        self.assertEqual(ReportRun.objects.count(), 1)
+
     def test_upload_rules(self):
         url = reverse("upload_rules") + "?type=json"
         response = self.client.post(url, data={
@@ -108,6 +162,19 @@ class ReportGenerationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.data['error'], "Report file not found.")
 
+    @patch("app.views.AsyncResult")
+    def test_download_evicted_report(self, mock_async_result):
+        output_path = "/fake/path/evicted_output.csv"
+        ReportRun.objects.create(report_name="old", task_id="old-task", output_path=output_path,
+                                 status=ReportRun.STATUS_EVICTED)
+        mock_result = MagicMock()
+        mock_result.ready.return_value = True
+        mock_result.get.return_value = output_path
+        mock_async_result.return_value = mock_result
+
+        response = self.client.get(reverse("download-report", args=["old-task"]))
+
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
 
     @patch("os.path.exists", return_value=True)
     @patch("builtins.open", new_callable=MagicMock)
@@ -129,7 +196,124 @@ class ReportGenerationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response['Content-Type'], 'text/csv')
         self.assertEqual(response['Content-Disposition'], f'attachment; filename="{os.path.basename(output_path)}"')
-        
+
+    def test_dry_run_with_uploaded_rules(self):
+        url = reverse("dry-run")
+        reference_file = SimpleUploadedFile(
+            "reference.csv", b"refkey1,refdata1,refkey2,refdata2,refdata3,refdata4\n1,Data1,2,x,y,3", content_type="text/csv"
+        )
+        response = self.client.post(url, data={
+            'input': self.input_file,
+            'reference': reference_file,
+            'rules': self.rules_file,
+            'sample_size': 1,
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["sample_rows"], 1)
+        self.assertEqual(response.data["rules"][0]["output"], "sum")
+        self.assertEqual(response.data["rules"][0]["error_rate"], 0.0)
+        self.assertIn("projected_seconds", response.data)
+
+    def test_dry_run_rejects_invalid_sample_size(self):
+        url = reverse("dry-run")
+        response = self.client.post(url, data={
+            'input': self.input_file,
+            'reference': self.reference_file,
+            'sample_size': 0,
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("sample_size", response.data["error"])
+
+    @patch("app.views.AsyncResult")
+    def test_dry_run_result_pending(self, mock_async_result):
+        mock_async_result.return_value.ready.return_value = False
+        mock_async_result.return_value.status = "PENDING"
+
+        response = self.client.get(reverse("dry-run-result", args=["fake-task-id"]))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], "PENDING")
+
+
+class RuleVersionViewTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="rules@example.com", password="testpass123", name="Rules User")
+        self.client.force_authenticate(user=self.user)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(RULES_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def upload(self, content, file_type="json"):
+        rules_file = SimpleUploadedFile(f"rules.{file_type}", content)
+        return self.client.post(reverse("upload_rules") + f"?type={file_type}", data={'file': rules_file}, format='multipart')
+
+    def test_upload_activates_new_version(self):
+        first = self.upload(b'[{"output": "sum", "formula": "value + 1"}]')
+        second = self.upload(b'- output: sum\n  formula: value + 2\n', file_type="yaml")
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(first.data["version"], second.data["version"])
+
+        response = self.client.get(reverse("rule-versions"))
+        self.assertEqual(response.data["active"], second.data["version"])
+        self.assertEqual(len(response.data["versions"]), 2)
+
+    def test_upload_rejects_invalid_formula(self):
+        response = self.upload(b'[{"output": "sum", "formula": "value +"}]')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("invalid formula", response.data["error"])
+        self.assertEqual(self.client.get(reverse("rule-versions")).data["versions"], [])
+
+    @patch("app.views.generate_batch_report_task.apply_async")
+    def test_generate_batch_report(self, mock_delay):
+        mock_delay.return_value.id = "batch-task-id"
+        version = self.upload(b'[{"output": "sum", "formula": "value + 1"}]').data["version"]
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post(reverse("generate-batch-report"), data={
+                'input': SimpleUploadedFile("input.csv", b"id,value\n1,10"),
+                'reference': SimpleUploadedFile("reference.csv", b"refkey1,refkey2\n1,2"),
+                'rules': [SimpleUploadedFile("rules.json", b'[{"output": "double", "formula": "value * 2"}]')],
+                'versions': [version],
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["task_id"], "batch-task-id")
+        self.assertEqual(len(response.data["reports"]), 2)
+        self.assertEqual(response.data["reports"][0]["rules_version"], version)
+
+        input_path, ref_path, reports = mock_delay.call_args.args[0]
+        self.assertEqual([r[0] for r in reports], [r["report_id"] for r in response.data["reports"]])
+        self.assertEqual(len({r[2] for r in reports}), 2)
+
+    def test_generate_batch_report_unknown_version(self):
+        response = self.client.post(reverse("generate-batch-report"), data={
+            'input': SimpleUploadedFile("input.csv", b"id,value\n1,10"),
+            'reference': SimpleUploadedFile("reference.csv", b"refkey1,refkey2\n1,2"),
+            'versions': ["unknown"],
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_activate_previous_version(self):
+        first = self.upload(b'[{"output": "sum", "formula": "value + 1"}]').data["version"]
+        self.upload(b'[{"output": "sum", "formula": "value + 2"}]')
+
+        response = self.client.post(reverse("activate-rule-version", args=[first]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse("rule-versions")).data["active"], first)
+
+        response = self.client.post(reverse("activate-rule-version", args=["unknown"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class TriggerScheduleReportViewTestCase(APITestCase):
     def setUp(self):
         self.user = CustomUser.objects.create_user(email="testuser@example.com", password="testpass123", name="Test User")
@@ -154,7 +338,7 @@ class TriggerScheduleReportViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("Invalid cron format", response.data["error"])
 
-    @patch("app.views.generate_report_task.delay")
+    @patch("app.views.generate_scheduled_report_task.apply_async")
     @patch("app.views.CrontabSchedule.objects.get_or_create")
     @patch("app.views.PeriodicTask.objects.create")
     def test_generic_exception_handling(self, mock_create, mock_cron, mock_task):
@@ -163,3 +347,137 @@ class TriggerScheduleReportViewTestCase(APITestCase):
         response = self.client.post(self.url, data=data, format="multipart")
         self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
         self.assertIn("error", response.data)
+
+
+class ReportRunViewTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="runs@example.com", password="testpass123", name="Runs")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.temp_dir.name, "done_output.csv")
+        with open(self.output_path, "w") as f:
+            f.write("sum\n30\n")
+        self.done = ReportRun.objects.create(
+            report_name="done", task_id="task-done", status=ReportRun.STATUS_COMPLETED,
+            output_path=self.output_path, rows_read=1, rows_written=1,
+        )
+        ReportRun.objects.filter(pk=self.done.pk).update(completed_at=self.done.created_at)
+        for i in range(3):
+            ReportRun.objects.create(report_name=f"run{i}", task_id=f"task-{i}", status=ReportRun.STATUS_RUNNING)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_list_is_paginated_and_filtered(self):
+        response = self.client.get(reverse("report-runs"), {"page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+        response = self.client.get(reverse("report-runs"), {"status": "Completed"})
+        self.assertEqual([run["task_id"] for run in response.data["results"]], ["task-done"])
+
+    def test_status_lookup(self):
+        response = self.client.get(reverse("report-run", args=["task-done"]))
+        self.assertEqual(response.data["status"], "Completed")
+        self.assertEqual(response.data["rows_written"], 1)
+        self.assertNotIn("output_path", response.data)
+
+        response = self.client.get(reverse("report-run", args=["unknown"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_status_lookup(self):
+        response = self.client.post(
+            reverse("report-runs-status"), {"task_ids": ["task-0", "task-done", "unknown"]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({run["task_id"] for run in response.data["reports"]}, {"task-0", "task-done"})
+        self.assertEqual(response.data["missing"], ["unknown"])
+
+        response = self.client.post(reverse("report-runs-status"), {"task_ids": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_runs_of_other_users_are_hidden(self):
+        other = CustomUser.objects.create_user(email="other@example.com", password="testpass123", name="Other")
+        ReportRun.objects.create(report_name="mine", task_id="task-mine", user=self.user)
+        ReportRun.objects.create(report_name="theirs", task_id="task-theirs", user=other)
+
+        listed = {run["task_id"] for run in self.client.get(reverse("report-runs")).data["results"]}
+        self.assertIn("task-mine", listed)
+        self.assertNotIn("task-theirs", listed)
+        self.assertEqual(self.client.get(reverse("report-run", args=["task-theirs"])).status_code, 404)
+        response = self.client.post(reverse("report-runs-status"), {"task_ids": ["task-theirs"]}, format="json")
+        self.assertEqual(response.data["missing"], ["task-theirs"])
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("report-run", args=["task-theirs"])).status_code, 200)
+
+    @patch("app.views.AsyncResult")
+    def test_download_answers_from_database(self, mock_async_result):
+        response = self.client.get(reverse("download-report", args=["task-done"]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), b"sum\n30\n")
+
+        response = self.client.get(reverse("download-report", args=["task-0"]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], "Running")
+        mock_async_result.assert_not_called()
+
+
+@override_settings(REPORT_EVENTS_URL="memory://", REPORT_EVENTS_HEARTBEAT_SECONDS=0.05)
+class ReportRunNotificationViewTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="events@example.com", password="testpass123", name="Events")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        ReportRun.objects.create(report_name="run", task_id="task-run", status=ReportRun.STATUS_RUNNING)
+        ReportRun.objects.create(report_name="done", task_id="task-done", status=ReportRun.STATUS_COMPLETED)
+
+    def publish_later(self, event, delay=0.1):
+        timer = threading.Timer(delay, notifications.publish, args=["task-run", event])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_wait_returns_on_state_change(self):
+        self.publish_later({"task_id": "task-run", "status": "Completed", "rows_read": 3})
+        started = time.monotonic()
+        response = self.client.get(reverse("report-run-wait", args=["task-run"]), {"timeout": 5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "Completed")
+        self.assertLess(time.monotonic() - started, 4)
+
+    def test_wait_returns_immediately_for_finished_runs_and_times_out(self):
+        response = self.client.get(reverse("report-run-wait", args=["task-done"]))
+        self.assertEqual(response.data["status"], "Completed")
+
+        response = self.client.get(reverse("report-run-wait", args=["task-run"]), {"timeout": 0.05})
+        self.assertEqual(response.data["status"], "Running")
+        self.assertTrue(response.data["timed_out"])
+
+        response = self.client.get(reverse("report-run-wait", args=["unknown"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_event_stream_ends_when_run_finishes(self):
+        self.publish_later({"task_id": "task-run", "status": "Running", "rows_read": 10000})
+        self.publish_later({"task_id": "task-run", "status": "Completed", "rows_read": 12000}, delay=0.2)
+
+        response = self.client.get(reverse("report-run-events", args=["task-run"]), HTTP_ACCEPT="text/event-stream")
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+        self.assertEqual([event["status"] for event in events], ["Running", "Running", "Completed"])
+        self.assertEqual(events[-1]["rows_read"], 12000)
+
+    def test_event_stream_of_a_reused_task_id(self):
+        ReportRun.objects.create(report_name="again", task_id="task-done", status=ReportRun.STATUS_COMPLETED)
+
+        response = self.client.get(reverse("report-run-events", args=["task-done"]), HTTP_ACCEPT="text/event-stream")
+
+        body = b"".join(response.streaming_content).decode()
+        events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+        self.assertEqual([event["status"] for event in events], ["Completed"])
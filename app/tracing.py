@@ -0,0 +1,296 @@
+"""
+Request tracing from the API through the Celery task to the engine stages.
+
+A span times one step and names its parent, so a slow report can be taken
+apart into upload, queue wait, reference load, evaluation and write. Trace
+context follows the W3C `traceparent` format: it is read from incoming HTTP
+requests and passed to Celery tasks in their message headers.
+
+Traces are sampled where they start, with probability
+REPORT_TRACE_SAMPLE_RATE, and the decision travels with the context, so a
+trace is recorded whole or not at all. Unsampled spans cost a context
+variable lookup. Recorded spans are appended to REPORT_TRACE_PATH in the
+OTLP/JSON file format, one export request per line, which an OpenTelemetry
+collector's `otlpjsonfile` receiver can replay later. Tracing is off while
+REPORT_TRACE_PATH is unset.
+"""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from celery import signals
+from django.conf import settings
+
+
+# Spans of a long report are written out in batches rather than held until it ends.
+MAX_BUFFERED_SPANS = 1000
+
+TRACEPARENT = 'traceparent'
+PUBLISHED_HEADER = 'trace_published_ns'
+
+KIND_INTERNAL, KIND_SERVER, KIND_PRODUCER, KIND_CONSUMER = 1, 2, 4, 5
+STATUS_ERROR = 2
+
+
+class SpanContext:
+    """The identity of a span, as passed between processes."""
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id, self.span_id, self.sampled = trace_id, span_id, sampled
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    parts = (value or '').strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        if not int(parts[1], 16) or not int(parts[2], 16):
+            return None
+    except ValueError:
+        return None
+    return SpanContext(parts[1].lower(), parts[2].lower(), bool(flags & 1))
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+def _new_id(size: int) -> str:
+    return f'{random.getrandbits(size * 8) or 1:0{size * 2}x}'
+
+
+# The current Span, or the SpanContext of a remote or unsampled parent.
+_current = contextvars.ContextVar('report_trace_span', default=None)
+_lock = threading.Lock()
+
+
+def current_context() -> Optional[SpanContext]:
+    current = _current.get()
+    return current.context if isinstance(current, Span) else current
+
+
+def _value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _export(spans: List['Span']):
+    if not settings.REPORT_TRACE_PATH or not spans:
+        return
+    line = json.dumps({"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": settings.REPORT_TRACE_SERVICE}},
+            {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+        ]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+    }]})
+    with _lock, open(settings.REPORT_TRACE_PATH, 'a') as f:
+        f.write(line + '\n')
+
+
+class Span:
+    """
+    One recorded step. Spans started under it in this process join its
+    batch, which is exported when the outermost of them ends.
+    """
+
+    def __init__(self, name: str, context: SpanContext, parent_id: Optional[str], kind: int,
+                 attributes: Dict, batch: Optional[List['Span']] = None):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.local_root = batch is None
+        self.batch = [] if batch is None else batch
+        self.start_ns = self.end_ns = 0
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException):
+        self.error = f'{type(error).__name__}: {error}'
+
+    def start(self, start_ns: Optional[int] = None) -> 'Span':
+        self.start_ns = start_ns or time.time_ns()
+        self._token = _current.set(self)
+        return self
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or time.time_ns()
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        self.batch.append(self)
+        if self.local_root or len(self.batch) >= MAX_BUFFERED_SPANS:
+            spans = self.batch[:]
+            del self.batch[:]
+            _export(spans)
+
+    def __enter__(self) -> 'Span':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.set_error(exc)
+        self.end()
+        return False
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class _Unsampled:
+    """Stands in for a span that is not recorded, and keeps the spans under it unrecorded."""
+
+    def __init__(self, context: Optional[SpanContext] = None):
+        self.context = context
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_error(self, error: BaseException):
+        pass
+
+    def start(self, start_ns: Optional[int] = None) -> '_Unsampled':
+        if self.context is not None:
+            self._token = _current.set(self.context)
+        return self
+
+    def end(self, end_ns: Optional[int] = None):
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+
+    def __enter__(self) -> '_Unsampled':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end()
+        return False
+
+
+_NOOP = _Unsampled()
+
+
+def span(name: str, kind: int = KIND_INTERNAL, parent: Optional[SpanContext] = None, **attributes):
+    """
+    A span named `name`, used as a context manager, under the current span
+    or `parent`. Without either, a new trace starts and is sampled.
+    """
+    current = _current.get() if parent is None else parent
+    if isinstance(current, Span):
+        return Span(name, SpanContext(current.context.trace_id, _new_id(8), True), current.context.span_id,
+                    kind, attributes, current.batch)
+    if current is not None:
+        if not current.sampled or not settings.REPORT_TRACE_PATH:
+            return _NOOP if parent is None else _Unsampled(current)
+        return Span(name, SpanContext(current.trace_id, _new_id(8), True), current.span_id, kind, attributes)
+    if not settings.REPORT_TRACE_PATH or random.random() >= settings.REPORT_TRACE_SAMPLE_RATE:
+        return _Unsampled(SpanContext(_new_id(16), _new_id(8), False))
+    return Span(name, SpanContext(_new_id(16), _new_id(8), True), None, kind, attributes)
+
+
+def traced(iterable, name: str, **attributes) -> Iterator:
+    """Iterate over `iterable`, timing the production of each item as a span."""
+    iterator = iter(iterable)
+    while True:
+        with span(name, **attributes):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class TracingMiddleware:
+    """Wrap each API request in a server span, continuing the caller's trace if it sent one."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        parent = parse_traceparent(request.META.get('HTTP_TRACEPARENT'))
+        with span(f'HTTP {request.method}', KIND_SERVER, parent, **{'http.method': request.method}) as server:
+            response = self.get_response(request)
+            if isinstance(server, Span):
+                match = getattr(request, 'resolver_match', None)
+                if match is not None and match.route:
+                    server.name = f'HTTP {request.method} /{match.route}'
+                    server.set_attribute('http.route', match.route)
+                server.set_attribute('http.status_code', response.status_code)
+                response['traceresponse'] = format_traceparent(server.context)
+        return response
+
+
+@signals.before_task_publish.connect
+def _inject(headers=None, **kwargs):
+    context = current_context()
+    if context is not None and headers is not None:
+        headers[TRACEPARENT] = format_traceparent(context)
+        headers[PUBLISHED_HEADER] = time.time_ns()
+
+
+# Spans of the tasks running in this worker, by task id. A task requeued
+# under its own id runs inside itself when tasks are eager, hence the stacks.
+_task_spans = {}
+
+
+def _header(request, name: str):
+    # A worker sees custom headers on the request, an eager task under request.headers.
+    return getattr(request, name, None) or (getattr(request, 'headers', None) or {}).get(name)
+
+
+@signals.task_prerun.connect
+def _start_task(task_id=None, task=None, **kwargs):
+    parent = parse_traceparent(_header(task.request, TRACEPARENT))
+    published_ns = _header(task.request, PUBLISHED_HEADER)
+    if parent is not None and published_ns:
+        span('celery.queue', KIND_CONSUMER, parent).start(int(published_ns)).end()
+    task_span = span(f'celery.task {task.name}', KIND_CONSUMER, parent, **{'celery.task_id': task_id})
+    _task_spans.setdefault(task_id, []).append(task_span.start())
+
+
+@signals.task_failure.connect
+def _fail_task(task_id=None, exception=None, **kwargs):
+    if _task_spans.get(task_id) and exception is not None:
+        _task_spans[task_id][-1].set_error(exception)
+
+
+@signals.task_postrun.connect
+def _end_task(task_id=None, state=None, **kwargs):
+    spans = _task_spans.get(task_id)
+    if not spans:
+        return
+    task_span = spans.pop()
+    if not spans:
+        del _task_spans[task_id]
+    task_span.set_attribute('celery.state', state or '')
+    task_span.end()
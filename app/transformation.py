@@ -1,29 +1,60 @@
-import json
-import yaml
-from typing import Dict, List
+import csv
+import io
+import random
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 import os
+from django.conf import settings
+
+from . import csvreader, reference, refstore, tracing
+from .aggregation import GroupAggregator, group_value
+from .csvwriter import ColumnarCSVWriter
+from .indexing import ReportIndex, index_file
+from .rules import ALLOWED_FUNCTIONS, RuleStep, load_plan
+
+ALL_REF_FIELDS = {'refdata1', 'refdata2', 'refdata3', 'refdata4'}
+ERROR_PREFIX = "ERROR in '"
+
+
+def is_error(value) -> bool:
+    return isinstance(value, str) and value.startswith(ERROR_PREFIX)
+
+
+class ReportInterrupted(Exception):
+    """
+    Raised by a progress callback to stop a report between chunks. Partial
+    output is removed, unless the interruption is `resumable`: then the
+    output is kept up to the last finished chunk, and `outputs` holds the
+    row counts and aggregate state to resume from.
+    """
+
+    def __init__(self, reason: str, resumable: bool = False):
+        super().__init__(reason)
+        self.reason = reason
+        self.resumable = resumable
+        self.outputs = []
+
 
 class TransformationEngine:
     def __init__(self, rules_path: str):
-        self.rules = self._load_rules(rules_path)
-
-    def _load_rules(self, path: str) -> List[Dict]:
-        if path.endswith('.json'):
-            with open(path, 'r') as f:
-                return json.load(f)
-        elif path.endswith('.yaml') or path.endswith('.yml'):
-            with open(path, 'r') as f:
-                return yaml.safe_load(f)
+        self.plan = load_plan(rules_path)
+        self.rules = self.plan.rules
+        if self.plan.linear:
+            self._step_columns = [
+                (step, self.plan.outputs.index(step.output)) for step in self.plan.steps if not step.intermediate
+            ]
         else:
-            raise ValueError("Unsupported rule file format. Use .json or .yaml")
+            self._step_columns = [
+                (step, step.output, step.code, self.plan.outputs.index(step.output)
+                 if step.output in self.plan.outputs else None)
+                for step in self.plan.program
+            ]
 
-    def apply_rules(self, input_row: Dict, reference_row: Dict) -> Dict:
-        output_row = {}
-        allowed_functions = {"max": max, "min": min, "abs": abs, "round": round}
+    def _context(self, input_row: Dict, reference_row: Dict) -> Dict:
+        context = {**input_row, **reference_row, **ALLOWED_FUNCTIONS}
 
-        context = {**input_row, **reference_row, **allowed_functions}
-        
         for key, value in context.items():
             if  isinstance(value, str):
                 try:
@@ -31,52 +62,560 @@ class TransformationEngine:
                 except (ValueError, TypeError):
                     pass
 
-        for rule in self.rules:
-            output_field = rule["output"]
-            formula = rule["formula"]
+        return context
+
+    def _error(self, step: RuleStep, context: Dict, e: Exception) -> str:
+        involved_values = {k: context.get(k) for k in context if k in step.formula}
+        return f"ERROR in '{step.formula}': {str(e)} | Values: {involved_values}"
+
+    def _run(self, scope: Dict, columns: Optional[List[list]] = None, position: int = 0):
+        """
+        Evaluate the plan's program in dependency order, adding each value to
+        `scope` and, with `columns`, storing each output at `position` of its
+        column buffer. A rule that reads an output which failed fails with it;
+        one whose shared sub-expression failed is evaluated from its own
+        formula, so that it fails, or not, as it would have on its own.
+        """
+        failed = None
+        for step, output, code, column in self._step_columns:
+            if failed and not failed.isdisjoint(step.uses):
+                reference = next((name for name in step.references if name in failed), None)
+                code = step.source_code if reference is None else None
+                if code is None:
+                    failed.add(output)
+                    if step.temporary:
+                        continue
+                    value = f"{ERROR_PREFIX}{step.formula}': output '{reference}' failed"
+            if code is not None:
+                try:
+                    value = eval(code, {}, scope)
+                except Exception as e:
+                    if failed is None:
+                        failed = set()
+                    failed.add(output)
+                    if step.temporary:
+                        continue
+                    value = self._error(step, scope, e)
+            scope[output] = value
+            if column is not None and columns is not None:
+                columns[column][position] = value
+
+    def _values(self, context: Dict) -> Dict:
+        """The value of every formula rule, intermediate ones included, for one row."""
+        if not self.plan.linear:
+            # The context is shared by every report of a batch, so computed values go in a copy.
+            scope = dict(context)
+            self._run(scope)
+            return {step.output: scope[step.output] for step in self.plan.steps}
 
+        output_row = {}
+        for step in self.plan.steps:
             try:
-                output_row[output_field] = eval(formula, {}, context)
+                output_row[step.output] = eval(step.code, {}, context)
             except Exception as e:
-                involved_values = {k: context.get(k) for k in context if k in formula}
-                output_row[output_field] = (
-                    f"ERROR in '{formula}': {str(e)} | Values: {involved_values}"
-                )
+                output_row[step.output] = self._error(step, context, e)
 
         return output_row
 
+    def _evaluate(self, context: Dict) -> Dict:
+        if not self.plan.linear:
+            scope = dict(context)
+            self._run(scope)
+            return {output: scope[output] for output in self.plan.outputs}
+        values = self._values(context)
+        if len(values) == len(self.plan.outputs):
+            return values
+        return {output: values[output] for output in self.plan.outputs}
 
+    def _evaluate_into(self, context: Dict, columns: List[list], position: int):
+        """Like _evaluate, but store each output at `position` of its column buffer."""
+        if not self.plan.linear:
+            self._run(dict(context), columns, position)
+            return
 
-    def process_dataframe(self, input_path: str, ref_path: str, output_path: str):
-        ref_df = pd.read_csv(ref_path)
+        for step, column in self._step_columns:
+            try:
+                columns[column][position] = eval(step.code, {}, context)
+            except Exception as e:
+                columns[column][position] = self._error(step, context, e)
+
+    def apply_rules(self, input_row: Dict, reference_row: Dict) -> Dict:
+        return self._evaluate(self._context(input_row, reference_row))
+
+    def _split_filters(self, input_columns) -> Tuple[List[RuleStep], List[RuleStep]]:
+        """
+        Split filter rules into those that only read input columns, which run
+        on the parsed chunk before the reference join, and those that need the
+        joined reference fields.
+        """
+        input_columns = set(input_columns)
+        input_filters, joined_filters = [], []
+        for step in self.plan.filters:
+            if set(step.columns) <= input_columns:
+                input_filters.append(step)
+            else:
+                joined_filters.append(step)
+        return input_filters, joined_filters
+
+    def _passes(self, filters: List[RuleStep], context: Dict) -> bool:
+        # A predicate that cannot be evaluated excludes the row, as NULL does in SQL.
+        for step in filters:
+            try:
+                if not eval(step.code, {}, context):
+                    return False
+            except Exception:
+                return False
+        return True
+
+    def _filter_mask(self, chunk: pd.DataFrame, filters: List[RuleStep]) -> np.ndarray:
+        columns = list(dict.fromkeys(c for step in filters for c in step.columns))
+        if not columns:
+            return np.full(len(chunk), self._passes(filters, dict(ALLOWED_FUNCTIONS)))
+        return np.fromiter(
+            (
+                self._passes(filters, self._context(dict(zip(columns, values)), {}))
+                for values in zip(*(chunk[c] for c in columns))
+            ),
+            dtype=bool,
+            count=len(chunk),
+        )
+
+    def _load_reference(self, ref_path: str, keys1=None, keys2=None) -> Tuple[Dict, Dict]:
+        """
+        Index the reference file by refkey1 and refkey2. When keys are given,
+        only reference rows matching one of them are kept. A stored version
+        is read as its base with its deltas applied.
+        """
+        version = refstore.open_version(ref_path)
+        if version is not None:
+            ref_path = version.base_path
+        if keys1 is None and keys2 is None:
+            ref_df = pd.read_csv(ref_path)
+        else:
+            ref_df = pd.concat([
+                chunk[chunk['refkey1'].isin(keys1 or ()) | chunk['refkey2'].isin(keys2 or ())]
+                for chunk in pd.read_csv(ref_path, chunksize=100000)
+            ])
         ref_dict1 = ref_df.set_index('refkey1').to_dict(orient='index')
         ref_dict2 = ref_df.set_index('refkey2').to_dict(orient='index')
+        if version is not None:
+            kinds = {name: dtype.kind for name, dtype in ref_df.dtypes.items()}
+            refstore.apply_to_dicts(version.changes(kinds), ref_dict1, ref_dict2)
+        return ref_dict1, ref_dict2
+
+    def _reference_row(self, input_row: Dict, ref_dict1: Dict, ref_dict2: Dict) -> Dict:
+        ref_row = {}
+
+        ref1_data = ref_dict1.get(input_row.get("refkey1"), {})
+        ref2_data = ref_dict2.get(input_row.get("refkey2"), {})
+        ref_row.update(ref1_data)
+        ref_row.update(ref2_data)
+        return self._complete_reference_row(ref_row)
+
+    def _complete_reference_row(self, ref_row: Dict) -> Dict:
+        for field in ALL_REF_FIELDS:
+            if field not in ref_row:
+                ref_row[field] = 0 if field == "refdata4" else f"MISSING_{field}"
+
+        return ref_row
+
+    def _new_aggregator(self) -> Optional[GroupAggregator]:
+        if not self.plan.aggregates:
+            return None
+        return GroupAggregator(self.plan.group_by, [step.function for step in self.plan.aggregates])
+
+    def _aggregate_row(self, aggregator: GroupAggregator, input_row: Dict, ref_row: Dict, context: Dict):
+        row_values = {**input_row, **ref_row}
+        if self.plan.aggregates_use_outputs:
+            outputs = self._values(context)
+            context = {**context, **outputs}
+            row_values.update(outputs)
+
+        key = tuple(group_value(row_values.get(column)) for column in self.plan.group_by)
+        values = []
+        for i, step in enumerate(self.plan.aggregates):
+            try:
+                values.append(eval(step.code, {}, context))
+            except Exception:
+                aggregator.errors[i] += 1
+                values.append(None)
+        aggregator.add(key, values)
 
-        all_ref_fields = {'refdata1', 'refdata2', 'refdata3', 'refdata4'}
+    def _write_aggregates(self, aggregator: GroupAggregator, output_path: str):
+        rows = [list(key) + values for key, values in aggregator.results()]
+        pd.DataFrame(rows, columns=self.plan.columns).to_csv(output_path, index=False)
 
-        if os.path.exists(output_path):
+    def process_dataframe(self, input_path: str, ref_path: str, output_path: str, start: int = 0,
+                          aggregate_state: Optional[Dict] = None,
+                          progress: Optional[Callable[[int], None]] = None,
+                          skip_rows: int = 0, index_columns: Optional[List[str]] = None) -> 'ReportOutput':
+        """
+        Write the report for `input_path` to `output_path`. With a byte offset
+        `start` or a number of `skip_rows`, only the input rows after them are
+        processed and appended to the existing output, continuing from
+        `aggregate_state` for summary reports. With `index_columns`, the rows
+        are indexed on those columns as they are written. Returns the finished
+        ReportOutput with its row counts.
+        """
+        return process_batch(
+            input_path, ref_path, [(self, output_path)], start, [aggregate_state], progress, skip_rows,
+            [index_columns],
+        )[0]
+
+    def _sample_input(self, input_path: str, sample_size: int, mode: str = 'head',
+                      seed: Optional[int] = None) -> Tuple[pd.DataFrame, float]:
+        """
+        Return `sample_size` input rows and the estimated number of rows in the file.
+        'head' reads only the first rows and extrapolates from their byte size,
+        'reservoir' draws a uniform sample in one streaming pass and counts exactly.
+        """
+        if mode == 'head':
+            with open(input_path, 'rb') as f:
+                header_bytes = len(f.readline())
+                sampled_bytes = sampled_rows = 0
+                while sampled_rows < sample_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    sampled_bytes += len(line)
+                    sampled_rows += 1
+
+            sample_df = pd.read_csv(input_path, nrows=sample_size)
+            data_bytes = os.path.getsize(input_path) - header_bytes
+            estimated_rows = data_bytes / (sampled_bytes / sampled_rows) if sampled_rows else 0
+            return sample_df, estimated_rows
+
+        if mode == 'reservoir':
+            rng = random.Random(seed)
+            reservoir = []
+            with open(input_path, 'r', newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader, [])
+                seen = 0
+                for record in reader:
+                    seen += 1
+                    if len(reservoir) < sample_size:
+                        reservoir.append(record)
+                    else:
+                        slot = rng.randrange(seen)
+                        if slot < sample_size:
+                            reservoir[slot] = record
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(header)
+            writer.writerows(reservoir)
+            buffer.seek(0)
+            return pd.read_csv(buffer), seen
+
+        raise ValueError("Unsupported sample mode. Use 'head' or 'reservoir'.")
+
+    def dry_run(self, input_path: str, ref_path: str, sample_size: int = 1000, mode: str = 'head',
+                seed: Optional[int] = None) -> Dict:
+        """
+        Run the rules over a sample of the input and report the per-rule error rate,
+        the measured throughput and the projected runtime for the whole file.
+        """
+        started = time.perf_counter()
+        sample_df, estimated_rows = self._sample_input(input_path, sample_size, mode, seed)
+        sample_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        keys1 = set(sample_df['refkey1']) if 'refkey1' in sample_df else set()
+        keys2 = set(sample_df['refkey2']) if 'refkey2' in sample_df else set()
+        ref_dict1, ref_dict2 = self._load_reference(ref_path, keys1, keys2)
+        reference_seconds = time.perf_counter() - started
+
+        input_filters, _ = self._split_filters(sample_df.columns)
+        filters = [
+            {"step": step, "stage": 'input' if step in input_filters else 'joined', "passed": 0, "errors": 0}
+            for step in self.plan.filters
+        ]
+        errors = {step.output: 0 for step in self.plan.steps}
+        examples = {}
+        kept_rows = 0
+        aggregator = self._new_aggregator()
+        started = time.perf_counter()
+        for _, row in sample_df.iterrows():
+            input_row = row.to_dict()
+            ref_row = self._reference_row(input_row, ref_dict1, ref_dict2)
+            context = self._context(input_row, ref_row)
+
+            kept = True
+            for stats in filters:
+                step = stats["step"]
+                try:
+                    scope = self._context(input_row, {}) if stats["stage"] == 'input' else context
+                    if eval(step.code, {}, scope):
+                        stats["passed"] += 1
+                    else:
+                        kept = False
+                except Exception as e:
+                    stats["errors"] += 1
+                    stats.setdefault("example", f"ERROR in '{step.formula}': {str(e)}")
+                    kept = False
+            if not kept:
+                continue
+
+            kept_rows += 1
+            if aggregator is not None:
+                self._aggregate_row(aggregator, input_row, ref_row, context)
+            for field, value in self._values(context).items():
+                if is_error(value):
+                    errors[field] += 1
+                    examples.setdefault(field, value)
+        eval_seconds = time.perf_counter() - started
+
+        rows = len(sample_df)
+        rows_per_sec = rows / eval_seconds if rows and eval_seconds else None
+        projected_seconds = (
+            reference_seconds + estimated_rows / rows_per_sec if rows_per_sec else reference_seconds
+        )
+        evaluated = kept_rows * len(self.plan.steps)
+
+        return {
+            "sample_mode": mode,
+            "sample_rows": rows,
+            "output_rows": kept_rows,
+            "input_bytes": os.path.getsize(input_path),
+            "estimated_total_rows": int(round(estimated_rows)),
+            "estimated_output_rows": int(round(estimated_rows * kept_rows / rows)) if rows else 0,
+            "rows_per_sec": round(rows_per_sec, 1) if rows_per_sec else None,
+            "sample_seconds": round(sample_seconds, 4),
+            "reference_seconds": round(reference_seconds, 4),
+            "eval_seconds": round(eval_seconds, 4),
+            "projected_seconds": round(projected_seconds, 3),
+            "error_rate": round(sum(errors.values()) / evaluated, 4) if evaluated else 0.0,
+            "rules": [
+                {
+                    "output": step.output,
+                    "formula": step.formula,
+                    "intermediate": step.intermediate,
+                    "errors": errors[step.output],
+                    "error_rate": round(errors[step.output] / kept_rows, 4) if kept_rows else 0.0,
+                    "example": examples.get(step.output),
+                }
+                for step in self.plan.steps
+            ],
+            "filters": [
+                {
+                    "formula": stats["step"].formula,
+                    "stage": stats["stage"],
+                    "pass_rate": round(stats["passed"] / rows, 4) if rows else 0.0,
+                    "errors": stats["errors"],
+                    "example": stats.get("example"),
+                }
+                for stats in filters
+            ],
+            "aggregates": [
+                {
+                    "output": step.output,
+                    "function": step.function,
+                    "errors": aggregator.errors[i],
+                    "error_rate": round(aggregator.errors[i] / kept_rows, 4) if kept_rows else 0.0,
+                }
+                for i, step in enumerate(self.plan.aggregates)
+            ],
+            "sample_groups": len(aggregator.groups) if aggregator is not None else None,
+        }
+
+
+class ReportOutput:
+    """
+    Per-report state while a batch shares one pass over the input: the
+    report's filters, its output writer or partial aggregates, and the row
+    index on `index_columns` when one was asked for.
+    """
+
+    def __init__(self, engine: TransformationEngine, output_path: str, append: bool = False,
+                 aggregate_state: Optional[Dict] = None, index_columns: Optional[List[str]] = None):
+        self.engine = engine
+        self.output_path = output_path
+        self.input_filters = self.joined_filters = None
+        self.aggregator = engine._new_aggregator()
+        if self.aggregator is not None and aggregate_state:
+            self.aggregator.merge(GroupAggregator.from_state(aggregate_state))
+        self.partial = None
+        self.rows_read = 0
+        self.rows_written = 0
+        self.initial_size = os.path.getsize(output_path) if append and os.path.exists(output_path) else 0
+        self.index_columns = index_columns
+        self.index = None
+        if index_columns and self.aggregator is None:
+            self.index = ReportIndex(output_path, engine.plan.outputs, index_columns, self.initial_size)
+        self.writer = None
+        if self.aggregator is None:
+            self.writer = ColumnarCSVWriter(output_path, engine.plan.outputs, write_header=not append, index=self.index)
+
+        if not append and os.path.exists(output_path):
             os.remove(output_path)
 
-        reader = pd.read_csv(input_path, chunksize=10000)
-        is_first_chunk = True
+    def input_mask(self, chunk: pd.DataFrame) -> Optional[np.ndarray]:
+        if self.input_filters is None:
+            self.input_filters, self.joined_filters = self.engine._split_filters(chunk.columns)
+        self.partial = self.engine._new_aggregator()
+        return self.engine._filter_mask(chunk, self.input_filters) if self.input_filters else None
+
+    def add_row(self, input_row: Dict, ref_row: Dict, context: Dict):
+        if self.joined_filters and not self.engine._passes(self.joined_filters, context):
+            return
+        if self.partial is not None:
+            self.engine._aggregate_row(self.partial, input_row, ref_row, context)
+        else:
+            self.engine._evaluate_into(context, self.writer.columns, self.writer.reserve())
+
+    def flush_chunk(self):
+        if self.aggregator is not None:
+            self.aggregator.merge(self.partial)
+            return
+        self.rows_written += self.writer.flush()
+
+    def finish(self):
+        if self.aggregator is not None:
+            self.engine._write_aggregates(self.aggregator, self.output_path)
+            self.rows_written = len(self.aggregator.groups)
+            if self.index_columns:
+                index_file(self.output_path, self.engine.plan.columns, self.index_columns)
+        self.close()
+        if self.index is not None:
+            self.index.finish()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.index is not None:
+            self.index.close()
+
+    def aggregate_state(self) -> Optional[Dict]:
+        return self.aggregator.to_state() if self.aggregator is not None else None
+
+    def discard(self):
+        """Undo the rows written by this pass: truncate an appended output, remove a new one."""
+        self.close()
+        if self.initial_size:
+            os.truncate(self.output_path, self.initial_size)
+        elif os.path.exists(self.output_path):
+            os.remove(self.output_path)
+        if self.index is not None and not self.initial_size:
+            self.index.discard()
+
+
+def read_input(input_path: str, start: int = 0, skip_rows: int = 0):
+    """
+    Iterate over the input in chunks, optionally from byte offset `start`
+    (which must be the start of a row) using the column names from the header,
+    and after skipping the first `skip_rows` data rows. Large inputs are
+    parsed in parallel byte ranges.
+    """
+    large = os.path.getsize(input_path) - start >= settings.REPORT_PARALLEL_READ_MIN_BYTES
+    if large and settings.REPORT_READ_WORKERS > 1:
+        yield from csvreader.read_csv_parallel(input_path, start, skip_rows=skip_rows)
+        return
+
+    if not start:
+        skiprows = range(1, skip_rows + 1) if skip_rows else None
+        yield from pd.read_csv(input_path, chunksize=10000, skiprows=skiprows)
+        return
+
+    columns = list(pd.read_csv(input_path, nrows=0).columns)
+    if start >= os.path.getsize(input_path):
+        return
+    with open(input_path, 'rb') as f:
+        f.seek(start)
+        yield from pd.read_csv(f, header=None, names=columns, chunksize=10000, skiprows=skip_rows)
+
+
+def process_batch(input_path: str, ref_path: str, reports: List[Tuple[TransformationEngine, str]],
+                  start: int = 0, aggregate_states: Optional[List[Optional[Dict]]] = None,
+                  progress: Optional[Callable[[int], None]] = None,
+                  skip_rows: int = 0,
+                  index_columns: Optional[List[Optional[List[str]]]] = None) -> List[ReportOutput]:
+    """
+    Produce one output file per (engine, output_path) pair from a single read
+    of the input and reference files. Each chunk is parsed and each row joined
+    to the reference once, however many rule sets are evaluated on it.
+    `progress` is called with the number of input rows read after each chunk,
+    once the chunk's rows are written, and may raise ReportInterrupted.
+    `index_columns` holds, per report, the columns to index its rows on.
+    """
+    aggregate_states = aggregate_states or [None] * len(reports)
+    index_columns = index_columns or [None] * len(reports)
+    outputs = [
+        ReportOutput(engine, output_path, append=start > 0 or skip_rows > 0, aggregate_state=state,
+                     index_columns=columns)
+        for (engine, output_path), state, columns in zip(reports, aggregate_states, index_columns)
+    ]
+    with tracing.span('engine.process_batch', reports=len(reports), input_bytes=os.path.getsize(input_path),
+                      start=start, skip_rows=skip_rows) as batch_span:
+        outputs = _process_batch(input_path, ref_path, outputs, start, progress, skip_rows)
+        batch_span.set_attribute('rows_read', outputs[0].rows_read)
+    return outputs
+
+
+def _process_batch(input_path: str, ref_path: str, outputs: List[ReportOutput], start: int,
+                   progress: Optional[Callable[[int], None]], skip_rows: int) -> List[ReportOutput]:
+    engine = outputs[0].engine
+    version = refstore.open_version(ref_path)
+    base_path = version.base_path if version is not None else ref_path
+    with tracing.span('engine.reference_load', reference_bytes=os.path.getsize(base_path)) as load_span:
+        # Large references are held column-wise and joined a chunk at a time.
+        compact = None
+        if os.path.getsize(base_path) >= settings.REPORT_COMPACT_REFERENCE_MIN_BYTES:
+            compact = reference.CompactReference.load(base_path)
+        if compact is None:
+            ref_dict1, ref_dict2 = engine._load_reference(ref_path)
+        elif version is not None:
+            compact.apply(version.changes(compact.kinds()))
+        load_span.set_attribute('compact', compact is not None)
+        if version is not None:
+            load_span.set_attribute('reference_version', version.version)
+            load_span.set_attribute('reference_deltas', len(version.delta_paths))
+    rows_read = 0
 
-        for chunk in reader:
-            output_data = []
-            for _, row in chunk.iterrows():
-                input_row = row.to_dict()
-                ref_row = {}
+    try:
+        for chunk in tracing.traced(read_input(input_path, start, skip_rows), 'engine.read'):
+            rows_read += len(chunk)
+            with tracing.span('engine.chunk', rows=len(chunk), rows_read=rows_read):
+                with tracing.span('engine.evaluate'):
+                    masks = [output.input_mask(chunk) for output in outputs]
+                    if all(mask is not None for mask in masks):
+                        # Rows that every report filters out are never joined.
+                        keep = np.logical_or.reduce(masks)
+                        chunk = chunk[keep]
+                        masks = [mask[keep] for mask in masks]
 
-                ref1_data = ref_dict1.get(input_row.get("refkey1"), {})
-                ref2_data = ref_dict2.get(input_row.get("refkey2"), {})
-                ref_row.update(ref1_data)
-                ref_row.update(ref2_data)
+                    ref_rows = compact.join(chunk) if compact is not None else None
+                    for position, (_, row) in enumerate(chunk.iterrows()):
+                        input_row = row.to_dict()
+                        if ref_rows is not None:
+                            ref_row = engine._complete_reference_row(ref_rows[position])
+                        else:
+                            ref_row = engine._reference_row(input_row, ref_dict1, ref_dict2)
+                        context = engine._context(input_row, ref_row)
 
-                for field in all_ref_fields:
-                    if field not in ref_row:
-                        ref_row[field] = 0 if field == "refdata4" else f"MISSING_{field}"
+                        for output, mask in zip(outputs, masks):
+                            if mask is None or mask[position]:
+                                output.add_row(input_row, ref_row, context)
 
-                output_row = self.apply_rules(input_row, ref_row)
-                output_data.append(output_row)
+                with tracing.span('engine.write'):
+                    for output in outputs:
+                        output.flush_chunk()
+                if progress is not None:
+                    progress(rows_read)
+    except ReportInterrupted as e:
+        for output in outputs:
+            output.rows_read = rows_read
+            if not e.resumable:
+                output.discard()
+        e.outputs = outputs
+        raise
+    finally:
+        # Flushes what was written before a checkpoint is taken or the error is recorded.
+        for output in outputs:
+            output.close()
 
-            pd.DataFrame(output_data).to_csv(output_path, index=False, mode='a', header=is_first_chunk)
-            is_first_chunk = False
+    with tracing.span('engine.finish'):
+        for output in outputs:
+            output.rows_read = rows_read
+            output.finish()
+    return outputs
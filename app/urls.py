@@ -1,9 +1,32 @@
 from django.urls import path
-from .views import GenerateReportView, UploadRulesView, DownloadReportView, TriggerScheduleReportView
+from .views import (
+    GenerateReportView, GenerateBatchReportView, UploadRulesView, DownloadReportView, TriggerScheduleReportView,
+    DryRunReportView, DryRunResultView, RuleVersionListView, ActivateRuleVersionView,
+    ReportRunListView, ReportRunStatusView, ReportRunBulkStatusView, ReportRunWaitView, ReportRunEventsView,
+    ReportRunCancelView, ReportRowsView, ReportDiffView, ReportDiffResultView, ReferenceListView, ReferenceDeltaView,
+    ReferenceVersionListView,
+)
 
 urlpatterns = [
     path('generate-report/', GenerateReportView.as_view(), name='generate-report'),
+    path('generate-batch-report/', GenerateBatchReportView.as_view(), name='generate-batch-report'),
     path('upload-rules/', UploadRulesView.as_view(), name='upload_rules'),
+    path('rules/versions/', RuleVersionListView.as_view(), name='rule-versions'),
+    path('rules/versions/<str:version>/activate/', ActivateRuleVersionView.as_view(), name='activate-rule-version'),
+    path('references/', ReferenceListView.as_view(), name='references'),
+    path('references/<str:name>/deltas/', ReferenceDeltaView.as_view(), name='reference-deltas'),
+    path('references/<str:name>/versions/', ReferenceVersionListView.as_view(), name='reference-versions'),
+    path('reports/', ReportRunListView.as_view(), name='report-runs'),
+    path('reports/status/', ReportRunBulkStatusView.as_view(), name='report-runs-status'),
+    path('reports/diff/', ReportDiffView.as_view(), name='report-diff'),
+    path('reports/diff/<str:task_id>/', ReportDiffResultView.as_view(), name='report-diff-result'),
+    path('reports/<str:task_id>/', ReportRunStatusView.as_view(), name='report-run'),
+    path('reports/<str:task_id>/wait/', ReportRunWaitView.as_view(), name='report-run-wait'),
+    path('reports/<str:task_id>/cancel/', ReportRunCancelView.as_view(), name='report-run-cancel'),
+    path('reports/<str:task_id>/rows/', ReportRowsView.as_view(), name='report-rows'),
+    path('reports/<str:task_id>/events/', ReportRunEventsView.as_view(), name='report-run-events'),
     path('download-report/<str:task_id>/', DownloadReportView.as_view(), name='download-report'),
     path('trigger-scheduled-report/', TriggerScheduleReportView.as_view(), name='trigger_scheduled_report'),
+    path('dry-run/', DryRunReportView.as_view(), name='dry-run'),
+    path('dry-run/<str:task_id>/', DryRunResultView.as_view(), name='dry-run-result'),
 ]
@@ -1,16 +1,243 @@
 # utils.py
+import os
+
 from celery import shared_task
+from celery.exceptions import Ignore
+from django.conf import settings
 import pandas as pd
 from io import BytesIO
-from .transformation import TransformationEngine
+from .incremental import update_report, update_reports
+from .transformation import ReportInterrupted, TransformationEngine, process_batch
+
+# app/__init__.py imports this module before the app registry is ready, so the
+# model-backed helpers in .runs and .retention are imported inside the tasks.
+
+
+@shared_task(bind=True)
+def generate_report_task(self, input_path, ref_path, rule_path, index_columns=None):
+    """
+    Write the report for one input, indexed on `index_columns` if given.
+    The task checks between chunks whether its run was cancelled, then
+    removes the partial output, or preempted, then checkpoints and requeues
+    itself under the same task id to resume after the rows already written.
+    """
+    from .interruption import check_interrupt, discard_checkpoint, discard_output, load_checkpoint, save_checkpoint
+    from .models import ReportRun
+    from .runs import (
+        record_cancelled, record_failure, record_output, record_preempted, record_progress, record_started,
+    )
 
-@shared_task
-def generate_report_task(input_path, ref_path, rule_path):
     output_path = input_path.replace("input.csv", "output.csv")
     print("output_path", output_path)
-    engine = TransformationEngine(rule_path)
-    
-    engine.process_dataframe(input_path, ref_path, output_path)
+    record_started(output_path)
+    checkpoint = load_checkpoint(output_path)
+    skipped_rows = checkpoint.get("rows_read", 0)
+    written_rows = checkpoint.get("rows_written", 0)
+
+    def progress(rows):
+        record_progress(output_path, skipped_rows + rows)
+        check_interrupt(output_path, resumable=True)
+
+    try:
+        check_interrupt(output_path)
+        engine = TransformationEngine(rule_path)
+        output = engine.process_dataframe(
+            input_path, ref_path, output_path, aggregate_state=checkpoint.get("aggregate_state"),
+            progress=progress, skip_rows=skipped_rows, index_columns=index_columns,
+        )
+    except ReportInterrupted as e:
+        if e.resumable:
+            output = e.outputs[0]
+            rows_read = skipped_rows + output.rows_read
+            save_checkpoint(output_path, rows_read, written_rows + output.rows_written, output.aggregate_state())
+            if record_preempted(output_path, rows_read):
+                run = ReportRun.objects.filter(output_path=output_path).first()
+                self.apply_async(
+                    (input_path, ref_path, rule_path), {"index_columns": index_columns}, task_id=self.request.id,
+                    queue=run.queue, priority=run.priority,
+                )
+                # The requeued task stores the result under this task id.
+                raise Ignore()
+        discard_output(output_path)
+        record_cancelled(output_path)
+        return None
+    except Exception as e:
+        record_failure(output_path, e)
+        raise
+
+    discard_checkpoint(output_path)
+    record_output(output_path, skipped_rows + output.rows_read, written_rows + output.rows_written)
+    return output_path
+
+
+@shared_task
+def generate_scheduled_report_task(input_path, ref_path, rule_path):
+    """
+    Scheduled variant of generate_report_task: reuses the previous output when
+    the input, reference and rules are unchanged since the last tick and only
+    processes appended input rows when the input grew.
+    """
+    from .runs import record_failure, record_output, record_progress, record_started
+
+    output_path = input_path.replace("input.csv", "output.csv")
+    record_started(output_path)
+    try:
+        result = update_report(
+            input_path, ref_path, rule_path, output_path, progress=lambda rows: record_progress(output_path, rows)
+        )
+    except Exception as e:
+        record_failure(output_path, e)
+        raise
+
+    # A locked report is still being written by the previous tick, which records it.
+    if result["mode"] != 'locked':
+        record_output(output_path, result.get("rows_read"), result.get("rows_written"))
+    return output_path
+
+
+@shared_task
+def generate_scheduled_batch_task(input_path, ref_path, reports):
+    """
+    Several scheduled reports that fired together on the same input and
+    reference, coalesced by the beat scheduler. `reports` is a list of
+    [rule_path, output_path]; each report's run is still recorded on its own.
+    """
+    from .runs import record_failure, record_output, record_progress, record_started
+
+    output_paths = [output_path for _, output_path in reports]
+
+    def progress(rows):
+        for output_path in output_paths:
+            record_progress(output_path, rows)
+
+    for output_path in output_paths:
+        record_started(output_path)
+    try:
+        results = update_reports(input_path, ref_path, [tuple(report) for report in reports], progress=progress)
+    except Exception as e:
+        for output_path in output_paths:
+            record_failure(output_path, e)
+        raise
+
+    for output_path, result in zip(output_paths, results):
+        if result["mode"] != 'locked':
+            record_output(output_path, result.get("rows_read"), result.get("rows_written"))
+    return output_paths
+
 
-    return output_path 
+@shared_task(bind=True)
+def generate_batch_report_task(self, input_path, ref_path, reports, index_columns=None):
+    """
+    Run several rule sets over one input/reference pair in a single pass.
+    `reports` is a list of [report_id, rule_path, output_path]; each report's
+    result is stored under its own report_id, so it can be polled and
+    downloaded like a task of its own. Every report is indexed on
+    `index_columns` if given.
+    """
+    from .interruption import cancelled_outputs, discard_output
+    from .models import ReportRun
+    from .runs import record_cancelled, record_failure, record_output, record_progress, record_started
+
+    output_paths = [output_path for _, _, output_path in reports]
+
+    def check_cancelled():
+        # The pass goes on while any report of the batch still wants it.
+        if len(cancelled_outputs(output_paths)) == len(reports):
+            raise ReportInterrupted(ReportRun.INTERRUPT_CANCEL)
+
+    def progress(rows):
+        for output_path in output_paths:
+            record_progress(output_path, rows)
+        check_cancelled()
+
+    for output_path in output_paths:
+        record_started(output_path)
+    try:
+        check_cancelled()
+        engines = [(TransformationEngine(rule_path), output_path) for _, rule_path, output_path in reports]
+        outputs = process_batch(
+            input_path, ref_path, engines, progress=progress, index_columns=[index_columns] * len(reports)
+        )
+    except ReportInterrupted:
+        for report_id, _, output_path in reports:
+            discard_output(output_path)
+            record_cancelled(output_path)
+            self.backend.mark_as_revoked(report_id)
+        return None
+    except Exception as e:
+        for report_id, _, output_path in reports:
+            record_failure(output_path, e)
+            self.backend.mark_as_failure(report_id, e)
+        raise
+
+    cancelled = cancelled_outputs(output_paths)
+    for (report_id, _, output_path), output in zip(reports, outputs):
+        if output_path in cancelled:
+            discard_output(output_path)
+            record_cancelled(output_path)
+            self.backend.mark_as_revoked(report_id)
+        else:
+            record_output(output_path, output.rows_read, output.rows_written)
+            self.backend.mark_as_done(report_id, output_path)
+    return {report_id: output_path for report_id, _, output_path in reports if output_path not in cancelled}
+
+
+@shared_task
+def diff_reports_task(old_path, new_path, key_columns, output_path):
+    """
+    Write the rows added, removed and changed between two report outputs,
+    matched on `key_columns`, and a summary of the counts next to them.
+    """
+    from .diff import diff_reports
+    from .interruption import check_interrupt, discard_output
+    from .runs import record_cancelled, record_failure, record_output, record_progress, record_started
+
+    record_started(output_path)
+
+    def progress(rows):
+        record_progress(output_path, rows)
+        check_interrupt(output_path)
+
+    try:
+        check_interrupt(output_path)
+        summary = diff_reports(old_path, new_path, key_columns, output_path, progress=progress)
+    except ReportInterrupted:
+        discard_output(output_path)
+        record_cancelled(output_path)
+        return None
+    except Exception as e:
+        record_failure(output_path, e)
+        raise
+
+    record_output(
+        output_path, summary["rows_old"] + summary["rows_new"],
+        summary["added"] + summary["removed"] + summary["changed"],
+    )
+    return output_path
+
+
+@shared_task
+def dry_run_task(input_path, ref_path, rule_path, sample_size=1000, mode='head', seed=None, cleanup=False):
+    try:
+        engine = TransformationEngine(rule_path)
+        return engine.dry_run(input_path, ref_path, sample_size, mode, seed)
+    finally:
+        if cleanup:
+            for path in (input_path, ref_path, rule_path):
+                if path.startswith(settings.MEDIA_ROOT) and os.path.exists(path):
+                    os.remove(path)
+
+
+@shared_task
+def compact_reference_task(name, version):
+    """Fold the deltas of a stored reference version into a new base file."""
+    from .refstore import ReferenceStore
+
+    return ReferenceStore(settings.REFERENCES_ROOT).compact(name, version)["base"]
+
+
+@shared_task
+def evict_storage_task():
+    from .retention import StorageManager
 
+    return StorageManager().evict()
@@ -1,21 +1,126 @@
 import os
+import queue
+import time
 import uuid
 import json
 import yaml
 
 from django.conf import settings
-from django.http import FileResponse
+from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.urls import replace_query_param
 
+from celery import states
 from celery.result import AsyncResult
 from django_celery_beat.models import PeriodicTask, CrontabSchedule
 
-from .utils import generate_report_task
+from .utils import (
+    generate_report_task, generate_batch_report_task, generate_scheduled_report_task, dry_run_task, diff_reports_task,
+    compact_reference_task,
+)
 from .models import ReportRun
+from . import notifications, tracing
+from .admission import admission_delay, estimate_upload_rows, route, rules_path_count
+from .diff import read_header, read_summary
+from .indexing import IndexQueryError, indexed_columns, query_report
+from .interruption import cancel_run, preempt_for
+from .runs import TERMINAL_STATUSES, record_download, run_event
+from .serializers import ReportRunSerializer
+from .refstore import DeltaError, ReferenceStore
+from .rules import RuleSetStore, load_plan, parse_rules, validate_rules
+from .storage import BlobStore
+
+
+def get_rule_store():
+    return RuleSetStore(settings.RULES_ROOT)
+
+
+def get_reference_store():
+    return ReferenceStore(settings.REFERENCES_ROOT)
+
+
+def get_blob_store():
+    return BlobStore(os.path.join(settings.MEDIA_ROOT, 'blobs'))
+
+
+def save_upload(file_obj, path):
+    """Store an upload once by content and link it to `path`; returns its SHA-256."""
+    store = get_blob_store()
+    with tracing.span('upload.store', bytes=file_obj.size):
+        digest, _ = store.put(file_obj.chunks())
+        store.link(digest, path)
+    return digest
+
+
+def visible_runs(user):
+    """The runs `user` may look up: their own and those nobody requested; staff see every run."""
+    if user.is_staff:
+        return ReportRun.objects.all()
+    return ReportRun.objects.filter(Q(user=user) | Q(user=None))
+
+
+def too_busy(retry_after):
+    return Response(
+        {"error": "Too many reports are queued. Retry later.", "retry_after": retry_after},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def parse_index_columns(data):
+    """The `index_columns` of a request, given as repeated or comma-separated values; None if there are none."""
+    values = data.getlist('index_columns') if hasattr(data, 'getlist') else [data.get('index_columns') or '']
+    columns = [column.strip() for value in values for column in value.split(',') if column.strip()]
+    return list(dict.fromkeys(columns)) or None
+
+
+def invalid_index_columns(columns, rule_paths):
+    """Return an error response if `columns` cannot be indexed in the reports of `rule_paths`."""
+    if len(columns) > settings.REPORT_MAX_INDEX_COLUMNS:
+        return Response(
+            {"error": f"At most {settings.REPORT_MAX_INDEX_COLUMNS} columns can be indexed."}, status=400
+        )
+    for rule_path in rule_paths:
+        try:
+            report_columns = load_plan(rule_path).columns
+        except (OSError, ValueError):
+            # A missing or broken rules file fails in the task.
+            continue
+        missing = [column for column in columns if column not in report_columns]
+        if missing:
+            return Response({"error": f"Cannot index columns the report does not have: {', '.join(missing)}."},
+                            status=400)
+    return None
+
+
+def pin_reference(data):
+    """
+    The stored reference a request names with `reference_name` and
+    `reference_version`, the head version by default, as its manifest path,
+    version and size; None if no reference is named, or an error Response.
+    The version is fixed now, so later deltas do not change the report.
+    """
+    name = data.get('reference_name')
+    if not name:
+        return None
+    store = get_reference_store()
+    version = data.get('reference_version') or store.head(name)
+    if not version or not store.exists(name, version):
+        return Response({"error": f"Reference {name} version {version} not found."}, status=404)
+    manifest = store.manifest(name, version)
+    return store.version_path(name, version), version, manifest["base_bytes"] + manifest["delta_bytes"]
+
+
+def get_active_rules_path():
+    # Fall back to the pre-versioning rules file until a rule set has been activated.
+    return get_rule_store().active_plan_path() or os.path.join(settings.RULES_ROOT, 'rules.json')
 
 
 
@@ -27,44 +132,484 @@ class GenerateReportView(APIView):
     def post(self, request):
         input_file = request.FILES.get('input')
         reference_file = request.FILES.get('reference')
+        pinned = pin_reference(request.data)
+        if isinstance(pinned, Response):
+            return pinned
 
-        if not input_file or not reference_file:
+        if not input_file or not (reference_file or pinned):
             return Response({"error": "Both input and reference files are required."}, status=400)
 
+        rules_path = get_active_rules_path()
+        index_columns = parse_index_columns(request.data)
+        if index_columns:
+            invalid = invalid_index_columns(index_columns, [rules_path])
+            if invalid is not None:
+                return invalid
+
+        estimated_rows = estimate_upload_rows(input_file)
+        estimated_cost = estimated_rows * rules_path_count(rules_path)
+        retry_after = admission_delay(request.user, estimated_cost)
+        if retry_after is not None:
+            return too_busy(retry_after)
+        routing = route(input_file.size, estimated_cost)
+
         unique_id = str(uuid.uuid4())
         input_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_input.csv")
-        ref_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_reference.csv")
-        rules_path = os.path.join(settings.BASE_DIR, 'app', 'transformation', 'configs', 'rules.json')
+        input_sha256 = save_upload(input_file, input_path)
+        if pinned is not None:
+            ref_path, reference_sha256, reference_bytes = pinned
+        else:
+            ref_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_reference.csv")
+            reference_sha256, reference_bytes = save_upload(reference_file, ref_path), reference_file.size
+
+        run = ReportRun.objects.create(
+            report_name=f"report_{unique_id[:6]}",
+            user=request.user,
+            status=ReportRun.STATUS_PENDING,
+            estimated_rows=estimated_rows,
+            estimated_cost=estimated_cost,
+            queue=routing["queue"],
+            priority=routing["priority"],
+            resumable=True,
+            input_path=input_path,
+            reference_path=ref_path,
+            input_sha256=input_sha256,
+            reference_sha256=reference_sha256,
+            input_bytes=input_file.size,
+            reference_bytes=reference_bytes,
+            rules_path=rules_path,
+            output_path=input_path.replace("input.csv", "output.csv"),
+            index_columns=index_columns,
+        )
+        preempt_for(**routing)
+        task = generate_report_task.apply_async(
+            (input_path, ref_path, rules_path), {"index_columns": index_columns}, **routing
+        )
+        run.task_id = task.id
+        run.save(update_fields=['task_id'])
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
 
-        for file_obj, path in [(input_file, input_path), (reference_file, ref_path)]:
-            with open(path, 'wb') as f:
-                for chunk in file_obj.chunks():
-                    f.write(chunk)
 
-        task = generate_report_task.delay(input_path, ref_path, rules_path)
-        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+class GenerateBatchReportView(APIView):
+    parser_classes = [MultiPartParser]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        input_file = request.FILES.get('input')
+        reference_file = request.FILES.get('reference')
+        rules_files = request.FILES.getlist('rules')
+        versions = request.data.getlist('versions') if hasattr(request.data, 'getlist') else []
+        pinned = pin_reference(request.data)
+        if isinstance(pinned, Response):
+            return pinned
+
+        if not input_file or not (reference_file or pinned):
+            return Response({"error": "Both input and reference files are required."}, status=400)
+
+        if not rules_files and not versions:
+            return Response({"error": "At least one rules file or rule version is required."}, status=400)
+
+        if len(rules_files) + len(versions) > settings.BATCH_MAX_REPORTS:
+            return Response(
+                {"error": f"A batch can contain at most {settings.BATCH_MAX_REPORTS} rule sets."}, status=400
+            )
+
+        store = get_rule_store()
+        for version in versions:
+            if not store.exists(version):
+                return Response({"error": f"Rule version {version} not found."}, status=404)
+
+        try:
+            for rules_file in rules_files:
+                rules_type = os.path.splitext(rules_file.name)[1].lower().lstrip('.') or 'json'
+                rules = validate_rules(parse_rules(b''.join(rules_file.chunks()), rules_type))
+                versions.append(store.save(rules, source_type=rules_type))
+        except (ValueError, yaml.YAMLError) as e:
+            return Response({"error": f"Invalid rules file: {e}"}, status=400)
+
+        rule_paths = [store.plan_path(version) for version in versions]
+        index_columns = parse_index_columns(request.data)
+        if index_columns:
+            invalid = invalid_index_columns(index_columns, rule_paths)
+            if invalid is not None:
+                return invalid
+
+        estimated_rows = estimate_upload_rows(input_file)
+        # One pass over the input serves every rule set, so the rows are read once.
+        costs = [estimated_rows * rules_path_count(rule_path) for rule_path in rule_paths]
+        retry_after = admission_delay(request.user, sum(costs))
+        if retry_after is not None:
+            return too_busy(retry_after)
+        routing = route(input_file.size, sum(costs))
+
+        unique_id = str(uuid.uuid4())
+        input_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_input.csv")
+        input_sha256 = save_upload(input_file, input_path)
+        if pinned is not None:
+            ref_path, reference_sha256, reference_bytes = pinned
+        else:
+            ref_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_reference.csv")
+            reference_sha256, reference_bytes = save_upload(reference_file, ref_path), reference_file.size
+
+        reports = []
+        for rule_path in rule_paths:
+            report_id = str(uuid.uuid4())
+            output_path = os.path.join(settings.MEDIA_ROOT, f"{report_id}_output.csv")
+            reports.append([report_id, rule_path, output_path])
+
+        ReportRun.objects.bulk_create([
+            ReportRun(
+                id=report_id,
+                report_name=f"report_{report_id[:6]}",
+                user=request.user,
+                task_id=report_id,
+                status=ReportRun.STATUS_PENDING,
+                estimated_rows=estimated_rows,
+                estimated_cost=cost,
+                queue=routing["queue"],
+                priority=routing["priority"],
+                input_path=input_path,
+                reference_path=ref_path,
+                input_sha256=input_sha256,
+                reference_sha256=reference_sha256,
+                input_bytes=input_file.size,
+                reference_bytes=reference_bytes,
+                rules_path=rule_path,
+                output_path=output_path,
+                index_columns=index_columns,
+            )
+            for (report_id, rule_path, output_path), cost in zip(reports, costs)
+        ])
+        preempt_for(**routing)
+        task = generate_batch_report_task.apply_async(
+            (input_path, ref_path, reports), {"index_columns": index_columns}, **routing
+        )
+        return Response({
+            "task_id": task.id,
+            "reports": [
+                {"report_id": report_id, "rules_version": version}
+                for (report_id, _, _), version in zip(reports, versions)
+            ],
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+def report_unavailable(run):
+    """The response for a run whose output cannot be read, or None once it is complete."""
+    if run.status == ReportRun.STATUS_FAILED:
+        return Response({"status": run.status, "error": run.error}, status=500)
+    if run.status == ReportRun.STATUS_EVICTED:
+        return Response({"error": "Report was removed by the retention policy."}, status=410)
+    if run.status == ReportRun.STATUS_CANCELLED:
+        return Response({"status": run.status, "error": "Report was cancelled."}, status=410)
+    if run.status in ReportRun.ACTIVE_STATUSES or run.completed_at is None:
+        return Response({"status": run.status, "rows_read": run.rows_read}, status=status.HTTP_202_ACCEPTED)
+    return None
 
 
 class DownloadReportView(APIView):
     permission_classes = [IsAuthenticated]
-    
+
     def get(self, request, task_id):
+        run = visible_runs(request.user).filter(task_id=task_id).first()
+        if run is not None:
+            return self.from_run(run)
+
+        # Runs started before ReportRun was recorded are looked up in the result backend.
         result = AsyncResult(task_id)
         if result.ready():
+            if result.status == states.FAILURE:
+                return Response({"status": result.status, "error": str(result.result)}, status=500)
+
             output_path = result.get()
+            run = record_download(output_path)
 
-            if not os.path.exists(output_path):
-                return Response({"error": "Report file not found."}, status=404)
+            if run is not None and run.status == ReportRun.STATUS_EVICTED:
+                return Response({"error": "Report was removed by the retention policy."}, status=410)
 
-            return FileResponse(
-                open(output_path, 'rb'),
-                content_type='text/csv',
-                as_attachment=True,
-                filename=os.path.basename(output_path)
-            )
+            return self.file_response(output_path)
 
         return Response({"status": result.status}, status=status.HTTP_202_ACCEPTED)
 
+    def from_run(self, run):
+        unavailable = report_unavailable(run)
+        if unavailable is not None:
+            return unavailable
+
+        record_download(run.output_path)
+        return self.file_response(run.output_path)
+
+    def file_response(self, output_path):
+        if not os.path.exists(output_path):
+            return Response({"error": "Report file not found."}, status=404)
+
+        return FileResponse(
+            open(output_path, 'rb'),
+            content_type='text/csv',
+            as_attachment=True,
+            filename=os.path.basename(output_path)
+        )
+
+
+class ReportRowsView(APIView):
+    """
+    Rows of a completed report that was indexed: query parameters naming an
+    indexed column keep the rows equal to one of their values, `fields`
+    selects the columns returned, and `limit` and the `after` cursor page
+    through the matches in file order.
+    """
+    permission_classes = [IsAuthenticated]
+    reserved_params = ('fields', 'limit', 'after', 'format')
+
+    def get(self, request, task_id):
+        run = visible_runs(request.user).filter(task_id=task_id).first()
+        if run is None:
+            return Response({"error": "Report not found."}, status=404)
+        unavailable = report_unavailable(run)
+        if unavailable is not None:
+            return unavailable
+        if indexed_columns(run.output_path) is None:
+            return Response({"error": "Report is not indexed. Request it with index_columns."}, status=404)
+
+        try:
+            limit = int(request.query_params.get('limit', settings.REPORT_ROWS_PAGE_SIZE))
+            after = int(request.query_params.get('after', -1))
+        except ValueError:
+            return Response({"error": "limit and after must be integers."}, status=400)
+        if not 1 <= limit <= settings.REPORT_ROWS_MAX_PAGE_SIZE:
+            return Response({"error": f"limit must be between 1 and {settings.REPORT_ROWS_MAX_PAGE_SIZE}."},
+                            status=400)
+        fields = [name for name in request.query_params.get('fields', '').split(',') if name] or None
+        filters = {
+            name: request.query_params.getlist(name)
+            for name in request.query_params if name not in self.reserved_params
+        }
+
+        try:
+            page = query_report(run.output_path, filters, fields, after, limit)
+        except IndexQueryError as e:
+            return Response({"error": str(e)}, status=400)
+
+        record_download(run.output_path)
+        if page["next"] is not None:
+            page["next"] = replace_query_param(request.build_absolute_uri(), 'after', page["next"])
+        return Response(page, status=200)
+
+
+class ReportDiffView(APIView):
+    """
+    Diff two completed reports: `old` and `new` are their task ids and
+    `key_columns` the columns matching their rows. The diff runs as a report
+    of its own, downloaded from download-report/ once complete.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        key_columns = request.data.get('key_columns')
+        if isinstance(key_columns, str):
+            key_columns = [column.strip() for column in key_columns.split(',') if column.strip()]
+        if not isinstance(key_columns, list) or not key_columns:
+            return Response({"error": "key_columns must be a non-empty list."}, status=400)
+
+        runs = []
+        for name in ('old', 'new'):
+            run = visible_runs(request.user).filter(task_id=request.data.get(name) or '').first()
+            if run is None:
+                return Response({"error": f"Report {name} not found."}, status=404)
+            if run.status != ReportRun.STATUS_COMPLETED or not run.output_path or not os.path.exists(run.output_path):
+                return Response({"error": f"Report {name} is {run.status} and cannot be diffed."}, status=409)
+            missing = [column for column in key_columns if column not in read_header(run.output_path)]
+            if missing:
+                return Response({"error": f"Report {name} has no columns {', '.join(missing)}."}, status=400)
+            runs.append(run)
+        old, new = runs
+
+        estimated_rows = old.rows_written + new.rows_written
+        retry_after = admission_delay(request.user, estimated_rows)
+        if retry_after is not None:
+            return too_busy(retry_after)
+        routing = route(old.output_bytes + new.output_bytes, estimated_rows)
+
+        unique_id = str(uuid.uuid4())
+        output_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_diff.csv")
+        # The active run keeps both outputs from being evicted while they are read.
+        run = ReportRun.objects.create(
+            report_name=f"diff_{unique_id[:6]}",
+            user=request.user,
+            status=ReportRun.STATUS_PENDING,
+            estimated_rows=estimated_rows,
+            estimated_cost=estimated_rows,
+            queue=routing["queue"],
+            priority=routing["priority"],
+            input_path=old.output_path,
+            reference_path=new.output_path,
+            input_bytes=old.output_bytes,
+            reference_bytes=new.output_bytes,
+            output_path=output_path,
+        )
+        preempt_for(**routing)
+        task = diff_reports_task.apply_async((old.output_path, new.output_path, key_columns, output_path), **routing)
+        run.task_id = task.id
+        run.save(update_fields=['task_id'])
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+
+
+class ReportDiffResultView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, task_id):
+        run = visible_runs(request.user).filter(task_id=task_id).first()
+        if run is None:
+            return Response({"error": "Diff not found."}, status=404)
+        unavailable = report_unavailable(run)
+        if unavailable is not None:
+            return unavailable
+
+        summary = read_summary(run.output_path)
+        if summary is None:
+            return Response({"error": "Diff summary not found."}, status=404)
+        return Response({"status": run.status, "summary": summary}, status=200)
+
+
+class ReportRunPagination(CursorPagination):
+    # Cursor pagination walks the created_at index instead of counting and offsetting.
+    ordering = '-created_at'
+    page_size = settings.REPORTS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.REPORTS_MAX_PAGE_SIZE
+
+
+class ReportRunListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        runs = visible_runs(request.user)
+        statuses = request.query_params.get('status')
+        if statuses:
+            runs = runs.filter(status__in=statuses.split(','))
+
+        paginator = ReportRunPagination()
+        page = paginator.paginate_queryset(runs, request, view=self)
+        return paginator.get_paginated_response(ReportRunSerializer(page, many=True).data)
+
+
+class ReportRunStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, task_id):
+        run = visible_runs(request.user).filter(task_id=task_id).first()
+        if run is None:
+            return Response({"error": "Report not found."}, status=404)
+        return Response(ReportRunSerializer(run).data, status=200)
+
+
+class ReportRunCancelView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, task_id):
+        run = ReportRun.objects.filter(task_id=task_id).first()
+        if run is None:
+            return Response({"error": "Report not found."}, status=404)
+        if run.user_id is not None and run.user_id != request.user.pk and not request.user.is_staff:
+            return Response({"error": "Only the user who requested a report can cancel it."}, status=403)
+        if not cancel_run(run):
+            return Response({"error": f"Report is {run.status} and cannot be cancelled."}, status=409)
+        return Response(ReportRunSerializer(run).data, status=status.HTTP_202_ACCEPTED)
+
+
+class ReportRunWaitView(APIView):
+    """
+    Long-poll for a run: returns at once if the run has finished, otherwise
+    on its next state change or progress update, or after `timeout` seconds
+    with the unchanged state.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, task_id):
+        try:
+            timeout = min(float(request.query_params.get('timeout', 30)), settings.REPORT_WAIT_MAX_SECONDS)
+        except ValueError:
+            return Response({"error": "timeout must be a number."}, status=400)
+
+        with notifications.listen(task_id) as events:
+            run = visible_runs(request.user).filter(task_id=task_id).first()
+            if run is None:
+                return Response({"error": "Report not found."}, status=404)
+            if run.status in TERMINAL_STATUSES:
+                return Response(run_event(run), status=200)
+            try:
+                return Response(events.get(timeout=max(timeout, 0)), status=200)
+            except queue.Empty:
+                return Response(dict(run_event(run), timed_out=True), status=200)
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: error\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def _sse(event):
+    return f"event: status\ndata: {json.dumps(event)}\n\n"
+
+
+class ReportRunEventsView(APIView):
+    """
+    Server-Sent Events stream of a run's state changes and progress updates.
+    The stream ends once the run finishes or after REPORT_EVENTS_MAX_SECONDS;
+    comment lines are sent as heartbeats while nothing happens.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, task_id):
+        run = visible_runs(request.user).filter(task_id=task_id).first()
+        if run is None:
+            return Response({"error": "Report not found."}, status=404)
+
+        response = StreamingHttpResponse(self.stream(run), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, run):
+        deadline = time.monotonic() + settings.REPORT_EVENTS_MAX_SECONDS
+        with notifications.listen(run.task_id) as events:
+            # Re-read once listening so no change between the two is missed.
+            run.refresh_from_db()
+            event = run_event(run)
+            yield _sse(event)
+            while event["status"] not in TERMINAL_STATUSES and time.monotonic() < deadline:
+                try:
+                    event = events.get(timeout=settings.REPORT_EVENTS_HEARTBEAT_SECONDS)
+                    yield _sse(event)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+
+
+class ReportRunBulkStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        task_ids = request.data.get('task_ids')
+        if isinstance(task_ids, str):
+            task_ids = [task_id for task_id in task_ids.split(',') if task_id]
+        if not isinstance(task_ids, list) or not task_ids:
+            return Response({"error": "task_ids must be a non-empty list."}, status=400)
+        if len(task_ids) > settings.REPORTS_MAX_STATUS_IDS:
+            return Response(
+                {"error": f"At most {settings.REPORTS_MAX_STATUS_IDS} task_ids can be looked up at once."}, status=400
+            )
+
+        runs = visible_runs(request.user).filter(task_id__in=task_ids)
+        reports = ReportRunSerializer(runs, many=True).data
+        found = {report["task_id"] for report in reports}
+        return Response({
+            "reports": reports,
+            "missing": [task_id for task_id in task_ids if task_id not in found],
+        }, status=200)
+
 
 class UploadRulesView(APIView):
     parser_classes = [MultiPartParser, FormParser]
@@ -80,15 +625,19 @@ class UploadRulesView(APIView):
         if not uploaded_file:
             return Response({"error": "No file uploaded."}, status=400)
 
-        rules_dir = os.path.join(settings.BASE_DIR, 'app', 'transformation', 'configs')
-        os.makedirs(rules_dir, exist_ok=True)
-        rules_path = os.path.join(rules_dir, f"rules.{file_type}")
+        try:
+            rules = validate_rules(parse_rules(b''.join(uploaded_file.chunks()), file_type))
+        except (ValueError, yaml.YAMLError) as e:
+            return Response({"error": f"Invalid rules file: {e}"}, status=400)
 
         try:
-            with open(rules_path, 'wb') as f:
-                for chunk in uploaded_file.chunks():
-                    f.write(chunk)
-            return Response({"message": f"Rules file uploaded successfully as rules.{file_type}"}, status=200)
+            store = get_rule_store()
+            version = store.save(rules, source_type=file_type)
+            store.activate(version)
+            return Response({
+                "message": f"Rules file uploaded successfully and activated as version {version}",
+                "version": version,
+            }, status=200)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
@@ -103,10 +652,13 @@ class TriggerScheduleReportView(APIView):
         reference_file = request.FILES.get("reference_file")
         rules_file = request.FILES.get("rules_file")
         report_name = request.data.get("report_name") or f"report_{uuid.uuid4().hex[:6]}"
+        pinned = pin_reference(request.data)
+        if isinstance(pinned, Response):
+            return pinned
 
-        if not all([cron, input_file, reference_file, rules_file]):
+        if not all([cron, input_file, reference_file or pinned, rules_file]):
             return Response(
-                {"error": "cron, input_file, reference_file, and rules_file are required."},
+                {"error": "cron, input_file, reference_file (or reference_name), and rules_file are required."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
@@ -125,27 +677,56 @@ class TriggerScheduleReportView(APIView):
                 day_of_week=day_of_week,
             )
 
+            rules_type = os.path.splitext(rules_file.name)[1].lower().lstrip('.') or 'json'
+            try:
+                rules = validate_rules(parse_rules(b''.join(rules_file.chunks()), rules_type))
+            except yaml.YAMLError as e:
+                raise ValueError(f"Invalid rules file: {e}")
+            store = get_rule_store()
+            rules_path = store.plan_path(store.save(rules, source_type=rules_type))
+
             unique_id = uuid.uuid4().hex
             input_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_input.csv")
-            ref_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_reference.csv")
-            rules_path = os.path.join(settings.BASE_DIR, 'app', 'transformation', 'configs', f"{unique_id}_rules.json")
-
-            for file_obj, path in [
-                (input_file, input_path),
-                (reference_file, ref_path),
-                (rules_file, rules_path),
-            ]:
-                with open(path, 'wb') as f:
-                    for chunk in file_obj.chunks():
-                        f.write(chunk)
-
-            task = generate_report_task.delay(input_path, ref_path, rules_path)
+            input_sha256 = save_upload(input_file, input_path)
+            if pinned is not None:
+                ref_path, reference_sha256, reference_bytes = pinned
+            else:
+                ref_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_reference.csv")
+                reference_sha256, reference_bytes = save_upload(reference_file, ref_path), reference_file.size
+
+            # Scheduled runs are admitted when the schedule is created; every run is only routed.
+            estimated_rows = estimate_upload_rows(input_file)
+            estimated_cost = estimated_rows * rules_path_count(rules_path)
+            routing = route(input_file.size, estimated_cost)
+
+            run = ReportRun.objects.create(
+                report_name=report_name,
+                user=request.user,
+                status=ReportRun.STATUS_SCHEDULED,
+                estimated_rows=estimated_rows,
+                estimated_cost=estimated_cost,
+                queue=routing["queue"],
+                priority=routing["priority"],
+                input_path=input_path,
+                reference_path=ref_path,
+                input_sha256=input_sha256,
+                reference_sha256=reference_sha256,
+                input_bytes=input_file.size,
+                reference_bytes=reference_bytes,
+                rules_path=rules_path,
+                output_path=input_path.replace("input.csv", "output.csv"),
+            )
+            task = generate_scheduled_report_task.apply_async((input_path, ref_path, rules_path), **routing)
+            run.task_id = task.id
+            run.save(update_fields=['task_id'])
 
             PeriodicTask.objects.create(
                 crontab=schedule,
                 name=f"{report_name}_{unique_id[:6]}",
-                task='app.utils.generate_report_task',
-                args=json.dumps([input_path, ref_path, rules_path])
+                task='app.utils.generate_scheduled_report_task',
+                args=json.dumps([input_path, ref_path, rules_path]),
+                queue=routing["queue"],
+                priority=routing["priority"],
             )
 
             return Response({
@@ -158,4 +739,170 @@ class TriggerScheduleReportView(APIView):
         except ValueError as ve:
             return Response({"error": str(ve)}, status=400)
         except Exception as e:
-            return Response({"error": str(e)}, status=500)
\ No newline at end of file
+            return Response({"error": str(e)}, status=500)
+
+
+class DryRunReportView(APIView):
+    parser_classes = [MultiPartParser, FormParser]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        input_file = request.FILES.get('input')
+        reference_file = request.FILES.get('reference')
+        rules_file = request.FILES.get('rules')
+        mode = request.data.get('mode', 'head')
+        run_async = str(request.data.get('async', '')).lower() in ('1', 'true', 'yes')
+        pinned = pin_reference(request.data)
+        if isinstance(pinned, Response):
+            return pinned
+
+        if not input_file or not (reference_file or pinned):
+            return Response({"error": "Both input and reference files are required."}, status=400)
+
+        if mode not in ('head', 'reservoir'):
+            return Response({"error": "Unsupported sample mode. Use 'head' or 'reservoir'."}, status=400)
+
+        try:
+            sample_size = int(request.data.get('sample_size', settings.DRY_RUN_DEFAULT_ROWS))
+            seed = request.data.get('seed')
+            seed = int(seed) if seed not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response({"error": "sample_size and seed must be integers."}, status=400)
+
+        if not 0 < sample_size <= settings.DRY_RUN_MAX_ROWS:
+            return Response(
+                {"error": f"sample_size must be between 1 and {settings.DRY_RUN_MAX_ROWS}."}, status=400
+            )
+
+        unique_id = str(uuid.uuid4())
+        input_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_dryrun_input.csv")
+        files = [(input_file, input_path)]
+        if pinned is not None:
+            # Cleanup only removes files under MEDIA_ROOT, so the stored version is kept.
+            ref_path = pinned[0]
+        else:
+            ref_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_dryrun_reference.csv")
+            files.append((reference_file, ref_path))
+
+        if rules_file:
+            extension = os.path.splitext(rules_file.name)[1].lower()
+            if extension not in ('.json', '.yaml', '.yml'):
+                return Response({"error": "Unsupported rule file format. Use .json or .yaml"}, status=400)
+            rules_path = os.path.join(settings.MEDIA_ROOT, f"{unique_id}_dryrun_rules{extension}")
+            files.append((rules_file, rules_path))
+        else:
+            rules_path = get_active_rules_path()
+
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        for file_obj, path in files:
+            save_upload(file_obj, path)
+
+        args = (input_path, ref_path, rules_path, sample_size, mode, seed, True)
+        if run_async:
+            task = dry_run_task.delay(*args)
+            return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+
+        try:
+            return Response(dry_run_task(*args), status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=400)
+
+
+class DryRunResultView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, task_id):
+        result = AsyncResult(task_id)
+        if result.ready():
+            if result.status == states.FAILURE:
+                return Response({"error": str(result.result)}, status=400)
+            return Response(result.get(), status=status.HTTP_200_OK)
+
+        return Response({"status": result.status}, status=status.HTTP_202_ACCEPTED)
+
+
+class RuleVersionListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        store = get_rule_store()
+        return Response({"active": store.active_version(), "versions": store.versions()}, status=200)
+
+
+class ActivateRuleVersionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, version):
+        store = get_rule_store()
+        if not store.exists(version):
+            return Response({"error": "Rule version not found."}, status=404)
+
+        store.activate(version)
+        return Response({"message": f"Rule version {version} activated.", "version": version}, status=200)
+
+
+class ReferenceListView(APIView):
+    parser_classes = [MultiPartParser, FormParser]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({"references": get_reference_store().names()}, status=200)
+
+    def post(self, request):
+        name = request.data.get('name')
+        reference_file = request.FILES.get('reference')
+        if not name or not reference_file:
+            return Response({"error": "Both name and reference file are required."}, status=400)
+
+        store = get_reference_store()
+        if store.head(name):
+            return Response({"error": f"Reference {name} already exists; upload a delta to change it."}, status=409)
+        try:
+            manifest = store.create(name, reference_file.chunks())
+        except DeltaError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"name": name, "version": manifest["version"]}, status=status.HTTP_201_CREATED)
+
+
+class ReferenceDeltaView(APIView):
+    parser_classes = [MultiPartParser]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, name):
+        delta_file = request.FILES.get('delta')
+        if not delta_file:
+            return Response({"error": "A delta file is required."}, status=400)
+
+        store = get_reference_store()
+        try:
+            manifest = store.apply_delta(name, delta_file, parent=request.data.get('parent'))
+        except KeyError:
+            return Response({"error": f"Reference {name} version not found."}, status=404)
+        except DeltaError as e:
+            return Response({"error": f"Invalid delta: {e}"}, status=400)
+
+        compacting = store.needs_compaction(
+            manifest, settings.REFERENCE_COMPACT_DELTAS, settings.REFERENCE_COMPACT_RATIO
+        )
+        if compacting:
+            compact_reference_task.delay(name, manifest["version"])
+        return Response({
+            "name": name,
+            "version": manifest["version"],
+            "parent": manifest["parent"],
+            "head": store.head(name) == manifest["version"],
+            "upserts": manifest["upserts"],
+            "deletes": manifest["deletes"],
+            "deltas": len(manifest["deltas"]),
+            "compacting": compacting,
+        }, status=status.HTTP_201_CREATED)
+
+
+class ReferenceVersionListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, name):
+        store = get_reference_store()
+        if not store.head(name):
+            return Response({"error": f"Reference {name} not found."}, status=404)
+        return Response({"name": name, "head": store.head(name), "versions": store.versions(name)}, status=200)
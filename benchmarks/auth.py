@@ -0,0 +1,132 @@
+"""
+Benchmark of the authentication path of a polling client.
+
+Starts Django in-process with benchmarks/settings.py, creates a user and a
+report run, and measures requests/sec and database queries per request for
+`GET reports/<task_id>/` with a Bearer token and for
+`GET auth/get-access-token/?refresh=...`, once with the stock simplejwt
+classes (user and blacklist loaded from the database on every request) and
+once with the cached ones from users/authentication.py.
+
+    python -m benchmarks.auth --requests 2000 --out auth.json
+    python -m benchmarks.auth --compare before.json after.json
+
+SQLite runs in-process, so the measured gain is a lower bound for a
+Postgres server reached over the network.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Dict
+from unittest.mock import patch
+
+from benchmarks.common import compare, print_comparison, write_results
+
+
+def setup_django(work_dir: str):
+    os.environ["BENCHMARK_WORK_DIR"] = work_dir
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+def make_fixtures() -> Dict:
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from app.models import ReportRun
+    from users.models import CustomUser
+
+    user = CustomUser.objects.create_user(email="bench@example.com", password="benchpass123", name="Bench")
+    run = ReportRun.objects.create(report_name="bench", task_id="bench-task", user=user, status="Running")
+    refresh = RefreshToken.for_user(user)
+    return {"task_id": run.task_id, "access": str(refresh.access_token), "refresh": str(refresh)}
+
+
+def timed_requests(client, path: str, count: int, **extra) -> Dict:
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    client.get(path, **extra)  # Warm up caches and lazy imports.
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for _ in range(count):
+            response = client.get(path, **extra)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}")
+        seconds = time.perf_counter() - started
+    return {
+        "requests": count,
+        "seconds": round(seconds, 4),
+        "requests_per_sec": round(count / seconds, 1),
+        "queries_per_request": round(len(queries) / count, 2),
+    }
+
+
+def run_status_polling(fixtures: Dict, mode: str, count: int) -> Dict:
+    from django.test import Client
+    from django.urls import reverse
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from app.views import ReportRunStatusView
+    from users.authentication import CachedJWTAuthentication
+
+    auth_class = CachedJWTAuthentication if mode == "cached" else JWTAuthentication
+    with patch.object(ReportRunStatusView, "authentication_classes", [auth_class]):
+        return timed_requests(
+            Client(), reverse("report-run", args=[fixtures["task_id"]]), count,
+            HTTP_AUTHORIZATION=f"Bearer {fixtures['access']}",
+        )
+
+
+def run_token_refresh(fixtures: Dict, mode: str, count: int) -> Dict:
+    from django.test import Client
+    from django.urls import reverse
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from users.authentication import CachedRefreshToken
+
+    token_class = CachedRefreshToken if mode == "cached" else RefreshToken
+    with patch("users.views.CachedRefreshToken", token_class):
+        return timed_requests(Client(), f"{reverse('get-access-token')}?refresh={fixtures['refresh']}", count)
+
+
+BENCHMARKS = {
+    "status_polling": run_status_polling,
+    "token_refresh": run_token_refresh,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the authentication path.")
+    parser.add_argument("--out", default="auth_output.json")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print_comparison(compare(*args.compare, metric="requests_per_sec"), metric="requests_per_sec")
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="natwest_auth_") as work_dir:
+        setup_django(work_dir)
+        fixtures = make_fixtures()
+        for benchmark, fn in BENCHMARKS.items():
+            for mode in ("database", "cached"):
+                samples = [fn(fixtures, mode, args.requests) for _ in range(args.repeat)]
+                best = max(samples, key=lambda s: s["requests_per_sec"])
+                result = dict(best, benchmark=benchmark, params={"auth": mode, "requests": args.requests})
+                results.append(result)
+                print(f"{benchmark:<16} {mode:<9} {result['requests_per_sec']:>10.0f} req/s "
+                      f"{result['queries_per_request']:>6.2f} queries/request")
+
+    write_results(args.out, "auth", results)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child(conn, fn, args, kwargs):
+    try:
+        start_rss = peak_rss_mb()
+        started = time.perf_counter()
+        result = fn(*args, **kwargs) or {}
+        result.setdefault("seconds", time.perf_counter() - started)
+        result["start_rss_mb"] = round(start_rss, 1)
+        result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        conn.send(result)
+    except Exception:
+        conn.send({"error": traceback.format_exc()})
+    finally:
+        conn.close()
+
+
+def run_isolated(fn: Callable, *args, **kwargs) -> Dict:
+    """
+    Run `fn` in a forked child so that peak RSS is measured per case
+    instead of accumulating across the whole benchmark session.
+    """
+    ctx = multiprocessing.get_context("fork")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(child_conn, fn, args, kwargs))
+    proc.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        result = {"error": f"benchmark process exited with code {proc.exitcode}"}
+    proc.join()
+    return result
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    versions = {}
+    for name in ("pandas", "numpy", "django", "celery"):
+        module = sys.modules.get(name)
+        if module is not None:
+            versions[name] = getattr(module, "__version__", None)
+
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "versions": versions,
+    }
+
+
+def write_results(path: str, suite: str, results: List[Dict]):
+    with open(path, "w") as f:
+        json.dump({"suite": suite, "environment": environment(), "results": results}, f, indent=2)
+
+
+def case_key(result: Dict) -> str:
+    return json.dumps([result.get("benchmark"), result.get("params")], sort_keys=True)
+
+
+def compare(old_path: str, new_path: str, metric: str = "rows_per_sec") -> List[Dict]:
+    """
+    Match the cases of two result files and return the relative change of `metric`.
+    """
+    with open(old_path) as f:
+        old = {case_key(r): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+
+    rows = []
+    for result in new:
+        before = old.get(case_key(result))
+        if not before or metric not in before or metric not in result:
+            continue
+        change = (result[metric] - before[metric]) / before[metric] if before[metric] else None
+        rows.append({
+            "benchmark": result["benchmark"],
+            "params": result["params"],
+            "before": before[metric],
+            "after": result[metric],
+            "change": change,
+            "peak_rss_mb_before": before.get("peak_rss_mb"),
+            "peak_rss_mb_after": result.get("peak_rss_mb"),
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict], metric: str = "rows_per_sec"):
+    for row in rows:
+        change = "n/a" if row["change"] is None else f"{row['change'] * 100:+.1f}%"
+        print(f"{row['benchmark']:<20} {json.dumps(row['params'], sort_keys=True):<90} "
+              f"{metric} {row['before']:.0f} -> {row['after']:.0f} ({change}) "
+              f"rss {row['peak_rss_mb_before']} -> {row['peak_rss_mb_after']} MB")
@@ -0,0 +1,145 @@
+"""
+Benchmark suite for the transformation engine.
+
+Generates synthetic input/reference/rules files in the shape of the test
+fixtures, runs `process_dataframe` and `apply_rules` for every case and writes
+rows/sec and peak RSS to a JSON file that can be compared between commits.
+
+    python -m benchmarks.engine --out bench.json
+    python -m benchmarks.engine --rows 10000,100000 --rules 5,50 --out bench.json
+    python -m benchmarks.engine --compare old.json new.json
+
+Each case is swept along one dimension while the others keep their default,
+and runs in a forked process so that peak RSS is measured per case.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from app.transformation import TransformationEngine
+from benchmarks.common import compare, print_comparison, run_isolated, write_results
+from benchmarks.synthetic import write_dataset
+
+
+DEFAULTS = {"rows": 20000, "columns": 5, "cardinality": 1000, "missing": 0.1, "rules": 5}
+
+
+def run_process_dataframe(paths):
+    engine = TransformationEngine(paths["rules"])
+    output_path = paths["input"].replace("input.csv", "output.csv")
+    started = time.perf_counter()
+    engine.process_dataframe(paths["input"], paths["reference"], output_path)
+    seconds = time.perf_counter() - started
+    return {"seconds": seconds, "output_bytes": os.path.getsize(output_path)}
+
+
+def run_apply_rules(paths):
+    engine = TransformationEngine(paths["rules"])
+    ref_df = pd.read_csv(paths["reference"])
+    ref_dict1 = ref_df.set_index("refkey1").to_dict(orient="index")
+    rows = pd.read_csv(paths["input"]).to_dict(orient="records")
+    defaults = {"refdata1": "MISSING_refdata1", "refdata2": "MISSING_refdata2",
+                "refdata3": "MISSING_refdata3", "refdata4": 0}
+    pairs = [(row, ref_dict1.get(row["refkey1"], defaults)) for row in rows]
+
+    started = time.perf_counter()
+    for input_row, ref_row in pairs:
+        engine.apply_rules(input_row, ref_row)
+    return {"seconds": time.perf_counter() - started}
+
+
+BENCHMARKS = {
+    "process_dataframe": run_process_dataframe,
+    "apply_rules": run_apply_rules,
+}
+
+
+def build_cases(sweeps):
+    cases = [dict(DEFAULTS)]
+    for dimension, values in sweeps.items():
+        for value in values:
+            case = dict(DEFAULTS, **{dimension: value})
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+
+def run_case(benchmark, params, work_dir, repeat, seed):
+    paths = write_dataset(
+        work_dir,
+        row_count=params["rows"],
+        column_count=params["columns"],
+        key_cardinality=params["cardinality"],
+        missing_key_ratio=params["missing"],
+        rule_count=params["rules"],
+        seed=seed,
+    )
+    samples = [run_isolated(BENCHMARKS[benchmark], paths) for _ in range(repeat)]
+    errors = [s["error"] for s in samples if "error" in s]
+    if errors:
+        return {"benchmark": benchmark, "params": params, "error": errors[0]}
+
+    best = min(samples, key=lambda s: s["seconds"])
+    return {
+        "benchmark": benchmark,
+        "params": params,
+        "rows": params["rows"],
+        "seconds": round(best["seconds"], 4),
+        "rows_per_sec": round(params["rows"] / best["seconds"], 1),
+        "peak_rss_mb": max(s["peak_rss_mb"] for s in samples),
+        "samples": [round(s["seconds"], 4) for s in samples],
+    }
+
+
+def parse_list(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the transformation engine.")
+    parser.add_argument("--out", default="bench_output.json")
+    parser.add_argument("--rows", type=parse_list(int), default=[1000, 100000])
+    parser.add_argument("--columns", type=parse_list(int), default=[20])
+    parser.add_argument("--cardinality", type=parse_list(int), default=[10, 100000])
+    parser.add_argument("--missing", type=parse_list(float), default=[0.0, 0.5])
+    parser.add_argument("--rules", type=parse_list(int), default=[1, 50])
+    parser.add_argument("--benchmarks", type=parse_list(str), default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print_comparison(compare(*args.compare))
+        return 0
+
+    sweeps = {
+        "rows": args.rows,
+        "columns": args.columns,
+        "cardinality": args.cardinality,
+        "missing": args.missing,
+        "rules": args.rules,
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for params in build_cases(sweeps):
+            for benchmark in args.benchmarks:
+                result = run_case(benchmark, params, work_dir, args.repeat, args.seed)
+                results.append(result)
+                if "error" in result:
+                    print(f"{benchmark} {params} failed:\n{result['error']}", file=sys.stderr)
+                else:
+                    print(f"{benchmark:<20} {params} {result['rows_per_sec']:>12.0f} rows/s "
+                          f"{result['peak_rss_mb']:>8.1f} MB")
+
+    write_results(args.out, "engine", results)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""
+End-to-end load generator for the REST API and the Celery pipeline.
+
+Starts a self-contained local stack (Django served by a threaded WSGI server,
+SQLite, an in-memory Celery broker and an in-process worker; see
+benchmarks/settings.py) in a child process, then drives it with concurrent
+virtual users that each log in, upload input/reference files to
+`generate-report/`, poll `download-report/<task_id>/` and download the result.
+
+    python -m benchmarks.load --users 1,8 --file-rows 1000,50000 --out load.json
+    python -m benchmarks.load --celery eager
+    python -m benchmarks.load --url http://0.0.0.0:8000   # existing stack
+
+Latency percentiles are reported per endpoint, plus the end-to-end report
+latency from the start of the upload to the end of the download.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from urllib.parse import urlparse
+
+from benchmarks.common import write_results
+from benchmarks.synthetic import make_rules, write_dataset
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def serve_stack(conn, work_dir: str, workers: int, eager: bool):
+    os.makedirs(work_dir, exist_ok=True)
+    os.environ["BENCHMARK_WORK_DIR"] = work_dir
+    os.environ["BENCHMARK_CELERY_EAGER"] = "1" if eager else "0"
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+
+    try:
+        import django
+        django.setup()
+
+        from django.conf import settings
+        from django.core.management import call_command
+        from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+        from django.core.wsgi import get_wsgi_application
+        from app.celery import app as celery_app
+
+        call_command("migrate", run_syncdb=True, verbosity=0)
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        os.makedirs(settings.RULES_ROOT, exist_ok=True)
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler)
+        server.set_app(get_wsgi_application())
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        if eager:
+            conn.send({"url": url})
+            server.serve_forever()
+        else:
+            from celery.contrib.testing.worker import start_worker
+            with start_worker(celery_app, concurrency=workers, pool="threads", perform_ping_check=False):
+                conn.send({"url": url})
+                server.serve_forever()
+    except Exception as e:
+        conn.send({"error": repr(e)})
+
+
+class LocalStack:
+    def __init__(self, work_dir: str, workers: int, eager: bool):
+        ctx = multiprocessing.get_context("fork")
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(target=serve_stack, args=(child_conn, work_dir, workers, eager), daemon=True)
+        self.process.start()
+        message = parent_conn.recv()
+        if "error" in message:
+            self.process.join()
+            raise RuntimeError(f"Local stack failed to start: {message['error']}")
+        self.url = message["url"]
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+
+class Client:
+    def __init__(self, base_url: str, timeout: float = 600):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.prefix = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method: str, path: str, body: bytes = None, headers: Dict = None):
+        headers = dict(headers or {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read(), response.getheader("Content-Type", "")
+        finally:
+            conn.close()
+
+    def post_json(self, path: str, payload: Dict):
+        return self.request("POST", path, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+
+    def post_files(self, path: str, files: Dict[str, str]):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for field, file_path in files.items():
+            with open(file_path, "rb") as f:
+                content = f.read()
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                f'filename="{os.path.basename(file_path)}"\r\nContent-Type: text/csv\r\n\r\n'.encode()
+                + content + b"\r\n"
+            )
+        body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+        return self.request("POST", path, body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float, ok: bool = True):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(endpoint, []).append(seconds)
+            else:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def timed(self, endpoint: str, fn, *args, ok_statuses=(200,)):
+        started = time.perf_counter()
+        status, body, content_type = fn(*args)
+        self.record(endpoint, time.perf_counter() - started, status in ok_statuses)
+        return status, body, content_type
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(recorder: Recorder, params: Dict, wall_seconds: float) -> List[Dict]:
+    results = []
+    for endpoint in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = sorted(recorder.latencies.get(endpoint, []))
+        summary = {
+            "benchmark": endpoint,
+            "params": params,
+            "count": len(values),
+            "errors": recorder.errors.get(endpoint, 0),
+            "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else None,
+            "max_ms": round(values[-1] * 1000, 2) if values else None,
+            "requests_per_sec": round(len(values) / wall_seconds, 2) if wall_seconds else None,
+        }
+        for q in PERCENTILES:
+            summary[f"p{q}_ms"] = round(percentile(values, q) * 1000, 2)
+        results.append(summary)
+    return results
+
+
+def run_user(base_url: str, user_index: int, run_id: str, dataset: Dict[str, str], args, recorder: Recorder):
+    client = Client(base_url)
+    credentials = {"email": f"load_{run_id}_{user_index}@example.com", "password": "load-test-password"}
+
+    status, _, _ = client.post_json("/api/auth/register/", dict(credentials, name=f"Load User {user_index}"))
+    if status != 201:
+        recorder.record("register", 0, ok=False)
+        return
+
+    status, body, _ = recorder.timed("login", client.post_json, "/api/auth/login/", credentials)
+    if status != 200:
+        return
+    client.token = json.loads(body)["access"]
+
+    for _ in range(args.reports_per_user):
+        started = time.perf_counter()
+        status, body, _ = recorder.timed(
+            "generate-report", client.post_files, "/api/generate-report/",
+            {"input": dataset["input"], "reference": dataset["reference"]}, ok_statuses=(202,),
+        )
+        if status != 202:
+            continue
+        task_id = json.loads(body)["task_id"]
+
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline:
+            poll_started = time.perf_counter()
+            status, body, content_type = client.request("GET", f"/api/download-report/{task_id}/")
+            elapsed = time.perf_counter() - poll_started
+
+            if status == 202:
+                recorder.record("download-report (pending)", elapsed)
+                time.sleep(args.poll_interval)
+                continue
+
+            ok = status == 200 and content_type.startswith("text/csv")
+            recorder.record("download-report (file)", elapsed, ok)
+            if ok:
+                recorder.record("end-to-end report", time.perf_counter() - started)
+            break
+        else:
+            recorder.record("end-to-end report", 0, ok=False)
+
+
+def run_round(base_url: str, users: int, dataset: Dict[str, str], params: Dict, args) -> List[Dict]:
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        futures = [pool.submit(run_user, base_url, i, run_id, dataset, args, recorder) for i in range(users)]
+        for future in futures:
+            future.result()
+    return summarize(recorder, params, time.perf_counter() - started)
+
+
+def upload_rules(base_url: str, rules_path: str):
+    client = Client(base_url)
+    credentials = {"email": f"load_admin_{uuid.uuid4().hex[:8]}@example.com", "password": "load-test-password"}
+    client.post_json("/api/auth/register/", dict(credentials, name="Load Admin"))
+    status, body, _ = client.post_json("/api/auth/login/", credentials)
+    if status != 200:
+        raise RuntimeError(f"Could not log in to {base_url}: {status} {body[:200]!r}")
+    client.token = json.loads(body)["access"]
+    status, body, _ = client.post_files("/api/upload-rules/?type=json", {"file": rules_path})
+    if status != 200:
+        raise RuntimeError(f"Could not upload rules: {status} {body[:200]!r}")
+
+
+def parse_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the report API end to end.")
+    parser.add_argument("--out", default="load_output.json")
+    parser.add_argument("--url", help="Target an already running stack instead of starting a local one.")
+    parser.add_argument("--users", type=parse_list, default=[1, 4])
+    parser.add_argument("--file-rows", type=parse_list, default=[1000, 20000])
+    parser.add_argument("--reports-per-user", type=int, default=3)
+    parser.add_argument("--rules", type=int, default=5)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--workers", type=int, default=2, help="Celery worker threads for the local stack.")
+    parser.add_argument("--celery", choices=["worker", "eager"], default="worker")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="natwest_load_") as work_dir:
+        datasets = {
+            rows: write_dataset(os.path.join(work_dir, "data", str(rows)), row_count=rows, rule_count=args.rules)
+            for rows in args.file_rows
+        }
+        rules_path = os.path.join(work_dir, "rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(make_rules(args.rules), f)
+
+        stack = None if args.url else LocalStack(os.path.join(work_dir, "stack"), args.workers, args.celery == "eager")
+        base_url = args.url or stack.url
+        try:
+            upload_rules(base_url, rules_path)
+            for users in args.users:
+                for rows, dataset in datasets.items():
+                    params = {
+                        "users": users,
+                        "file_rows": rows,
+                        "input_bytes": os.path.getsize(dataset["input"]),
+                        "reports_per_user": args.reports_per_user,
+                        "celery": "external" if args.url else args.celery,
+                    }
+                    round_results = run_round(base_url, users, dataset, params, args)
+                    results.extend(round_results)
+                    for r in round_results:
+                        print(f"users={users:<4} rows={rows:<8} {r['benchmark']:<26} n={r['count']:<5} "
+                              f"err={r['errors']:<3} p50={r['p50_ms']:>9.1f}ms p95={r['p95_ms']:>9.1f}ms "
+                              f"p99={r['p99_ms']:>9.1f}ms")
+        finally:
+            if stack:
+                stack.stop()
+
+    write_results(args.out, "load", results)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
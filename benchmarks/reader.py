@@ -0,0 +1,116 @@
+"""
+Benchmark of the CSV input readers.
+
+Writes a synthetic input of each requested size (a block of rows in the
+shape of the test fixtures, repeated) and measures the parse throughput of
+the sequential reader (`pd.read_csv(chunksize=10000)`) and of the parallel
+byte-range reader in app/csvreader.py for each worker count.
+
+    python -m benchmarks.reader --sizes-mb 1024,10240,51200 --workers 1,4,8 --out reader.json
+    python -m benchmarks.reader --compare before.json after.json
+
+The inputs are written to --work-dir, which needs room for the largest
+size; they are reused between runs of the same size.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from app.csvreader import read_csv_parallel
+from benchmarks.common import compare, print_comparison, run_isolated, write_results
+from benchmarks.synthetic import make_input
+
+
+BLOCK_ROWS = 100000
+
+
+def write_input(path: str, size_bytes: int, columns: int, seed: int = 0):
+    if os.path.exists(path) and os.path.getsize(path) >= size_bytes:
+        return
+    block = make_input(BLOCK_ROWS, columns, seed=seed).to_csv(index=False).encode()
+    header, rows = block.split(b"\n", 1)
+    with open(path, "wb") as f:
+        f.write(header + b"\n")
+        written = len(header) + 1
+        while written < size_bytes:
+            f.write(rows)
+            written += len(rows)
+
+
+def read_sequential(path: str):
+    rows = 0
+    started = time.perf_counter()
+    for chunk in pd.read_csv(path, chunksize=10000):
+        rows += len(chunk)
+    return {"seconds": time.perf_counter() - started, "rows": rows}
+
+
+def read_parallel(path: str, workers: int):
+    rows = 0
+    started = time.perf_counter()
+    for chunk in read_csv_parallel(path, workers=workers):
+        rows += len(chunk)
+    return {"seconds": time.perf_counter() - started, "rows": rows}
+
+
+def parse_list(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CSV input readers.")
+    parser.add_argument("--out", default="reader_output.json")
+    parser.add_argument("--sizes-mb", type=parse_list(int), default=[1024])
+    parser.add_argument("--workers", type=parse_list(int), default=[1, 4, 8])
+    parser.add_argument("--columns", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--work-dir", default=tempfile.gettempdir())
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print_comparison(compare(*args.compare, metric="mb_per_sec"), metric="mb_per_sec")
+        return 0
+
+    results = []
+    for size_mb in args.sizes_mb:
+        path = os.path.join(args.work_dir, f"natwest_reader_{size_mb}mb_{args.columns}c.csv")
+        write_input(path, size_mb * 1024 * 1024, args.columns)
+        size = os.path.getsize(path)
+
+        cases = [("sequential", None, read_sequential, (path,))]
+        cases += [("parallel", workers, read_parallel, (path, workers)) for workers in args.workers]
+        for reader, workers, fn, fn_args in cases:
+            params = {"reader": reader, "workers": workers, "size_mb": size_mb, "columns": args.columns}
+            samples = [run_isolated(fn, *fn_args) for _ in range(args.repeat)]
+            errors = [s["error"] for s in samples if "error" in s]
+            if errors:
+                results.append({"benchmark": "read_input", "params": params, "error": errors[0]})
+                print(f"{reader} {params} failed:\n{errors[0]}", file=sys.stderr)
+                continue
+
+            best = min(samples, key=lambda s: s["seconds"])
+            result = {
+                "benchmark": "read_input",
+                "params": params,
+                "rows": best["rows"],
+                "seconds": round(best["seconds"], 3),
+                "rows_per_sec": round(best["rows"] / best["seconds"], 1),
+                "mb_per_sec": round(size / 1024 / 1024 / best["seconds"], 1),
+                "peak_rss_mb": max(s["peak_rss_mb"] for s in samples),
+            }
+            results.append(result)
+            print(f"{reader:<10} workers={str(workers):<4} {size_mb:>7} MB {result['mb_per_sec']:>9.1f} MB/s "
+                  f"{result['rows_per_sec']:>12.0f} rows/s {result['peak_rss_mb']:>8.1f} MB")
+
+    write_results(args.out, "reader", results)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
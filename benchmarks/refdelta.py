@@ -0,0 +1,118 @@
+"""
+Benchmark of reference delta updates.
+
+Stores a synthetic reference as the base of a versioned reference
+(app/refstore.py), then times applying a delta of upserts and deletes to it
+against storing the whole updated file again, across base and delta sizes.
+Also times loading the new version into the reference dicts against
+loading the updated file, and folding the delta into a new base.
+
+    python -m benchmarks.refdelta --rows 100000,1000000 --delta-rows 1000,10000 --out refdelta.json
+    python -m benchmarks.refdelta --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.files import File
+
+from app.refstore import OPERATION_COLUMN, ReferenceStore
+from app.transformation import TransformationEngine
+from benchmarks.common import compare, print_comparison, write_results
+from benchmarks.synthetic import make_reference, make_rules
+
+
+def make_delta(rows: int, delta_rows: int, seed: int = 1):
+    """Upsert changed rows, add new ones and delete a tenth of the delta's size."""
+    rng = np.random.default_rng(seed)
+    deletes = delta_rows // 10
+    delta = make_reference(rows + delta_rows, seed).iloc[rng.choice(rows + delta_rows, delta_rows, replace=False)]
+    delta = delta.assign(refdata4=rng.integers(0, 1000, size=delta_rows))
+    delta.insert(0, OPERATION_COLUMN, ['delete'] * deletes + ['upsert'] * (delta_rows - deletes))
+    return delta
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def run_case(work_dir: str, engine: TransformationEngine, rows: int, delta_rows: int) -> dict:
+    store = ReferenceStore(os.path.join(work_dir, f"references_{rows}_{delta_rows}"))
+    base_path = os.path.join(work_dir, "base.csv")
+    delta_path = os.path.join(work_dir, "delta.csv")
+    full_path = os.path.join(work_dir, "full.csv")
+    make_reference(rows).to_csv(base_path, index=False)
+    delta = make_delta(rows, delta_rows)
+    delta.to_csv(delta_path, index=False)
+
+    with open(base_path, 'rb') as f:
+        store.create("bench", File(f).chunks())
+    with open(delta_path, 'rb') as f:
+        manifest, apply_seconds = timed(lambda: store.apply_delta("bench", File(f)))
+    version_path = store.version_path("bench", manifest["version"])
+
+    # The updated file a full re-upload would carry.
+    ref_dict1, _ = engine._load_reference(version_path)
+    updated = [{"refkey1": key, **fields} for key, fields in ref_dict1.items()]
+    pd.DataFrame(updated, columns=list(delta.columns[1:])).to_csv(full_path, index=False)
+    with open(full_path, 'rb') as f:
+        _, upload_seconds = timed(lambda: store.create("full", File(f).chunks()))
+
+    _, version_load_seconds = timed(lambda: engine._load_reference(version_path))
+    _, full_load_seconds = timed(lambda: engine._load_reference(full_path))
+    _, compact_seconds = timed(lambda: store.compact("bench", manifest["version"]))
+    return {
+        "apply_ms": round(apply_seconds * 1000, 2),
+        "full_upload_ms": round(upload_seconds * 1000, 2),
+        "version_load_ms": round(version_load_seconds * 1000, 2),
+        "full_load_ms": round(full_load_seconds * 1000, 2),
+        "compact_ms": round(compact_seconds * 1000, 2),
+    }
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark applying reference deltas against full re-uploads.")
+    parser.add_argument("--out", default="refdelta_output.json")
+    parser.add_argument("--rows", type=parse_list, default=[100000, 1000000])
+    parser.add_argument("--delta-rows", type=parse_list, default=[1000, 10000])
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print_comparison(compare(*args.compare, metric="apply_ms"), metric="apply_ms")
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="natwest_refdelta_") as work_dir:
+        rules_path = os.path.join(work_dir, "rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(make_rules(1), f)
+        engine = TransformationEngine(rules_path)
+
+        for rows in args.rows:
+            for delta_rows in args.delta_rows:
+                result = run_case(work_dir, engine, rows, delta_rows)
+                result.update(benchmark="reference_delta", params={"rows": rows, "delta_rows": delta_rows})
+                results.append(result)
+                print(f"rows={rows:<9} delta={delta_rows:<7} apply {result['apply_ms']:>9.1f} ms "
+                      f"full upload {result['full_upload_ms']:>9.1f} ms  load {result['version_load_ms']:>9.1f} ms "
+                      f"(full file {result['full_load_ms']:.1f} ms)  compact {result['compact_ms']:>9.1f} ms")
+
+    write_results(args.out, "refdelta", results)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
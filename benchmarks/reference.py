@@ -0,0 +1,121 @@
+"""
+Memory benchmark of the reference table.
+
+Loads synthetic references with the per-row dicts of
+TransformationEngine._load_reference and with the compact column-wise
+table in app/reference.py, then joins 100,000 input rows to each. Reports
+the resident memory the loaded reference holds, scaled to a million
+reference rows, the peak RSS while loading, and join rows/sec.
+
+    python -m benchmarks.reference --rows 100000,1000000 --out reference.json
+    python -m benchmarks.reference --compare before.json after.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+
+from app.reference import CompactReference
+from app.transformation import TransformationEngine
+from benchmarks.common import compare, print_comparison, run_isolated, write_results
+from benchmarks.synthetic import make_input, make_reference, make_rules
+
+
+JOIN_ROWS = 100000
+CHUNK_ROWS = 10000
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def load_dicts(engine, ref_path, chunks):
+    gc.collect()
+    before = current_rss_mb()
+    ref_dict1, ref_dict2 = engine._load_reference(ref_path)
+    gc.collect()
+    held = current_rss_mb() - before
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        for _, row in chunk.iterrows():
+            engine._reference_row(row.to_dict(), ref_dict1, ref_dict2)
+    return {"held_mb": held, "join_seconds": time.perf_counter() - started}
+
+
+def load_compact(engine, ref_path, chunks):
+    gc.collect()
+    before = current_rss_mb()
+    compact = CompactReference.load(ref_path)
+    gc.collect()
+    held = current_rss_mb() - before
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        for ref_row in compact.join(chunk):
+            engine._complete_reference_row(ref_row)
+    return {"held_mb": held, "join_seconds": time.perf_counter() - started}
+
+
+LOADERS = {"dicts": load_dicts, "compact": load_compact}
+
+
+def parse_list(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the memory held by reference tables.")
+    parser.add_argument("--out", default="reference_output.json")
+    parser.add_argument("--rows", type=parse_list(int), default=[100000, 1000000])
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print_comparison(compare(*args.compare, metric="mb_per_million_rows"), "mb_per_million_rows")
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="natwest_reference_") as work_dir:
+        rules_path = os.path.join(work_dir, "rules.json")
+        with open(rules_path, "w") as f:
+            json.dump(make_rules(1), f)
+        engine = TransformationEngine(rules_path)
+
+        for rows in args.rows:
+            ref_path = os.path.join(work_dir, "reference.csv")
+            make_reference(rows).to_csv(ref_path, index=False)
+            inputs = make_input(JOIN_ROWS, key_cardinality=rows)
+            chunks = [inputs.iloc[i:i + CHUNK_ROWS] for i in range(0, JOIN_ROWS, CHUNK_ROWS)]
+
+            for name, fn in LOADERS.items():
+                params = {"reference": name, "rows": rows}
+                sample = run_isolated(fn, engine, ref_path, chunks)
+                if "error" in sample:
+                    results.append({"benchmark": "reference_memory", "params": params, "error": sample["error"]})
+                    print(f"{name} {params} failed:\n{sample['error']}", file=sys.stderr)
+                    continue
+
+                result = {
+                    "benchmark": "reference_memory",
+                    "params": params,
+                    "held_mb": round(sample["held_mb"], 1),
+                    "mb_per_million_rows": round(sample["held_mb"] * 1000000 / rows, 1),
+                    "peak_rss_mb": round(sample["peak_rss_mb"] - sample["start_rss_mb"], 1),
+                    "join_rows_per_sec": round(JOIN_ROWS / sample["join_seconds"], 1),
+                }
+                results.append(result)
+                print(f"{name:<8} rows={rows:<9} {result['mb_per_million_rows']:>8.1f} MB per 1M rows "
+                      f"peak +{result['peak_rss_mb']:.1f} MB {result['join_rows_per_sec']:>10.0f} joins/s")
+
+    write_results(args.out, "reference", results)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
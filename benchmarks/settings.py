@@ -0,0 +1,35 @@
+"""
+Settings for running the service as a self-contained local stack:
+SQLite instead of Postgres and an in-memory Celery broker/result backend
+instead of Redis. All state lives under BENCHMARK_WORK_DIR.
+"""
+import os
+import tempfile
+
+from natwest.settings import *  # noqa: F401,F403
+
+
+WORK_DIR = os.environ.setdefault("BENCHMARK_WORK_DIR", tempfile.mkdtemp(prefix="natwest_bench_"))
+
+DEBUG = False
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(WORK_DIR, "db.sqlite3"),
+        "OPTIONS": {"timeout": 30},
+    }
+}
+
+MEDIA_ROOT = os.path.join(WORK_DIR, "media")
+RULES_ROOT = os.path.join(WORK_DIR, "configs")
+
+CELERY_BROKER_URL = "memory://"
+CELERY_RESULT_BACKEND = "cache+memory://"
+REPORT_EVENTS_URL = "memory://"
+TOKEN_BLACKLIST_URL = "memory://"
+CELERY_TASK_ALWAYS_EAGER = os.environ.get("BENCHMARK_CELERY_EAGER") == "1"
+CELERY_TASK_STORE_EAGER_RESULT = True
+
+# The in-memory transport polls for messages; keep that well below report latencies.
+CELERY_BROKER_TRANSPORT_OPTIONS = {"polling_interval": 0.05}
@@ -0,0 +1,86 @@
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+BASE_FORMULAS = [
+    "field1 + field2",
+    "refdata1",
+    "refdata2 + refdata3",
+    "field3 * max(field5, refdata4)",
+    "max(field5, refdata4)",
+]
+
+
+def make_rules(rule_count: int, column_count: int = 5) -> List[Dict]:
+    """
+    Build a rule set of `rule_count` rules in the shape of the test fixtures.
+    Rules past the five fixture formulas mix numeric input columns with refdata4.
+    """
+    rules = []
+    numeric_fields = ["field3", "field5"] + [f"field{i}" for i in range(6, column_count + 1)]
+    for i in range(rule_count):
+        if i < len(BASE_FORMULAS):
+            formula = BASE_FORMULAS[i]
+        else:
+            field = numeric_fields[i % len(numeric_fields)]
+            formula = f"round({field} * {i % 7 + 1} + refdata4, 2)"
+        rules.append({"output": f"outfield{i + 1}", "formula": formula})
+    return rules
+
+
+def make_reference(key_cardinality: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    keys = np.arange(key_cardinality)
+    return pd.DataFrame({
+        "refkey1": [f"k1_{k}" for k in keys],
+        "refdata1": [f"D{k % 97}" for k in keys],
+        "refkey2": [f"k2_{k}" for k in keys],
+        "refdata2": [f"E{k % 89}" for k in keys],
+        "refdata3": [f"F{k % 83}" for k in keys],
+        "refdata4": rng.integers(0, 1000, size=key_cardinality),
+    })
+
+
+def make_input(row_count: int, column_count: int = 5, key_cardinality: int = 1000,
+               missing_key_ratio: float = 0.0, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    idx = np.arange(row_count)
+    keys = rng.integers(0, max(key_cardinality, 1), size=row_count)
+    missing = rng.random(row_count) < missing_key_ratio
+
+    data = {
+        "field1": [f"A{i}" for i in idx],
+        "field2": [f"B{i}" for i in idx],
+        "field3": rng.integers(0, 100, size=row_count),
+        "field4": "X",
+        "field5": np.round(rng.random(row_count) * 1000, 2),
+    }
+    for i in range(6, column_count + 1):
+        data[f"field{i}"] = np.round(rng.random(row_count) * 100, 3)
+
+    data["refkey1"] = np.where(missing, "missing1", np.char.add("k1_", keys.astype(str)))
+    data["refkey2"] = np.where(missing, "missing2", np.char.add("k2_", keys.astype(str)))
+    return pd.DataFrame(data)
+
+
+def write_dataset(directory: str, row_count: int, column_count: int = 5, key_cardinality: int = 1000,
+                  missing_key_ratio: float = 0.0, rule_count: int = 5, seed: int = 0) -> Dict[str, str]:
+    """
+    Write input.csv, reference.csv and rules.json into `directory` and return their paths.
+    The same parameters and seed always produce byte-identical files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        "input": os.path.join(directory, "input.csv"),
+        "reference": os.path.join(directory, "reference.csv"),
+        "rules": os.path.join(directory, "rules.json"),
+    }
+    make_input(row_count, column_count, key_cardinality, missing_key_ratio, seed).to_csv(paths["input"], index=False)
+    make_reference(key_cardinality, seed).to_csv(paths["reference"], index=False)
+    with open(paths["rules"], "w") as f:
+        json.dump(make_rules(rule_count, column_count), f)
+    return paths
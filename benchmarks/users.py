@@ -0,0 +1,125 @@
+"""
+Benchmark of user provisioning.
+
+Starts Django in-process with benchmarks/settings.py and registers the same
+number of users once through `POST auth/register/`, one request per user,
+and once through `POST auth/register/bulk/` with the passwords hashed on
+1..N threads. Reports users/sec and database queries per user. The
+password hasher is the configured one, so the per-request path is bound by
+one hash per user on one core.
+
+    python -m benchmarks.users --users 200 --workers 1,4,8 --out users.json
+    python -m benchmarks.users --compare before.json after.json
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from benchmarks.auth import setup_django
+from benchmarks.common import compare, print_comparison, write_results
+
+
+def user_payloads(prefix: str, count: int):
+    return [
+        {"email": f"{prefix}{i}@example.com", "name": f"User {i}", "password": f"bench-password-{i}"}
+        for i in range(count)
+    ]
+
+
+def timed(fn, count: int) -> Dict:
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - started
+    return {
+        "users": count,
+        "seconds": round(seconds, 4),
+        "users_per_sec": round(count / seconds, 1),
+        "queries_per_user": round(len(queries) / count, 2),
+    }
+
+
+def run_per_request(prefix: str, count: int, workers: int) -> Dict:
+    from django.test import Client
+    from django.urls import reverse
+
+    client = Client()
+
+    def register():
+        for payload in user_payloads(prefix, count):
+            response = client.post(reverse("register"), payload, content_type="application/json")
+            if response.status_code != 201:
+                raise RuntimeError(f"register returned {response.status_code}")
+
+    return timed(register, count)
+
+
+def run_bulk(prefix: str, count: int, workers: int) -> Dict:
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    from users import provisioning
+    from users.models import CustomUser
+
+    admin = CustomUser.objects.filter(is_staff=True).first() or CustomUser.objects.create_superuser(
+        email="bench-admin@example.com", password="benchpass123", name="Admin"
+    )
+    client = Client()
+    client.force_login(admin)
+
+    def register():
+        with override_settings(USER_BULK_HASH_WORKERS=workers):
+            response = client.post(reverse("register-bulk"), json.dumps({"users": user_payloads(prefix, count)}),
+                                   content_type="application/json")
+            results = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        if response.status_code != 200 or any(result["status"] != "created" for result in results):
+            raise RuntimeError(f"bulk register returned {response.status_code}")
+
+    provisioning._pool = None
+    try:
+        return timed(register, count)
+    finally:
+        if provisioning._pool is not None:
+            provisioning._pool.shutdown()
+            provisioning._pool = None
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per-request and bulk user registration.")
+    parser.add_argument("--out", default="users_output.json")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", type=parse_list, default=[1, 4, 8])
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print_comparison(compare(*args.compare, metric="users_per_sec"), metric="users_per_sec")
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="natwest_users_") as work_dir:
+        setup_django(work_dir)
+        cases = [("per_request", run_per_request, 1)] + [("bulk", run_bulk, workers) for workers in args.workers]
+        for i, (path, fn, workers) in enumerate(cases):
+            result = fn(f"case{i}-", args.users, workers)
+            result.update(benchmark="user_provisioning", params={"path": path, "workers": workers, "users": args.users})
+            results.append(result)
+            print(f"{path:<12} workers={workers:<3} {result['users_per_sec']:>8.1f} users/s "
+                  f"{result['queries_per_user']:>6.2f} queries/user")
+
+    write_results(args.out, "users", results)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Benchmark of the report output stage.
+
+Writes the same synthetic rule results (ints, floats, strings and the odd
+error message, in 10,000-row chunks) with the previous writer, a list of
+row dicts turned into a DataFrame and appended with `to_csv(mode='a')`,
+and with the columnar writer in app/csvwriter.py, checks that both files
+are byte-identical and reports rows/sec and MB/s.
+
+    python -m benchmarks.writer --rows 100000,1000000 --columns 5,50 --out writer.json
+    python -m benchmarks.writer --compare before.json after.json
+"""
+import argparse
+import filecmp
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from app.csvwriter import ColumnarCSVWriter
+from benchmarks.common import compare, print_comparison, run_isolated, write_results
+
+
+CHUNK_ROWS = 10000
+
+
+def make_values(rows: int, columns: int, seed: int = 0):
+    """Per-column value generators in the shape of rule results."""
+    rng = random.Random(seed)
+    kinds = [("int", "float", "str")[i % 3] for i in range(columns)]
+    values = []
+    for kind in kinds:
+        if kind == "int":
+            values.append([rng.randrange(1000) for _ in range(rows)])
+        elif kind == "float":
+            values.append([round(rng.random() * 1000, 2) for _ in range(rows)])
+        else:
+            values.append([f"D{rng.randrange(97)}" if rng.random() > 0.001 else "ERROR in 'x': bad, value"
+                           for _ in range(rows)])
+    return [f"outfield{i + 1}" for i in range(columns)], values
+
+
+def write_dataframes(path: str, header, values):
+    rows = len(values[0])
+    started = time.perf_counter()
+    for start in range(0, rows, CHUNK_ROWS):
+        output_data = [
+            {name: column[i] for name, column in zip(header, values)}
+            for i in range(start, min(start + CHUNK_ROWS, rows))
+        ]
+        pd.DataFrame(output_data, columns=header).to_csv(path, index=False, mode="a", header=start == 0)
+    return {"seconds": time.perf_counter() - started}
+
+
+def write_columnar(path: str, header, values):
+    rows = len(values[0])
+    started = time.perf_counter()
+    writer = ColumnarCSVWriter(path, header)
+    for start in range(0, rows, CHUNK_ROWS):
+        for i in range(start, min(start + CHUNK_ROWS, rows)):
+            position = writer.reserve()
+            for buffer, column in zip(writer.columns, values):
+                buffer[position] = column[i]
+        writer.flush()
+    writer.close()
+    return {"seconds": time.perf_counter() - started}
+
+
+WRITERS = {"dataframe": write_dataframes, "columnar": write_columnar}
+
+
+def parse_list(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the report output writers.")
+    parser.add_argument("--out", default="writer_output.json")
+    parser.add_argument("--rows", type=parse_list(int), default=[100000, 1000000])
+    parser.add_argument("--columns", type=parse_list(int), default=[5, 50])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print_comparison(compare(*args.compare))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="natwest_writer_") as work_dir:
+        for rows in args.rows:
+            for columns in args.columns:
+                header, values = make_values(rows, columns)
+                paths = {}
+                for name, fn in WRITERS.items():
+                    params = {"writer": name, "rows": rows, "columns": columns}
+                    paths[name] = os.path.join(work_dir, f"{name}.csv")
+                    samples = []
+                    for _ in range(args.repeat):
+                        if os.path.exists(paths[name]):
+                            os.remove(paths[name])
+                        samples.append(run_isolated(fn, paths[name], header, values))
+                    errors = [s["error"] for s in samples if "error" in s]
+                    if errors:
+                        results.append({"benchmark": "write_output", "params": params, "error": errors[0]})
+                        print(f"{name} {params} failed:\n{errors[0]}", file=sys.stderr)
+                        continue
+
+                    best = min(s["seconds"] for s in samples)
+                    size = os.path.getsize(paths[name])
+                    result = {
+                        "benchmark": "write_output",
+                        "params": params,
+                        "seconds": round(best, 4),
+                        "rows_per_sec": round(rows / best, 1),
+                        "mb_per_sec": round(size / 1024 / 1024 / best, 1),
+                        "peak_rss_mb": max(s["peak_rss_mb"] for s in samples),
+                    }
+                    results.append(result)
+                    print(f"{name:<10} rows={rows:<9} columns={columns:<4} {result['rows_per_sec']:>12.0f} rows/s "
+                          f"{result['mb_per_sec']:>8.1f} MB/s")
+
+                if len(paths) == len(WRITERS) and not filecmp.cmp(*paths.values(), shallow=False):
+                    print(f"rows={rows} columns={columns}: outputs differ", file=sys.stderr)
+                    return 1
+
+    write_results(args.out, "writer", results)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
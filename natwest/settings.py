@@ -19,6 +19,7 @@ load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 from datetime import timedelta
+from kombu import Queue
 
 
 # Quick-start development settings - unsuitable for production
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,9 +89,8 @@ WSGI_APPLICATION = 'natwest.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication', 
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.SessionAuthentication', 
+        'users.authentication.CachedJWTAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -172,6 +173,76 @@ STATIC_ROOT = BASE_DIR / "staticfiles_build" / "static"
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+RULES_ROOT = os.path.join(BASE_DIR, 'app', 'transformation', 'configs')
+
+# Versioned references, changed by uploaded deltas (app.refstore). A version is
+# compacted into a new base in the background once it carries
+# REFERENCE_COMPACT_DELTAS deltas or deltas of REFERENCE_COMPACT_RATIO of its base's size.
+REFERENCES_ROOT = os.path.join(BASE_DIR, 'app', 'transformation', 'references')
+REFERENCE_COMPACT_DELTAS = 8
+REFERENCE_COMPACT_RATIO = 0.25
+
+DRY_RUN_DEFAULT_ROWS = 1000
+DRY_RUN_MAX_ROWS = 100000
+
+BATCH_MAX_REPORTS = 20
+
+REPORTS_PAGE_SIZE = 50
+REPORTS_MAX_PAGE_SIZE = 500
+REPORTS_MAX_STATUS_IDS = 500
+
+# Rows served per page by the indexed report query endpoint.
+REPORT_ROWS_PAGE_SIZE = 100
+REPORT_ROWS_MAX_PAGE_SIZE = 1000
+REPORT_MAX_INDEX_COLUMNS = 8
+
+# Pending or running runs older than this are treated as lost.
+REPORT_RUN_TIMEOUT = 24 * 3600
+
+# Admission control and queue routing of report tasks. Cost is estimated
+# input rows x rules; REPORT_COST_PER_SECOND is the throughput of one worker.
+REPORT_SMALL_QUEUE = 'reports_small'
+REPORT_LARGE_QUEUE = 'reports_large'
+REPORT_LARGE_INPUT_BYTES = 1024 ** 3
+REPORT_LARGE_COST = 50_000_000
+REPORT_COST_PER_SECOND = 50_000
+REPORT_MAX_BACKLOG_COST = 2_000_000_000
+REPORT_MAX_ACTIVE_PER_USER = 4
+
+# Worker processes per report queue (see docker-compose.yml). When they are
+# all busy, a new task preempts a resumable running report whose priority is
+# at least REPORT_PREEMPT_PRIORITY_GAP levels lower.
+REPORT_QUEUE_CONCURRENCY = {REPORT_SMALL_QUEUE: 4, REPORT_LARGE_QUEUE: 1}
+REPORT_PREEMPT_PRIORITY_GAP = 3
+
+# Scheduled reports on the same input and reference that fall due within this
+# many seconds of the first are run as one batch of up to BATCH_MAX_REPORTS
+# by app.scheduling.CoalescingScheduler; 0 sends each on its own.
+REPORT_SCHEDULE_COALESCE_SECONDS = 5
+
+# Inputs of at least REPORT_PARALLEL_READ_MIN_BYTES are parsed in byte ranges
+# by REPORT_READ_WORKERS threads (app.csvreader); 1 worker reads serially.
+REPORT_READ_WORKERS = int(os.environ.get('REPORT_READ_WORKERS', min(os.cpu_count() or 1, 8)))
+REPORT_PARALLEL_READ_MIN_BYTES = int(os.environ.get('REPORT_PARALLEL_READ_MIN_BYTES', 256 * 1024 * 1024))
+# References of at least this size are held in compact form (app.reference).
+REPORT_COMPACT_REFERENCE_MIN_BYTES = int(os.environ.get('REPORT_COMPACT_REFERENCE_MIN_BYTES', 64 * 1024 * 1024))
+# Report diffs (app.diff) hold about this much of the old report's CSV in memory at once.
+REPORT_DIFF_PARTITION_BYTES = int(os.environ.get('REPORT_DIFF_PARTITION_BYTES', 32 * 1024 * 1024))
+# Request tracing (app.tracing): spans are appended to REPORT_TRACE_PATH as
+# OTLP/JSON for the sampled share of traces; tracing is off while it is empty.
+REPORT_TRACE_PATH = os.environ.get('REPORT_TRACE_PATH', '')
+REPORT_TRACE_SAMPLE_RATE = float(os.environ.get('REPORT_TRACE_SAMPLE_RATE', 0.01))
+REPORT_TRACE_SERVICE = os.environ.get('REPORT_TRACE_SERVICE', 'report-service')
+
+# Retention of MEDIA_ROOT artifacts, enforced by app.utils.evict_storage_task.
+STORAGE_QUOTA_BYTES = int(os.environ.get('STORAGE_QUOTA_BYTES', 10 * 1024 ** 3))
+STORAGE_OUTPUT_TTL = 7 * 24 * 3600
+STORAGE_INPUT_TTL = 24 * 3600
+STORAGE_ORPHAN_TTL = 24 * 3600
+STORAGE_RULES_TTL = 30 * 24 * 3600
+STORAGE_GRACE_SECONDS = 15 * 60
+STORAGE_EVICTION_INTERVAL = 15 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -179,5 +250,37 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CELERY_BROKER_URL = 'redis://redis_natwest:6379/0'
 CELERY_RESULT_BACKEND = 'redis://redis_natwest:6379/0'
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_QUEUES = (
+    Queue('celery'),
+    Queue(REPORT_SMALL_QUEUE),
+    Queue(REPORT_LARGE_QUEUE),
+)
+# A worker consuming several queues drains them in the order above, and
+# messages within a queue are ordered by their 0 (first) to 9 priority.
+CELERY_BROKER_TRANSPORT_OPTIONS = {'queue_order_strategy': 'priority', 'priority_steps': list(range(10))}
+
+# Pub/sub channel for report progress events ('memory://' keeps them in-process).
+REPORT_EVENTS_URL = os.environ.get('REPORT_EVENTS_URL', CELERY_BROKER_URL)
+
+# Blacklisted JWT ids, looked up on every authenticated request ('memory://' keeps them in-process).
+TOKEN_BLACKLIST_URL = os.environ.get('TOKEN_BLACKLIST_URL', CELERY_BROKER_URL)
+# Authenticated users are cached per process for this long after a database load.
+AUTH_USER_CACHE_SECONDS = 30
+AUTH_USER_CACHE_SIZE = 10000
+# Bulk registration (auth/register/bulk/): users per request, per validation
+# and INSERT batch, and password hashing threads.
+USER_BULK_MAX_USERS = 10000
+USER_BULK_BATCH_SIZE = 500
+USER_BULK_HASH_WORKERS = int(os.environ.get('USER_BULK_HASH_WORKERS', os.cpu_count() or 1))
+REPORT_WAIT_MAX_SECONDS = 60
+REPORT_EVENTS_MAX_SECONDS = 300
+REPORT_EVENTS_HEARTBEAT_SECONDS = 15
+CELERY_BEAT_SCHEDULE = {
+    'evict-storage': {
+        'task': 'app.utils.evict_storage_task',
+        'schedule': STORAGE_EVICTION_INTERVAL,
+    },
+}
 
 AUTH_USER_MODEL = "users.CustomUser"
\ No newline at end of file
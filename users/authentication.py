@@ -0,0 +1,108 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import blacklist as token_blacklist
+from .models import CustomUser
+
+
+class UserCache:
+    """
+    Process-local LRU cache of users by id, with entries expiring after
+    AUTH_USER_CACHE_SECONDS. Saving or deleting a user drops its entry in
+    this process; other processes pick the change up when the entry expires.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+        # Each request gets its own copy, so changes to it stay in that request.
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (copy.copy(user), time.monotonic() + settings.AUTH_USER_CACHE_SECONDS)
+            self._users.move_to_end(user_id)
+            while len(self._users) > settings.AUTH_USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(str(instance.pk))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that serves the user from `user_cache` instead of
+    loading it on every request, and rejects access tokens revoked at logout
+    through the token blacklist store, or the database while the store is down.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        jti = token[api_settings.JTI_CLAIM]
+        blacklisted = token_blacklist.is_blacklisted(jti)
+        if blacklisted is None:
+            # The blacklist store is unreachable: check the database rather than let a revoked token through.
+            blacklisted = token_blacklist.access_revoked(jti)
+        if blacklisted:
+            raise InvalidToken(_("Token is blacklisted"))
+        return token
+
+    def get_user(self, validated_token):
+        user_id = str(validated_token.get(api_settings.USER_ID_CLAIM, ''))
+        user = user_cache.get(user_id) if user_id else None
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        return user
+
+
+class CachedRefreshToken(RefreshToken):
+    """Refresh token checked against the token blacklist store, falling back to the database."""
+
+    def check_blacklist(self):
+        blacklisted = token_blacklist.is_blacklisted(self.payload[api_settings.JTI_CLAIM])
+        if blacklisted is None:
+            super().check_blacklist()
+        elif blacklisted:
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        token_blacklist.add(self.payload[api_settings.JTI_CLAIM], self.payload["exp"])
+        return result
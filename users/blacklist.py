@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Optional
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'token-blacklist:'
+LOADED_KEY = KEY_PREFIX + 'loaded'
+RETRY_SECONDS = 30
+
+
+class MemoryBlacklistBackend:
+    """Blacklisted token ids kept in this process (tests and single-process stacks)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._expiries = {}
+        self._loaded = False
+
+    def lookup(self, jti: str) -> Optional[bool]:
+        with self._lock:
+            if not self._loaded:
+                return None
+            expires_at = self._expiries.get(jti)
+            if expires_at is not None and expires_at <= time.time():
+                del self._expiries[jti]
+                expires_at = None
+            return expires_at is not None
+
+    def add(self, expiries: Dict[str, int]):
+        with self._lock:
+            self._expiries.update(expiries)
+
+    def mark_loaded(self):
+        with self._lock:
+            self._loaded = True
+
+
+class RedisBlacklistBackend:
+    """
+    One Redis key per blacklisted token id, expiring with the token, so the
+    set never outgrows the tokens that are still valid. A lookup is a single
+    round trip. While Redis is unreachable, lookups fail fast for
+    RETRY_SECONDS and callers fall back to the database; entries missed in
+    the meantime are recovered by reloading the set from the database.
+    """
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=1)
+        self._down_until = 0
+        self._missed_entries = False
+
+    def _check_up(self):
+        if time.monotonic() < self._down_until:
+            raise redis.ConnectionError("Token blacklist is unavailable.")
+
+    def _mark_down(self):
+        self._down_until = time.monotonic() + RETRY_SECONDS
+
+    def lookup(self, jti: str) -> Optional[bool]:
+        self._check_up()
+        try:
+            if self._missed_entries:
+                self.client.delete(LOADED_KEY)
+                self._missed_entries = False
+            loaded, present = self.client.pipeline().exists(LOADED_KEY).exists(KEY_PREFIX + jti).execute()
+        except redis.RedisError:
+            self._mark_down()
+            raise
+        return bool(present) if loaded else None
+
+    def add(self, expiries: Dict[str, int]):
+        if time.monotonic() < self._down_until:
+            self._missed_entries = True
+        self._check_up()
+        now = int(time.time())
+        pipeline = self.client.pipeline()
+        for jti, expires_at in expiries.items():
+            if expires_at > now:
+                pipeline.set(KEY_PREFIX + jti, 1, exat=expires_at)
+        try:
+            pipeline.execute()
+        except redis.RedisError:
+            self._missed_entries = True
+            self._mark_down()
+            raise
+
+    def mark_loaded(self):
+        self._check_up()
+        self.client.set(LOADED_KEY, 1)
+
+
+_backends = {}
+
+
+def get_backend():
+    url = settings.TOKEN_BLACKLIST_URL
+    if url not in _backends:
+        if url.startswith('memory://'):
+            _backends[url] = MemoryBlacklistBackend()
+        else:
+            _backends[url] = RedisBlacklistBackend(url)
+    return _backends[url]
+
+
+def _load(backend):
+    """
+    Copy the unexpired entries of the token_blacklist tables (refresh tokens)
+    and of RevokedAccessToken (access tokens) into an empty backend.
+    """
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+    from .models import RevokedAccessToken
+
+    now = timezone.now()
+    rows = list(BlacklistedToken.objects.filter(token__expires_at__gt=now).values_list(
+        'token__jti', 'token__expires_at'
+    ))
+    rows += RevokedAccessToken.objects.filter(expires_at__gt=now).values_list('jti', 'expires_at')
+    backend.add({jti: int(expires_at.timestamp()) for jti, expires_at in rows})
+    backend.mark_loaded()
+
+
+def is_blacklisted(jti: str) -> Optional[bool]:
+    """Whether the token id is blacklisted, or None if the blacklist cannot be reached."""
+    backend = get_backend()
+    try:
+        blacklisted = backend.lookup(jti)
+        if blacklisted is None:
+            _load(backend)
+            blacklisted = backend.lookup(jti)
+        return blacklisted
+    except redis.RedisError as e:
+        logger.warning("Token blacklist lookup failed: %s", e)
+        return None
+
+
+def access_revoked(jti: str) -> bool:
+    """Whether an access token was revoked, from the database; used when the blacklist cannot be reached."""
+    from .models import RevokedAccessToken
+
+    return RevokedAccessToken.objects.filter(jti=jti, expires_at__gt=timezone.now()).exists()
+
+
+def revoke_access(jti: str, expires_at: int):
+    """
+    Revoke an access token until `expires_at`. The database keeps it, so it
+    stays revoked when the blacklist is flushed, restarted or unreachable.
+    """
+    from .models import RevokedAccessToken
+
+    now = timezone.now()
+    # Rows of tokens that expired on their own are no longer needed.
+    RevokedAccessToken.objects.filter(expires_at__lte=now).delete()
+    RevokedAccessToken.objects.get_or_create(
+        jti=jti, defaults={"expires_at": datetime.fromtimestamp(expires_at, tz=dt_timezone.utc)}
+    )
+    add(jti, expires_at)
+
+
+def add(jti: str, expires_at: int):
+    try:
+        get_backend().add({jti: expires_at})
+    except redis.RedisError as e:
+        # The token_blacklist tables still have it; they are reloaded into an empty backend.
+        logger.warning("Could not add token %s to the blacklist: %s", jti, e)
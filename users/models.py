@@ -41,3 +41,9 @@ class CustomUser(AbstractUser):
     REQUIRED_FIELDS = ["name"]
 
     objects = CustomUserManager()
+
+
+class RevokedAccessToken(models.Model):
+    """An access token revoked at logout, kept until it would have expired anyway."""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
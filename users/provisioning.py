@@ -0,0 +1,144 @@
+"""
+Bulk user registration. Each batch is validated with one query for the
+emails already taken, its passwords are hashed on a thread pool, and its
+users and outstanding refresh tokens are inserted with bulk_create, instead
+of one request, one hash and one INSERT per user.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import CustomUser
+from .serializers import BulkUserSerializer
+
+
+EMAIL_TAKEN = "A user with this email already exists."
+EMAIL_REPEATED = "This email appears earlier in the batch."
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _hash_pool() -> Optional[ThreadPoolExecutor]:
+    global _pool
+    if settings.USER_BULK_HASH_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Not a fork pool: forking a threaded web process can deadlock. hashlib's PBKDF2, argon2
+            # and bcrypt release the GIL while hashing, so the threads still use every core.
+            _pool = ThreadPoolExecutor(settings.USER_BULK_HASH_WORKERS, thread_name_prefix='password-hash')
+        return _pool
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """make_password for each of `passwords`, spread over USER_BULK_HASH_WORKERS threads."""
+    pool = _hash_pool()
+    if pool is None or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    return list(pool.map(make_password, passwords))
+
+
+def refresh_tokens(users: List[CustomUser]) -> List[RefreshToken]:
+    """Refresh tokens for `users`, recorded as outstanding in one INSERT instead of one per token."""
+    # BlacklistMixin.for_user would insert each token's OutstandingToken on its own.
+    tokens = [super(BlacklistMixin, RefreshToken).for_user(user) for user in users]
+    OutstandingToken.objects.bulk_create([
+        OutstandingToken(
+            user=user, jti=token[api_settings.JTI_CLAIM], token=str(token), created_at=token.current_time,
+            expires_at=datetime_from_epoch(token["exp"]),
+        )
+        for user, token in zip(users, tokens)
+    ])
+    return tokens
+
+
+def _validate(batch: List, seen: set) -> List[Dict]:
+    """Validate the users of a batch: their fields, then their emails against the batch and the database."""
+    results = []
+    for item in batch:
+        if not isinstance(item, dict):
+            results.append({"errors": {"non_field_errors": ["Each user must be an object."]}})
+            continue
+        serializer = BulkUserSerializer(data=item)
+        if serializer.is_valid():
+            results.append({"email": serializer.validated_data["email"], "data": serializer.validated_data})
+        else:
+            results.append({"email": item.get("email"), "errors": serializer.errors})
+
+    emails = [result["email"] for result in results if "data" in result]
+    taken = set(CustomUser.objects.filter(email__in=emails).values_list('email', flat=True))
+    for result in results:
+        if "data" not in result:
+            continue
+        if result["email"] in seen:
+            result["errors"] = {"email": [EMAIL_REPEATED]}
+        elif result["email"] in taken:
+            result["errors"] = {"email": [EMAIL_TAKEN]}
+        else:
+            seen.add(result["email"])
+            continue
+        del result["data"]
+    return results
+
+
+def _insert(users: List[CustomUser]) -> List[CustomUser]:
+    """Insert `users`, leaving out those whose email was registered since the batch was validated."""
+    try:
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users)
+            return users
+    except IntegrityError:
+        taken = set(CustomUser.objects.filter(email__in=[user.email for user in users]).values_list('email', flat=True))
+        users = [user for user in users if user.email not in taken]
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users)
+        return users
+
+
+def provision_users(items: Iterable) -> Iterator[Dict]:
+    """
+    Register the users described by `items`, USER_BULK_BATCH_SIZE at a time,
+    and yield one result per item, in order: the created user with its JWT
+    pair, or the validation errors that kept it from being created.
+    """
+    items = list(items)
+    seen = set()
+    batch_size = settings.USER_BULK_BATCH_SIZE
+    for start in range(0, len(items), batch_size):
+        results = _validate(items[start:start + batch_size], seen)
+        valid = [result for result in results if "data" in result]
+        hashes = hash_passwords([result["data"]["password"] for result in valid])
+        users = [
+            CustomUser(
+                email=result["data"]["email"], name=result["data"]["name"],
+                phone_number=result["data"].get("phone_number"), password=password,
+            )
+            for result, password in zip(valid, hashes)
+        ]
+        created = {user.email: user for user in _insert(users)}
+        tokens = dict(zip(created, refresh_tokens(list(created.values()))))
+
+        for index, result in enumerate(results, start):
+            data = result.pop("data", None)
+            if data is not None and result["email"] not in created:
+                result["errors"] = {"email": [EMAIL_TAKEN]}
+            if "errors" in result:
+                yield {"index": index, "status": "error", **result}
+                continue
+            user, refresh = created[result["email"]], tokens[result["email"]]
+            yield {
+                "index": index,
+                "status": "created",
+                "user": {"id": str(user.id), "email": user.email, "name": user.name, "phone_number": user.phone_number},
+                "access": str(refresh.access_token),
+                "refresh": str(refresh),
+            }
@@ -17,3 +17,10 @@ class CustomUserSerializer(serializers.ModelSerializer):
         user.set_password(validated_data['password'])
         user.save()
         return user
+
+
+class BulkUserSerializer(CustomUserSerializer):
+    """One user of a bulk registration; email uniqueness is checked for the whole batch in one query."""
+
+    class Meta(CustomUserSerializer.Meta):
+        extra_kwargs = {'password': {'write_only': True}, 'email': {'validators': []}}
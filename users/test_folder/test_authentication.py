@@ -0,0 +1,107 @@
+from unittest.mock import patch
+
+import redis
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users import blacklist
+from users.authentication import CachedJWTAuthentication, CachedRefreshToken, user_cache
+
+User = get_user_model()
+
+
+@override_settings(TOKEN_BLACKLIST_URL="memory://")
+class CachedJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(email="cached@example.com", password="testpass123", name="Cached")
+        self.access = str(RefreshToken.for_user(self.user).access_token)
+
+    def authenticate(self):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        return CachedJWTAuthentication().authenticate(request)
+
+    def test_user_is_loaded_once(self):
+        self.assertEqual(self.authenticate()[0], self.user)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertEqual(user.email, "cached@example.com")
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=0)
+    def test_entries_expire(self):
+        self.authenticate()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+
+@override_settings(TOKEN_BLACKLIST_URL="memory://")
+class TokenBlacklistTest(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(email="blacklist@example.com", password="testpass123", name="Blacklist")
+        self.refresh = RefreshToken.for_user(self.user)
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        access = str(self.refresh.access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = self.client.post(reverse("logout"), {"refresh": str(self.refresh)}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.client.get(reverse("report-runs")).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        response = self.client.get(reverse("get-access-token"), {"refresh": str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_check_does_not_query_the_database(self):
+        CachedRefreshToken(str(self.refresh))
+        with self.assertNumQueries(0):
+            CachedRefreshToken(str(self.refresh))
+
+    def test_backend_is_loaded_from_the_database(self):
+        RefreshToken(str(self.refresh)).blacklist()
+        backend = blacklist.MemoryBlacklistBackend()
+
+        with patch("users.blacklist.get_backend", return_value=backend):
+            self.assertTrue(blacklist.is_blacklisted(self.refresh["jti"]))
+            self.assertFalse(blacklist.is_blacklisted("other"))
+
+    def test_database_is_used_when_the_store_is_down(self):
+        RefreshToken(str(self.refresh)).blacklist()
+
+        with patch("users.blacklist.get_backend") as get_backend:
+            get_backend.return_value.lookup.side_effect = redis.ConnectionError("down")
+            self.assertIsNone(blacklist.is_blacklisted(self.refresh["jti"]))
+            with self.assertRaises(TokenError):
+                CachedRefreshToken(str(self.refresh))
+
+    def test_revoked_access_tokens_survive_a_store_reset_or_outage(self):
+        access = str(self.refresh.access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.client.post(reverse("logout"), {"refresh": str(self.refresh)}, format="json")
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+
+        # An emptied store, as after a Redis flush or restart, is reloaded from the database.
+        with patch("users.blacklist.get_backend", return_value=blacklist.MemoryBlacklistBackend()):
+            with self.assertRaises(AuthenticationFailed):
+                CachedJWTAuthentication().authenticate(request)
+        with patch("users.blacklist.get_backend") as get_backend:
+            get_backend.return_value.lookup.side_effect = redis.ConnectionError("down")
+            with self.assertRaises(AuthenticationFailed):
+                CachedJWTAuthentication().authenticate(request)
+            other = str(RefreshToken.for_user(self.user).access_token)
+            request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {other}")
+            self.assertEqual(CachedJWTAuthentication().authenticate(request)[0], self.user)
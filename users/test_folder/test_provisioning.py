@@ -0,0 +1,88 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.provisioning import EMAIL_REPEATED, EMAIL_TAKEN, hash_passwords, provision_users
+
+User = get_user_model()
+
+
+@override_settings(USER_BULK_BATCH_SIZE=2, USER_BULK_HASH_WORKERS=2)
+class ProvisionUsersTest(TestCase):
+    def test_users_are_created_with_tokens(self):
+        User.objects.create_user(email="taken@example.com", password="testpass123", name="Taken")
+        results = list(provision_users([
+            {"email": "a@example.com", "name": "A", "password": "passwordA1"},
+            {"email": "taken@example.com", "name": "Again", "password": "passwordB1"},
+            {"email": "b@example.com", "name": "B", "password": "passwordB1", "phone_number": "123"},
+            {"email": "a@example.com", "name": "A twice", "password": "passwordA2"},
+            {"email": "not-an-email", "name": "C", "password": "passwordC1"},
+            "c@example.com",
+        ]))
+
+        self.assertEqual([result["index"] for result in results], list(range(6)))
+        self.assertEqual([result["status"] for result in results],
+                         ["created", "error", "created", "error", "error", "error"])
+        self.assertEqual(results[1]["errors"], {"email": [EMAIL_TAKEN]})
+        self.assertEqual(results[3]["errors"], {"email": [EMAIL_REPEATED]})
+        self.assertIn("email", results[4]["errors"])
+
+        user = User.objects.get(email="b@example.com")
+        self.assertTrue(user.check_password("passwordB1"))
+        self.assertEqual((user.name, user.phone_number), ("B", "123"))
+        self.assertEqual(results[2]["user"]["id"], str(user.id))
+        refresh = RefreshToken(results[2]["refresh"])
+        self.assertEqual(refresh["user_id"], str(user.id))
+        self.assertTrue(OutstandingToken.objects.filter(jti=refresh["jti"], user=user).exists())
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_passwords_are_hashed_in_order(self):
+        passwords = [f"password{i}" for i in range(5)]
+        hashed = hash_passwords(passwords)
+        user = User(email="x@example.com")
+        for password, encoded in zip(passwords, hashed):
+            user.password = encoded
+            self.assertTrue(user.check_password(password))
+
+
+@override_settings(USER_BULK_HASH_WORKERS=1)
+class BulkRegisterUsersViewTest(APITestCase):
+    def setUp(self):
+        self.url = reverse("register-bulk")
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="adminpass123", name="Admin")
+
+    def test_admin_registers_users(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(self.url, {"users": [
+            {"email": "one@example.com", "name": "One", "password": "password1"},
+            {"email": "two@example.com", "name": "Two"},
+        ]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        results = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([result["status"] for result in results], ["created", "error"])
+        self.assertIn("password", results[1]["errors"])
+
+        login = self.client.post(reverse("login"), {"email": "one@example.com", "password": "password1"},
+                                 format="json")
+        self.assertEqual(login.status_code, status.HTTP_200_OK)
+
+    def test_only_admins_and_valid_batches(self):
+        user = User.objects.create_user(email="user@example.com", password="userpass123", name="User")
+        self.client.force_authenticate(user=user)
+        response = self.client.post(self.url, {"users": [{"email": "x@example.com"}]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.post(self.url, {"users": []}, format="json").status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        with override_settings(USER_BULK_MAX_USERS=1):
+            response = self.client.post(self.url, [{"email": "x@example.com"}] * 2, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
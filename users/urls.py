@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import RegisterUserView, LoginUserView, LogoutUserView, GetAccessTokenView
+from .views import RegisterUserView, BulkRegisterUsersView, LoginUserView, LogoutUserView, GetAccessTokenView
 
 urlpatterns = [
     path('register/',RegisterUserView.as_view(), name='register'),
+    path('register/bulk/', BulkRegisterUsersView.as_view(), name='register-bulk'),
     path('get-access-token/', GetAccessTokenView.as_view(), name='get-access-token'), 
     path('login/', LoginUserView.as_view(), name='login'),
     path('logout/', LogoutUserView.as_view(), name='logout')
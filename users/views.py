@@ -2,12 +2,20 @@ from django.shortcuts import render
 
 # Create your views here.
 
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.contrib.auth import authenticate
+from rest_framework_simplejwt.settings import api_settings
+from . import blacklist as token_blacklist
+from .authentication import CachedRefreshToken
+from .provisioning import provision_users
 from .serializers import CustomUserSerializer
 
 
@@ -36,6 +44,25 @@ class RegisterUserView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BulkRegisterUsersView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        """
+        Register a batch of users and stream back one JSON line per user, in
+        order: the created user with its JWT pair, or its validation errors.
+        """
+        users = request.data.get("users") if isinstance(request.data, dict) else request.data
+        if not isinstance(users, list) or not users:
+            return Response({"error": "users must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(users) > settings.USER_BULK_MAX_USERS:
+            return Response({"error": f"At most {settings.USER_BULK_MAX_USERS} users can be registered at once."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        lines = (json.dumps(result) + "\n" for result in provision_users(users))
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+
 class LoginUserView(APIView):
     permission_classes = [AllowAny]
 
@@ -72,8 +99,11 @@ class LogoutUserView(APIView):
         try:
             refresh_token = request.data.get("refresh")
             if refresh_token:
-                token = RefreshToken(refresh_token)
+                token = CachedRefreshToken(refresh_token)
                 token.blacklist()
+            if request.auth is not None:
+                # The access token of this request stops working now instead of when it expires.
+                token_blacklist.revoke_access(request.auth[api_settings.JTI_CLAIM], request.auth["exp"])
             return Response({"message": "Successfully logged out."}, status=200)
         except Exception as e:
             return Response({"error": str(e)}, status=400)  # 👈 missing this
@@ -95,7 +125,7 @@ class GetAccessTokenView(APIView):
             return Response({'error': 'Refresh token is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            refresh = RefreshToken(refresh_token)
+            refresh = CachedRefreshToken(refresh_token)
             access_token = str(refresh.access_token)
             return Response({'access': access_token}, status=status.HTTP_200_OK)
         except TokenError as e: